@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+# BSD 2-Clause License
+#
+# Copyright (c) 2023, nguyenvannam142@gmail.com
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+# Benchmark of config_tool.py and of the generated C code.
+#
+# For each synthetic schema and each generation mode: time the schema parsing
+# and the generation of the .h, .c and .conf files, measure the peak memory of
+# the generation, then compile the generated code with main.c and time
+# <name>_read() and <name>_write() on a .conf file with all the keys set.
+# The results are printed as JSON, see --help.
+
+import sys
+import os
+import getopt
+import json
+import time
+import platform
+import subprocess
+import resource
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import config_tool
+
+BENCH_NAME = "bench_config"
+
+# (name, structs, depth, array size, members per struct)
+DEFAULT_CASES = [
+    ("small", 10, 1, 1, 8),
+    ("many_structs", 500, 1, 1, 8),
+    ("deep", 4, 6, 2, 4),
+    ("big_arrays", 2, 2, 256, 8),
+]
+
+# generation mode => ConfigParser options
+MODES = {
+    "default": {},
+    "loop": {'loop': True},
+    "table": {'table': True},
+    "mmap": {'mmap': True},
+    "stream": {'stream': True},
+    "dynamic": {'dynamic': True},
+}
+
+# metrics compared with --baseline, lower is better
+COMPARED_METRICS = ("parse_s", "generate_s", "read_s", "write_s")
+
+def usage():
+    print("bench.py [options]")
+    print("-h|--help: Show help")
+    print("-c|--case name,structs,depth,array,members: synthetic schema, repeat for")
+    print("           several cases, default: %s"
+          %" ".join(",".join(str(x) for x in case) for case in DEFAULT_CASES))
+    print("-m|--modes mode,...: generation modes, %s, joined with +"
+          %", ".join(MODES))
+    print("           for several options, e.g. mmap+dynamic, default: default,loop,table")
+    print("-r|--repeat n: runs of the generation, the best one is kept, default: 3")
+    print("-n|--iterations n: calls of <name>_read() and <name>_write(), default: 100")
+    print("-w|--workdir dir: directory of the generated files, default: out")
+    print("-o|--output file: JSON output file, default: stdout")
+    print("-b|--baseline file: JSON output of a previous run, the exit code is 1 if")
+    print("           a metric of a case is slower than the baseline by --threshold")
+    print("-t|--threshold ratio: default: 1.2")
+    print("-s|--stack kb: stack limit of the generated C code runs, to check that the")
+    print("           readers do not keep schema sized buffers on the stack, default: no limit")
+    print("--no-c: do not compile and run the generated C code")
+    print("Environment: CC (default: gcc) and CFLAGS (default: -O2)")
+
+def set_options():
+    res = {'cases': [], 'modes': ["default", "loop", "table"], 'repeat': 3,
+           'iterations': 100, 'workdir': "out", 'output': None, 'baseline': None,
+           'threshold': 1.2, 'stack': None, 'c': True}
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hc:m:r:n:w:o:b:t:s:",
+                                   ["help", "case=", "modes=", "repeat=", "iterations=",
+                                    "workdir=", "output=", "baseline=", "threshold=",
+                                    "stack=", "no-c"])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(1)
+    try:
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                usage()
+                sys.exit(0)
+            elif opt in ("-c", "--case"):
+                fields = arg.split(",")
+                if len(fields) != 5:
+                    raise ValueError("case %s: expected name,structs,depth,array,members" %arg)
+                res['cases'].append((fields[0],) + tuple(int(x) for x in fields[1:]))
+            elif opt in ("-m", "--modes"):
+                res['modes'] = arg.split(",")
+                for mode in res['modes']:
+                    for name in mode.split("+"):
+                        if name not in MODES:
+                            raise ValueError("unknown mode %s" %name)
+            elif opt in ("-r", "--repeat"):
+                res['repeat'] = int(arg)
+            elif opt in ("-n", "--iterations"):
+                res['iterations'] = int(arg)
+            elif opt in ("-w", "--workdir"):
+                res['workdir'] = arg
+            elif opt in ("-o", "--output"):
+                res['output'] = arg
+            elif opt in ("-b", "--baseline"):
+                res['baseline'] = arg
+            elif opt in ("-t", "--threshold"):
+                res['threshold'] = float(arg)
+            elif opt in ("-s", "--stack"):
+                res['stack'] = int(arg)
+            elif opt == "--no-c":
+                res['c'] = False
+    except ValueError as err:
+        print(err)
+        sys.exit(1)
+    if len(res['cases']) == 0:
+        res['cases'] = DEFAULT_CASES
+    return res
+
+def generate_schema_text(structs, depth, array, members):
+    # 'structs' global variables, each of them a chain of 'depth' nested structs,
+    # a struct contains 'members' basic members and an array of the next struct,
+    # defined before it
+    basic_types = ("int", "float", "double")
+    lines = ["// synthetic schema generated by bench.py", ""]
+    lines.append("#define ARRAY_SIZE %d" %array)
+    lines.append("")
+    for n in range(structs):
+        lines.append("struct S%d_0 var%d;" %(n, n))
+    for n in range(structs):
+        for level in reversed(range(depth)):
+            lines.append("")
+            lines.append("struct S%d_%d {" %(n, level))
+            for m in range(members):
+                lines.append("\t%s m%d;" %(basic_types[m % len(basic_types)], m))
+            if level + 1 < depth:
+                if array > 1:
+                    lines.append("\tstruct S%d_%d sub[ARRAY_SIZE];" %(n, level + 1))
+                else:
+                    lines.append("\tstruct S%d_%d sub;" %(n, level + 1))
+            lines.append("};")
+    return "\n".join(lines) + "\n"
+
+def fill_config_file(template_name, file_name):
+    # enable all the keys of the generated .conf template with a value
+    keys = 0
+    with open(template_name) as template, open(file_name, "w") as outf:
+        for line in template:
+            if line.startswith("#\t"):
+                keys += 1
+                line = line[1:].replace("<value>", str(keys % 1000))
+            elif line.startswith("#"):
+                line = line[1:]
+            outf.write(line)
+    return keys
+
+def get_parser_options(mode):
+    options = {}
+    for name in mode.split("+"):
+        options.update(MODES[name])
+    return options
+
+def generate_files(schema_name, parser_options, workdir):
+    parser = config_tool.ConfigParser(schema_name, BENCH_NAME + ".h", **parser_options)
+    config_tool.write_header_file(parser, os.path.join(workdir, BENCH_NAME + ".h"),
+                                  BENCH_NAME.upper())
+    config_tool.write_source_file(parser, os.path.join(workdir, BENCH_NAME + ".c"))
+    config_tool.write_config_file(parser, os.path.join(workdir, BENCH_NAME + ".conf"))
+
+def bench_generator(schema_name, parser_options, workdir, repeat):
+    res = {}
+    parse_time = generate_time = float("inf")
+    for n in range(repeat):
+        start = time.perf_counter()
+        parser = config_tool.ConfigParser(schema_name, BENCH_NAME + ".h", **parser_options)
+        parse_time = min(parse_time, time.perf_counter() - start)
+        start = time.perf_counter()
+        generate_files(schema_name, parser_options, workdir)
+        generate_time = min(generate_time, time.perf_counter() - start)
+    res['parse_s'] = parse_time
+    # parse and write of all the files
+    res['generate_s'] = generate_time
+    # peak memory of a separate run, tracemalloc slows down the allocations
+    tracemalloc.start()
+    generate_files(schema_name, parser_options, workdir)
+    res['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    res['generated_bytes'] = {}
+    for ext in ("h", "c", "conf"):
+        res['generated_bytes'][ext] = os.path.getsize(os.path.join(workdir,
+                                                                   BENCH_NAME + "." + ext))
+    res['generate_mb_s'] = sum(res['generated_bytes'].values()) / generate_time / 1e6
+    return res
+
+def set_stack_limit(stack_kb):
+    # run in the child process before the exec
+    resource.setrlimit(resource.RLIMIT_STACK, (stack_kb * 1024, stack_kb * 1024))
+
+def bench_runtime(workdir, iterations, stack_kb):
+    bench_dir = os.path.dirname(os.path.abspath(__file__))
+    cc = os.environ.get("CC", "gcc")
+    cflags = os.environ.get("CFLAGS", "-O2").split()
+    start = time.perf_counter()
+    subprocess.run([cc] + cflags + ["-I.", BENCH_NAME + ".c",
+                   os.path.join(bench_dir, "main.c"), "-o", BENCH_NAME],
+                   cwd = workdir, check = True)
+    res = {'compile_s': time.perf_counter() - start}
+    keys = fill_config_file(os.path.join(workdir, BENCH_NAME + ".conf"),
+                            os.path.join(workdir, "read.conf"))
+    preexec = None
+    if stack_kb != None:
+        preexec = lambda: set_stack_limit(stack_kb)
+    out = subprocess.run(["./" + BENCH_NAME, "read.conf", "write.conf", str(iterations)],
+                         cwd = workdir, check = True, capture_output = True, text = True,
+                         preexec_fn = preexec)
+    (read_time, write_time, max_rss) = out.stdout.split()[-3:]
+    conf_bytes = os.path.getsize(os.path.join(workdir, "read.conf"))
+    res['keys'] = keys
+    res['conf_bytes'] = conf_bytes
+    res['read_s'] = float(read_time) / iterations
+    res['write_s'] = float(write_time) / iterations
+    res['read_mb_s'] = conf_bytes / res['read_s'] / 1e6
+    res['write_mb_s'] = os.path.getsize(os.path.join(workdir, "write.conf")) / res['write_s'] / 1e6
+    res['read_keys_s'] = keys / res['read_s']
+    res['peak_rss_kb'] = int(max_rss)
+    return res
+
+def compare_baseline(results, baseline_name, threshold):
+    # print the metrics slower than the baseline, return the number of regressions
+    with open(baseline_name) as baseline_file:
+        baseline = json.load(baseline_file)
+    previous = {}
+    for result in baseline['results']:
+        previous[(result['case']['name'], result['mode'])] = result
+    regressions = 0
+    for result in results:
+        old = previous.get((result['case']['name'], result['mode']))
+        if old == None:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric not in result or metric not in old or old[metric] <= 0:
+                continue
+            ratio = result[metric] / old[metric]
+            if ratio > threshold:
+                regressions += 1
+                print("%s/%s: %s %.6f s, baseline %.6f s (x%.2f)"
+                      %(result['case']['name'], result['mode'], metric,
+                        result[metric], old[metric], ratio), file = sys.stderr)
+    return regressions
+
+def main():
+    options = set_options()
+    results = []
+    for (name, structs, depth, array, members) in options['cases']:
+        case_dir = os.path.join(options['workdir'], name)
+        os.makedirs(case_dir, exist_ok = True)
+        schema_name = os.path.join(case_dir, BENCH_NAME + ".schema")
+        with open(schema_name, "w") as schema_file:
+            schema_file.write(generate_schema_text(structs, depth, array, members))
+        for mode in options['modes']:
+            workdir = os.path.join(case_dir, mode)
+            os.makedirs(workdir, exist_ok = True)
+            print("%s/%s" %(name, mode), file = sys.stderr)
+            result = {'case': {'name': name, 'structs': structs, 'depth': depth,
+                               'array': array, 'members': members},
+                      'mode': mode,
+                      'schema_bytes': os.path.getsize(schema_name)}
+            result.update(bench_generator(schema_name, get_parser_options(mode),
+                                          workdir, options['repeat']))
+            if options['c'] == True:
+                result.update(bench_runtime(workdir, options['iterations'],
+                                            options['stack']))
+            results.append(result)
+
+    report = {'python': platform.python_version(), 'machine': platform.machine(),
+              'iterations': options['iterations'], 'results': results}
+    if options['output'] != None:
+        with open(options['output'], "w") as outf:
+            json.dump(report, outf, indent = 1)
+            outf.write("\n")
+    else:
+        json.dump(report, sys.stdout, indent = 1)
+        print()
+
+    if options['baseline'] != None:
+        if compare_baseline(results, options['baseline'], options['threshold']) > 0:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
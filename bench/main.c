@@ -0,0 +1,79 @@
+
+/* BSD 2-Clause License
+*
+* Copyright (c) 2023, nguyenvannam142@gmail.com
+*
+* Redistribution and use in source and binary forms, with or without
+* modification, are permitted provided that the following conditions are met:
+*
+* 1. Redistributions of source code must retain the above copyright notice, this
+*    list of conditions and the following disclaimer.
+*
+* 2. Redistributions in binary form must reproduce the above copyright notice,
+*    this list of conditions and the following disclaimer in the documentation
+*    and/or other materials provided with the distribution.
+*
+* THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+* AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+* IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+* DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+* FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+* DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+* SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+* CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+* OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+* OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+*/
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+#include <sys/resource.h>
+#include "bench_config.h"
+
+static double elapsed(const struct timespec *start)
+{
+	struct timespec now;
+
+	clock_gettime(CLOCK_MONOTONIC, &now);
+	return (double)(now.tv_sec - start->tv_sec) +
+	       (double)(now.tv_nsec - start->tv_nsec) / 1e9;
+}
+
+int main(int argc, char *argv[])
+{
+	struct timespec start;
+	struct rusage usage;
+	double read_time, write_time;
+	int i, iterations;
+
+	if (argc != 4) {
+		printf("usage: %s <read conf> <write conf> <iterations>\n", argv[0]);
+		return -1;
+	}
+	iterations = atoi(argv[3]);
+
+	clock_gettime(CLOCK_MONOTONIC, &start);
+	for (i = 0; i < iterations; i++) {
+		if (bench_config_read(argv[1]) < 0) {
+			printf("Read %s FAILED\n", argv[1]);
+			return -1;
+		}
+	}
+	read_time = elapsed(&start);
+
+	clock_gettime(CLOCK_MONOTONIC, &start);
+	for (i = 0; i < iterations; i++) {
+		if (bench_config_write(argv[2]) < 0) {
+			printf("Write %s FAILED\n", argv[2]);
+			return -1;
+		}
+	}
+	write_time = elapsed(&start);
+
+	getrusage(RUSAGE_SELF, &usage);
+	// read time, write time (s) and peak memory (kB) for bench.py
+	printf("%.9f %.9f %ld\n", read_time, write_time, usage.ru_maxrss);
+
+	return 0;
+}
@@ -28,16 +28,355 @@
 import re
 import sys
 import getopt
+import struct
 import os.path
+import glob
+import io
+import time
+import hashlib
+import gc
+import concurrent.futures
+
+# C scalar types of the schema:
+# type => (id, kind, minimum, maximum, printf format, size in the binary snapshot)
+# the id names PRIMITIVE_TYPE_<ID>, read_<id>() and bin_put_<id>(),
+# the kind selects the parser: signed, unsigned, bool, float or double
+SCALAR_TYPES = {
+    'char': ('CHAR', 'signed', 'CHAR_MIN', 'CHAR_MAX', '%hhd', 1),
+    'signed char': ('SCHAR', 'signed', 'SCHAR_MIN', 'SCHAR_MAX', '%hhd', 1),
+    'unsigned char': ('UCHAR', 'unsigned', '0', 'UCHAR_MAX', '%hhu', 1),
+    'short': ('SHORT', 'signed', 'SHRT_MIN', 'SHRT_MAX', '%hd', 2),
+    'unsigned short': ('USHORT', 'unsigned', '0', 'USHRT_MAX', '%hu', 2),
+    'int': ('INT', 'signed', 'INT_MIN', 'INT_MAX', '%d', 4),
+    'unsigned int': ('UINT', 'unsigned', '0', 'UINT_MAX', '%u', 4),
+    'long': ('LONG', 'signed', 'LONG_MIN', 'LONG_MAX', '%ld', 8),
+    'unsigned long': ('ULONG', 'unsigned', '0', 'ULONG_MAX', '%lu', 8),
+    'long long': ('LLONG', 'signed', 'LLONG_MIN', 'LLONG_MAX', '%lld', 8),
+    'unsigned long long': ('ULLONG', 'unsigned', '0', 'ULLONG_MAX', '%llu', 8),
+    'int8_t': ('INT8', 'signed', 'INT8_MIN', 'INT8_MAX', '%" PRId8 "', 1),
+    'int16_t': ('INT16', 'signed', 'INT16_MIN', 'INT16_MAX', '%" PRId16 "', 2),
+    'int32_t': ('INT32', 'signed', 'INT32_MIN', 'INT32_MAX', '%" PRId32 "', 4),
+    'int64_t': ('INT64', 'signed', 'INT64_MIN', 'INT64_MAX', '%" PRId64 "', 8),
+    'uint8_t': ('UINT8', 'unsigned', '0', 'UINT8_MAX', '%" PRIu8 "', 1),
+    'uint16_t': ('UINT16', 'unsigned', '0', 'UINT16_MAX', '%" PRIu16 "', 2),
+    'uint32_t': ('UINT32', 'unsigned', '0', 'UINT32_MAX', '%" PRIu32 "', 4),
+    'uint64_t': ('UINT64', 'unsigned', '0', 'UINT64_MAX', '%" PRIu64 "', 8),
+    'bool': ('BOOL', 'bool', '0', '1', '%d', 1),
+    'float': ('FLOAT', 'float', '-FLT_MAX', 'FLT_MAX', '%f', 4),
+    'double': ('DOUBLE', 'double', '-DBL_MAX', 'DBL_MAX', '%lf', 8),
+}
+
+def get_scalar_type_name(data_type):
+    # name of the type in SCALAR_TYPES, None if not a scalar type
+    # e.g. unsigned => unsigned int, long int => long, signed short => short
+    words = data_type.split()
+    if len(words) > 1 and 'int' in words:
+        words.remove('int')
+    if words == ['signed'] or words == ['unsigned']:
+        words.append('int')
+    if len(words) > 1 and words[0] == 'signed' and words != ['signed', 'char']:
+        words.remove('signed')
+    name = " ".join(words)
+    if name not in SCALAR_TYPES:
+        return None
+    return name
+
+def parse_scalar_value(data_type, value):
+    # same rules as parse_value() of the generated code, None if invalid
+    (kind, size) = (SCALAR_TYPES[data_type][1], SCALAR_TYPES[data_type][5])
+    if kind == 'bool':
+        return {'1': 1, 'true': 1, '0': 0, 'false': 0}.get(value.lower())
+    if kind == 'float' or kind == 'double':
+        if re.fullmatch(r"[+-]?(inf|infinity|nan)", value, re.I):
+            return float(value)
+        if re.fullmatch(r"[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?", value) == None:
+            return None
+        number = float(value)
+        # overflow of the type
+        if kind == 'float' and abs(number) > 3.4028234663852886e38:
+            return None
+        if abs(number) == float("inf"):
+            return None
+        return number
+    r_value = re.fullmatch(r"([+-]?)(0[xX][0-9a-fA-F]+|\d+)", value)
+    if r_value == None or (kind == 'unsigned' and r_value.group(1) == '-'):
+        return None
+    if r_value.group(2)[:2].lower() == "0x":
+        number = int(r_value.group(2), 16)
+    else:
+        number = int(r_value.group(2))
+    if r_value.group(1) == '-':
+        number = -number
+    if kind == 'signed':
+        (minimum, maximum) = (-(1 << (8 * size - 1)), (1 << (8 * size - 1)) - 1)
+    else:
+        (minimum, maximum) = (0, (1 << (8 * size)) - 1)
+    if number < minimum or number > maximum:
+        return None
+    return number
+
+# escape sequences of the char values of the schema
+CHAR_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '0': '\0', '\\': '\\',
+                "'": "'", '"': '"'}
+
+def parse_schema_value(data_type, value):
+    # number of a value of the schema: parse_scalar_value() or a char, None if invalid
+    r_char = re.fullmatch(r"'(\\?)(.)'", value)
+    if r_char != None and SCALAR_TYPES[data_type][1] in ('signed', 'unsigned'):
+        char = r_char.group(2)
+        if r_char.group(1) != "":
+            char = CHAR_ESCAPES.get(char)
+            if char == None:
+                return None
+        return parse_scalar_value(data_type, str(ord(char)))
+    return parse_scalar_value(data_type, value)
+
+class SchemaError(Exception):
+    # syntax error in a .schema file, the message starts with file:line:column
+    pass
+
+class SchemaParser():
+    # one token per match, the spaces and comments before it are skipped,
+    # the last token is the empty string matched at the end of the text
+    token_recomp = re.compile(r"""(?:\s|//[^\n]*|/\*.*?\*/)*(
+          [A-Za-z_]\w*                          # name
+        | [-+]?\.?[0-9](?:[eEpP][-+]|[\w.])*    # number
+        | [{}\[\];=]
+        | \#[^\n]*                              # directive
+        | '(?:\\.|[^'\\\n])+'                   # char
+        | /\*                                   # unterminated comment
+        | \S                                    # unexpected character
+        | \Z)""", re.VERBOSE | re.DOTALL)
+    value_recomp = re.compile(r"[-+]?\.?[0-9]|'")
+    define_recomp = re.compile(r"#\s*define\s+(\w+)\s+(\S+)\s*(//.*|/\*.*)?$")
+    # words of the multi words C types
+    type_words = frozenset(("signed", "unsigned", "short", "long", "int", "char",
+                            "float", "double"))
+
+    def __init__(self, file_name, text, struct_cache):
+        self.file_name = file_name
+        self.text = text
+        # struct definitions of the previous load, by tokens of the definition
+        self.old_struct_cache = struct_cache
+        self.struct_cache = {}
+        self.datadef_array = []
+        self.vardef_array = []
+        self.macro_array = []
+        self.struct_names = set()
+        self.tokens = []
+        self.index = 0
+
+    def location(self, index):
+        # the offsets are only needed for the messages, the tokens are matched again
+        offset = len(self.text)
+        for n, r_token in enumerate(self.token_recomp.finditer(self.text)):
+            if n == index:
+                offset = r_token.start(1)
+                break
+        line = self.text.count("\n", 0, offset) + 1
+        column = offset - self.text.rfind("\n", 0, offset)
+        return "%s:%d:%d" %(self.file_name, line, column)
+
+    def error(self, index, message):
+        raise SchemaError("%s: %s" %(self.location(index), message))
+
+    def unexpected(self, what):
+        token = self.tokens[self.index]
+        if token == "":
+            self.error(self.index, "expected %s before end of file" %what)
+        if token == "/*":
+            self.error(self.index, "unterminated comment")
+        if token.isidentifier() or self.value_recomp.match(token) or token in "{}[];=":
+            self.error(self.index, "expected %s before '%s'" %(what, token))
+        if token[0] == "#":
+            self.error(self.index, "unexpected directive '%s'" %token)
+        self.error(self.index, "unexpected character '%s'" %token)
+
+    def accept(self, token):
+        if self.tokens[self.index] == token:
+            self.index += 1
+            return True
+        return False
+
+    def expect(self, token):
+        if self.tokens[self.index] != token:
+            self.unexpected("'%s'" %token)
+        self.index += 1
+
+    def expect_name(self, what):
+        token = self.tokens[self.index]
+        if not token.isidentifier() or token == "struct":
+            self.unexpected(what)
+        self.index += 1
+        return token
+
+    def expect_value(self, what):
+        token = self.tokens[self.index]
+        if token == "struct" or not (token.isidentifier() or self.value_recomp.match(token)):
+            self.unexpected(what)
+        self.index += 1
+        return token
+
+    def parse(self):
+        # the parser makes no reference cycles, the garbage collector is paused
+        # while the many small tuples of a big schema are created
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.tokens = self.token_recomp.findall(self.text)
+            self.index = 0
+            while self.tokens[self.index] != "":
+                self.parse_declaration()
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def parse_declaration(self):
+        # declaration: '#define' NAME VALUE
+        #            | 'struct' NAME '{' member... '}' ';'
+        #            | 'struct' NAME NAME ';'
+        #            | type NAME ['=' default] ';'
+        start = self.index
+        token = self.tokens[start]
+        if token[0] == "#":
+            r_macro = self.define_recomp.match(token)
+            if r_macro == None:
+                if re.match(r"#\s*define\b", token) == None:
+                    self.error(start, "unsupported directive '%s'" %token)
+                self.error(start, "expected #define NAME VALUE")
+            self.index += 1
+            self.macro_array.append((r_macro.group(1), r_macro.group(2)))
+        elif self.accept("struct"):
+            type_name = self.expect_name("struct name")
+            if self.accept("{"):
+                self.parse_struct(start, type_name)
+            else:
+                var_name = self.expect_name("variable name")
+                self.reject_array(var_name)
+                self.expect(";")
+                self.vardef_array.append(("struct", type_name, var_name, None))
+        else:
+            (var_type, var_name) = self.parse_type_and_name()
+            self.reject_array(var_name)
+            value = None
+            if self.accept("="):
+                value = self.parse_default(var_type)
+            self.expect(";")
+            self.vardef_array.append((var_type, None, var_name, value))
+
+    def parse_type_and_name(self):
+        # the C types may have several words, e.g. unsigned int
+        start = self.index
+        words = [self.expect_name("type")]
+        if words[0] in self.type_words:
+            while self.tokens[self.index] in self.type_words:
+                words.append(self.tokens[self.index])
+                self.index += 1
+        type_name = get_scalar_type_name(" ".join(words))
+        if type_name == None:
+            self.error(start, "unknown type '%s'" %" ".join(words))
+        return (type_name, self.expect_name("name"))
+
+    def reject_array(self, var_name):
+        if self.tokens[self.index] == "[":
+            self.error(self.index, "%s: arrays are only supported as struct members" %var_name)
+
+    def parse_struct(self, start, type_name):
+        # the tokens of the struct up to '}' are the key of the struct cache
+        try:
+            end = self.tokens.index("}", self.index) + 1
+        except ValueError:
+            end = len(self.tokens)
+        chunk = tuple(self.tokens[start:end])
+        member_array = self.old_struct_cache.get(chunk)
+        if member_array != None:
+            # struct not edited since the previous load
+            self.index = end
+        else:
+            member_array = []
+            while not self.accept("}"):
+                member_array.append(self.parse_member())
+        self.expect(";")
+        self.struct_cache[chunk] = member_array
+        if len(member_array) == 0:
+            return
+        if type_name in self.struct_names:
+            print("%s: struct %s already defined" %(self.location(start), type_name))
+            return
+        self.struct_names.add(type_name)
+        # the members are copied, expand_struct() fills their lists
+        member_array = [(member[0], member[1], member[2], [], member[4], member[5])
+                        for member in member_array]
+        self.datadef_array.append(("struct", type_name, None, member_array, None))
+
+    def parse_member(self):
+        # member: 'struct' NAME NAME ['[' size ']'] ';'
+        #       | type NAME ['[' size ']'] ['=' default] ';'
+        # the default of an array is the default of all its elements
+        if self.accept("struct"):
+            member_type = "struct"
+            type_name = self.expect_name("struct name")
+            name = self.expect_name("member name")
+        else:
+            (member_type, name) = self.parse_type_and_name()
+            type_name = None
+        array_size = None
+        if self.accept("["):
+            array_size = self.expect_value("array size")
+            self.expect("]")
+        default = None
+        if member_type != "struct" and self.accept("="):
+            default = self.parse_default(member_type)
+        self.expect(";")
+        return (member_type, type_name, name, [], array_size, default)
+
+    def parse_default(self, data_type):
+        # a number, a char, true, false or a macro checked by the ConfigParser
+        start = self.index
+        value = self.expect_value("default value")
+        if value in ("true", "false") or not value.isidentifier():
+            if parse_schema_value(data_type, value) == None:
+                self.error(start, "invalid %s default value '%s'" %(data_type, value))
+        elif value not in (macro[0] for macro in self.macro_array):
+            self.error(start, "unknown default value '%s'" %value)
+        return value
 
 class ConfigParser():
-    def __init__(self, fname, header_fname):
+    def __init__(self, fname, header_fname, loop=False, table=False, mmap=False,
+                 stream=False, binary=False, dynamic=False, shm=False):
         header_recomp = re.compile(r"(\S+).h")
         r_header = header_recomp.match(header_fname)
         if r_header:
             self.header_fname = r_header.group(1)
         else:
             self.header_fname = header_fname
+        # loop = True: generate for loops over the arrays instead of one
+        # statement per array element
+        self.loop = loop
+        # table = True: generate a const field descriptor table per struct
+        # and read/write through the shared read_fields()/write_fields()
+        self.table = table
+        # mmap = True: map the config file and parse it in place,
+        # the region lines are slices of the mapped file
+        self.mmap = mmap
+        # stream = True: single pass reader, each line of the config file
+        # is stored directly into its field found in a table of all the keys
+        self.stream = stream
+        # binary = True: also generate <name>_read_bin()/<name>_write_bin()
+        # for the binary snapshot of the config variables
+        self.binary = binary
+        # dynamic = True: the region lines and index start from a few lines
+        # and are grown on demand instead of being sized for the keys of the schema
+        self.dynamic = dynamic
+        # shm = True: also generate <name>_publish_shm()/<name>_attach_shm()
+        # to share the config variables between processes
+        self.shm = shm
+        # parsed struct definitions by text of the definition, reused by
+        # load_schema() for the structs not edited since the previous load
+        self.struct_cache = {}
+        self.load_schema(fname)
+
+    def load_schema(self, fname):
         # datadef_array in format: {'type', 'type_name', 'var_name', 'members', 'array_size'}
         # contain a list of user data type difinition e.g. struct ABC abc;
         # 'type'='struct', 'type_name'='ABC', 'var_name'='abc' and 'members' and 'array_size' = None
@@ -46,96 +385,43 @@ class ConfigParser():
         self.vardef_array = []
         self.macro_array = []
         self.basic_types_array = []
+        # indexes of the schema: struct type name => datadef,
+        # macro name => value and the set of basic_types_array
+        self.struct_dict = {}
+        self.macro_dict = {}
+        self.basic_types_set = set()
+        self.schema_name = fname
         self.parse_file(fname, self.datadef_array, self.vardef_array, self.macro_array)
+        for macro in self.macro_array:
+            self.macro_dict.setdefault(macro[0], macro[1])
+        # the macros of the defaults are known only now
+        self.struct_defaults = {}
+        self.default_texts = {}
+        for datadef in self.datadef_array:
+            for member in datadef[3]:
+                if member[0] != 'struct':
+                    self.get_default_value(member[0], member[5])
+        for vardef in self.vardef_array:
+            if vardef[0] != 'struct':
+                self.get_default_value(vardef[0], vardef[3])
+        # types of the global variables
+        self.global_types_set = set(vardef[0] for vardef in self.vardef_array)
         self.expand_member(self.datadef_array, self.vardef_array)
         self.get_basic_types(self.basic_types_array, self.datadef_array)
 
     def parse_file(self, file_name, datadef_array, vardef_array, macro_array):
         file_object = open(file_name, encoding = 'utf-8')
-        structdef_start_recomp = re.compile(r"^\s*struct\s+(\S+)\s*{\s*(//.*)?")
-        member_base_recomp = re.compile(r"^\s*(\S+)\s+(\S+)\s*;\s*(//.*)?")
-        member_struct_recomp = re.compile(r"^\s*struct\s+(\S+)\s+(\S+)\s*;\s*(//.*)?")
-        structdef_end_recomp = re.compile(r"^\s*};\s*(//.*)?")
-        comment_line_recomp = re.compile(r"^\s*//.*")
-        blank_line_recomp = re.compile(r"^\s+$")
-        staticvar_struct_recomp = re.compile(r"^\s*struct\s+(\S+)\s+(\S+)\s*;\s*(//.*)?")
-        staticvar_base_recomp = re.compile(r"^\s*(\S+)\s+(\S+)\s*(=\s*\S+)?;\s*(//.*)?")
-        macro_recomp = re.compile(r"^\s*#define\s+(\S+)\s+(\S+)")
-        array_recomp = re.compile(r"(\S+)\[\s*(\S+)\]\s*")
-        line_number = 0
-        while True:
-            line = file_object.readline()
-            if line == "":
-                break
-            line_number += 1
-
-            r_macro = macro_recomp.match(line)
-            if r_macro:
-                macro_array.append((r_macro.group(1), r_macro.group(2)))
-                continue
-
-            r_datadef = structdef_start_recomp.match(line)
-            if r_datadef:
-                member_array = []
-                while True:
-                    line = file_object.readline()
-                    if line == "":
-                        break
-
-                    line_number += 1
-
-                    if comment_line_recomp.match(line) or blank_line_recomp.match(line):
-                        continue
-
-                    r_mem = member_base_recomp.match(line)
-                    if r_mem:
-                        r_array = array_recomp.match(r_mem.group(2))
-                        if r_array:
-                            member_array.append((r_mem.group(1), None,
-                                                 r_array.group(1), [], r_array.group(2)))
-                        else:
-                            member_array.append((r_mem.group(1), None, r_mem.group(2), [], None))
-                    else:
-                        if structdef_end_recomp.match(line):
-                            break
-                        r_mem = member_struct_recomp.match(line)
-                        if r_mem:
-                            # e.g. struct ABC abc;
-                            r_array = array_recomp.match(r_mem.group(2))
-                            if r_array:
-                                member_array.append(("struct", r_mem.group(1),
-                                                     r_array.group(1), [], r_array.group(2)))
-                            else:
-                                member_array.append(("struct", r_mem.group(1),
-                                                     r_mem.group(2), [], None))
-                        else:
-                            print("struct %s: line %d, expect };"
-                                  %(r_datadef.group(1), line_number))
-                            member_array.clear()
-                            break
-
-                if len(member_array) > 0:
-                    datadef_array.append(("struct", r_datadef.group(1),
-                                          None, member_array, None))
-
-            else:
-                if comment_line_recomp.match(line) or blank_line_recomp.match(line):
-                    continue
-                r_vardef = staticvar_struct_recomp.match(line)
-                if r_vardef:
-                   vardef_array.append(("struct", r_vardef.group(1),
-                                        r_vardef.group(2), None))
-                else:
-                    value = None
-                    r_vardef = staticvar_base_recomp.match(line)
-                    if r_vardef:
-                        if r_vardef.group(3) != None:
-                            val_recomp = re.compile(r"=\s*(\S+)")
-                            if val_recomp:
-                                r_value = val_recomp.match(r_vardef.group(3))
-                                value = r_value.group(1)
-                        vardef_array.append((r_vardef.group(1),
-                                             None, r_vardef.group(2), value))
+        text = file_object.read()
+        file_object.close()
+        schema_parser = SchemaParser(file_name, text, self.struct_cache)
+        schema_parser.parse()
+        datadef_array.extend(schema_parser.datadef_array)
+        vardef_array.extend(schema_parser.vardef_array)
+        macro_array.extend(schema_parser.macro_array)
+        for datadef in schema_parser.datadef_array:
+            self.struct_dict[datadef[1]] = datadef
+        # keep only the structs of this load
+        self.struct_cache = schema_parser.struct_cache
 
     def expand_struct(self, datadef_array, struct_type):
         struct_members = struct_type[3]
@@ -143,23 +429,23 @@ class ConfigParser():
             # Not a struct or already expanded => skip
             if member[0] != 'struct' or len(member[3]) != 0:
                 continue
-            for datadef in datadef_array:
-                if datadef[0] != 'struct' or datadef[1] != member[1]:
-                    continue
+            datadef = self.get_struct(member[1])
+            if datadef != None:
                 self.expand_struct(datadef_array, datadef)
                 # replace with an expanded struct
                 member[3].append(datadef)
-                break;
 
     def expand_member(self, datadef_array, vardef_array):
         for vardef in vardef_array:
             if vardef[0] != 'struct':
                 continue
-            for datadef in datadef_array:
-                if datadef[0] != 'struct' or datadef[1] != vardef[1]:
-                    continue
+            datadef = self.get_struct(vardef[1])
+            if datadef != None:
                 self.expand_struct(datadef_array, datadef)
 
+    def get_struct(self, type_name):
+        return self.struct_dict.get(type_name)
+
     def get_basic_types_from_struct(self, basic_types_array, struct_object):
         if struct_object[0] != 'struct':
             return
@@ -170,12 +456,8 @@ class ConfigParser():
                 self.append_basic_type(basic_types_array, member[0])
 
     def append_basic_type(self, basic_types_array, basic_type):
-        existed = False
-        for basic in basic_types_array:
-            if basic == basic_type: # existed already ~> Ignore
-                existed = True
-                break
-        if existed == False:
+        if basic_type not in self.basic_types_set: # existed already ~> Ignore
+            self.basic_types_set.add(basic_type)
             basic_types_array.append(basic_type)
 
     def get_basic_types(self, basic_types_array, datadef_array):
@@ -190,18 +472,24 @@ class ConfigParser():
             if vardef[0] == 'struct':
                 outf.write("#CONF_%s = {\n" %vardef[2])
 
-                for datadef in self.datadef_array:
-                    if datadef[0] != 'struct' or datadef[1] != vardef[1]:
-                        continue
-                    self.generate_datatype_config_file(datadef[0], vardef[2],
-                                   datadef[3], None, datadef[4], outf)
+                datadef = self.get_struct(vardef[1])
+                if datadef != None:
+                    outf.writelines(self.generate_datatype_config_file(datadef[0], vardef[2],
+                                    datadef[3], None, datadef[4]))
                     outf.write("#};\n\n")
             else:
-                outf.write("#CONF_%s = {\n\t%s = <value>;\n};\n\n"
-                           %(vardef[2], vardef[2]))
+                outf.write("#CONF_%s = {\n\t%s = %s;\n};\n\n"
+                           %(vardef[2], vardef[2], self.get_template_value(vardef[0], vardef[3])))
+
+    def get_template_value(self, data_type, value):
+        if value == None:
+            return "<value>"
+        if SCALAR_TYPES[data_type][1] in ('float', 'double'):
+            return repr(float(self.get_default_value(data_type, value)))
+        return str(self.get_default_value(data_type, value))
 
     def generate_datatype_config_file(self, datatype, name, member_array,
-                                      father_name, array_size, outf):
+                                      father_name, array_size):
         if array_size == None:
             if father_name == None:
                 new_father = name
@@ -213,10 +501,12 @@ class ConfigParser():
             if datatype == 'struct':
                 for member in member_array:
                     if member[0] == 'struct':
-                        self.generate_datatype_config_file(member[0], member[2],
-                                  member[3], new_father, member[4], outf)
+                        yield from self.generate_datatype_config_file(member[0], member[2],
+                                  member[3], new_father, member[4])
                     else:
-                        outf.write("#\t%s.%s = <value>;\n" %(new_father, member[2]))
+                        for member_name in self.get_member_names(member):
+                            yield "#\t%s.%s = %s;\n" %(new_father, member_name,
+                                                      self.get_template_value(member[0], member[5]))
         else: #Array case
             if array_size.isnumeric():
                 size = int(array_size)
@@ -235,12 +525,19 @@ class ConfigParser():
                 if datatype == 'struct':
                     for member in member_array:
                         if member[0] == 'struct':
-                            self.generate_datatype_config_file(member[0], member[2],
-                                        member[3], new_father, member[4], outf)
+                            yield from self.generate_datatype_config_file(member[0], member[2],
+                                        member[3], new_father, member[4])
                         else:
-                            outf.write("#\t%s.%s = <value>;\n" %(new_father, member[2]))
+                            for member_name in self.get_member_names(member):
+                                yield "#\t%s.%s = %s;\n" %(new_father, member_name,
+                                            self.get_template_value(member[0], member[5]))
 
     def generate_header_file(self, outf):
+        outf.write("#include <stdbool.h>\n")
+        if any(data_type.endswith("_t") for data_type in self.get_used_basic_types()):
+            outf.write("#include <stdint.h>\n")
+        outf.write("\n")
+
         for macro in self.macro_array:
             outf.write("#define %s %s\n\n" %(macro[0], macro[1]))
 
@@ -263,8 +560,118 @@ class ConfigParser():
                         outf.write("\t%s %s;\n" %(member[0], member[2]))
             outf.write("};\n\n")
 
+        for n, vardef in enumerate(self.vardef_array):
+            outf.write("#define %s_VAR_%s %d\n" %(self.header_fname.upper(), vardef[2].upper(), n))
+        outf.write("#define %s_NUM_VARS %d\n\n" %(self.header_fname.upper(), len(self.vardef_array)))
+
+        ctext = '''// The reentrant NAME_*_r() functions read and write the variables of a
+// struct NAME owned by the caller, with the reload state in a struct NAME_ctx
+// initialized by NAME_ctx_init(). They use no static data: several configs
+// can be read and written at the same time by several threads.
+struct NAME {
+'''
+        outf.write(ctext.replace("NAME", self.header_fname))
+        for vardef in self.vardef_array:
+            outf.write("\t%s %s;\n" %(self.get_var_type(vardef), vardef[2]))
+        ctext = '''};
+
+struct NAME_ctx {
+	unsigned int region_hashes[UNAME_NUM_VARS];
+	bool region_loaded[UNAME_NUM_VARS];
+};
+
+void NAME_ctx_init(struct NAME_ctx *ctx);
+
+int NAME_read_r(struct NAME *config, struct NAME_ctx *ctx, const char* file_name);
+
+int NAME_reload_r(struct NAME *config, struct NAME_ctx *ctx, const char* file_name,
+				  bool *changed);
+
+int NAME_write_r(const struct NAME *config, const char* file_name);
+
+int NAME_write_sparse_r(const struct NAME *config, const char* file_name);
+
+// set the variables of config to the defaults of the schema
+void NAME_set_defaults(struct NAME *config);
+
+int NAME_read_var_r(struct NAME *config, struct NAME_ctx *ctx, const char* file_name,
+					const char *var_name);
+
+'''
+        if self.binary == True:
+            ctext += '''int NAME_read_bin_r(struct NAME *config, const char* file_name);
+
+int NAME_write_bin_r(const struct NAME *config, const char* file_name);
+
+'''
+        outf.write(ctext.replace("UNAME", self.header_fname.upper())
+                   .replace("NAME", self.header_fname))
+
+        outf.write("// 0 on success, -1 if the file cannot be read or a value is invalid\n")
+        outf.write("// e.g. out of the range of its type: the valid values are loaded anyway\n")
+        outf.write("// and the fields of the invalid ones are left unchanged\n")
         outf.write("int %s_read(const char* file_name);\n\n" %self.header_fname)
+        outf.write("// re-read only the regions changed since the last read/reload,\n")
+        outf.write("// changed[%s_VAR_<var>] is set for each re-read variable.\n" %self.header_fname.upper())
+        outf.write("// The number of re-read variables, -1 as %s_read()\n" %self.header_fname)
+        outf.write("int %s_reload(const char* file_name, bool *changed);\n\n" %self.header_fname)
         outf.write("int %s_write(const char* file_name);\n\n" %self.header_fname)
+        outf.write("// write only the values different from the defaults of the schema\n")
+        outf.write("int %s_write_sparse(const char* file_name);\n\n" %self.header_fname)
+        outf.write("// read only the variable var_name e.g. \"abc\": the file is scanned for\n")
+        outf.write("// its region, the other regions are not parsed. -1 as %s_read()\n"
+                   %self.header_fname)
+        outf.write("int %s_read_var(const char* file_name, const char *var_name);\n\n"
+                   %self.header_fname)
+        if self.binary == True:
+            outf.write("int %s_read_bin(const char* file_name);\n\n" %self.header_fname)
+            outf.write("int %s_write_bin(const char* file_name);\n\n" %self.header_fname)
+        if self.shm == True:
+            ctext = '''// NAME_publish_shm() copies the config variables to the POSIX shared memory
+// object shm_name e.g. "/NAME", from a single loader process. The other
+// processes attach to it and copy a consistent snapshot of the variables
+// with NAME_read_shm(), without parsing or locking. version is the number of
+// publications of the copied snapshot, NAME_shm_version() the current one.
+struct NAME_shm;
+
+int NAME_publish_shm(const char* shm_name);
+
+int NAME_publish_shm_r(const struct NAME *config, const char* shm_name);
+
+struct NAME_shm *NAME_attach_shm(const char* shm_name);
+
+void NAME_detach_shm(struct NAME_shm *shm);
+
+int NAME_read_shm(const struct NAME_shm *shm, unsigned int *version);
+
+int NAME_read_shm_r(const struct NAME_shm *shm, struct NAME *config, unsigned int *version);
+
+unsigned int NAME_shm_version(const struct NAME_shm *shm);
+
+'''
+            outf.write(ctext.replace("NAME", self.header_fname))
+        ctext = '''#ifdef CONF_STATS
+// work of NAME_read(), NAME_reload() and NAME_write() in the calling
+// thread since its start or its last NAME_stats_reset()
+struct NAME_stats {
+	unsigned long lines; //lines read from the config files
+	unsigned long bytes; //bytes read from the config files
+	unsigned long mallocs; //malloc, realloc and calloc calls
+	unsigned long key_compares; //key comparisons of the lookups
+	unsigned long key_misses; //lookups of a key not found
+	double parse_time; //seconds splitting the files in regions, with load_time
+	double load_time; //seconds loading the lines of the regions
+	double fields_time; //seconds storing the values in the variables
+	double write_time; //seconds writing the config files
+};
+
+const struct NAME_stats *NAME_stats(void);
+
+void NAME_stats_reset(void);
+#endif
+
+'''
+        outf.write(ctext.replace("NAME", self.header_fname))
 
     def generate_global_variable_option(self, outf, extern):
         for vardef in self.vardef_array:
@@ -274,10 +681,14 @@ class ConfigParser():
                 globalvar = "%s " %vardef[0]
 
             if vardef[0] == 'struct':
-                globalvar += "%s %s;" % (vardef[1], vardef[2])
+                if extern == False and self.has_struct_default(vardef[1]):
+                    globalvar += "%s %s = CONF_DEFAULT_%s;" % (vardef[1], vardef[2], vardef[1])
+                else:
+                    globalvar += "%s %s;" % (vardef[1], vardef[2])
             else:
-                if vardef[3] != None:
-                    globalvar += "%s = %s;" % (vardef[2], vardef[3])
+                if extern == False and vardef[3] != None:
+                    globalvar += "%s = %s;" % (vardef[2],
+                                               self.get_default_text(vardef[0], vardef[3]))
                 else:
                     globalvar += "%s;" % vardef[2]
 
@@ -290,7 +701,7 @@ class ConfigParser():
         self.generate_global_variable_option(outf, True)
 
     def generate_datatype_read_function(self, datatype, name, member_array,
-                                        father_name, array_size, outf):
+                                        father_name, array_size):
         if array_size == None:
             if father_name == None:
                 new_father = name
@@ -302,12 +713,14 @@ class ConfigParser():
             if datatype == 'struct':
                 for member in member_array:
                     if member[0] == 'struct':
-                        self.generate_datatype_read_function(member[0], member[2],
-                                     member[3], new_father, member[4], outf)
+                        yield from self.generate_datatype_read_function(member[0], member[2],
+                                     member[3], new_father, member[4])
                     else:
-                        var_access = "%s.%s" % (new_father, member[2])
-                        outf.write("\tread_%s(&%s, \"%s\", buffs, nbuffs);\n"
-                                   %(member[0], var_access, var_access))
+                        for member_name in self.get_member_names(member):
+                            var_access = "%s.%s" % (new_father, member_name)
+                            yield ("\tread_%s(&%s, \"%s\", region);\n"
+                                       %(self.get_type_id(member[0]),
+                                         self.get_var_access(var_access), var_access))
         else: #Array case
             if array_size.isnumeric():
                 size = int(array_size)
@@ -327,453 +740,4390 @@ class ConfigParser():
                 if datatype == 'struct':
                     for member in member_array:
                         if member[0] == 'struct':
-                            self.generate_datatype_read_function(member[0], member[2],
-                                         member[3], new_father, member[4], outf)
+                            yield from self.generate_datatype_read_function(member[0], member[2],
+                                         member[3], new_father, member[4])
                         else:
-                            var_access = "%s.%s" % (new_father, member[2])
-                            outf.write("\tread_%s(&%s, \"%s\", buffs, nbuffs);\n"
-                                       %(member[0], var_access, var_access))
+                            for member_name in self.get_member_names(member):
+                                var_access = "%s.%s" % (new_father, member_name)
+                                yield ("\tread_%s(&%s, \"%s\", region);\n"
+                                           %(self.get_type_id(member[0]),
+                                             self.get_var_access(var_access), var_access))
 
-    def get_define_value(self, name):
-        for macro in self.macro_array:
-            if macro[0] == name:
-                return int(macro[1])
-        return -1
+    def get_default_value(self, data_type, value):
+        # number of a default value of the schema, 0 without default
+        if value == None:
+            return 0
+        number = parse_schema_value(data_type, self.macro_dict.get(value, value))
+        if number == None:
+            raise SchemaError("%s: invalid %s default value '%s'"
+                              %(self.schema_name, data_type, value))
+        return number
 
-    def generate_read_function(self, outf):
-        for vardef in self.vardef_array:
-            outf.write("static int read_%s(char **buffs, int nbuffs) \n{\n" %vardef[2])
-            if vardef[0] == 'struct':
-                for datadef in self.datadef_array:
-                    if datadef[0] != 'struct' or datadef[1] != vardef[1]:
-                        continue
-                    self.generate_datatype_read_function(datadef[0], vardef[2],
-                                  datadef[3], None, datadef[4], outf)
+    def get_default_text(self, data_type, value):
+        # the text of the defaults is needed for each key of the written arrays
+        text = self.default_texts.get((data_type, value))
+        if text == None:
+            text = self.format_default(data_type, value)
+            self.default_texts[(data_type, value)] = text
+        return text
+
+    def format_default(self, data_type, value):
+        # C constant of a default value of the schema
+        number = self.get_default_value(data_type, value)
+        kind = SCALAR_TYPES[data_type][1]
+        if kind == 'bool':
+            return "true" if number != 0 else "false"
+        if kind == 'float' or kind == 'double':
+            if number != number:
+                return "NAN"
+            if abs(number) == float("inf"):
+                return "INFINITY" if number > 0 else "-INFINITY"
+            return repr(float(number))
+        if kind == 'unsigned':
+            return "%du" %number if number <= 0xffffffff else "%dull" %number
+        if number == -(1 << 63):
+            return "(%dll - 1)" %(number + 1)
+        return "%d" %number if abs(number) < (1 << 31) else "%dll" %number
+
+    def get_default_compare(self, data_type, value, access):
+        # C condition true if the value of access is not the default
+        text = self.get_default_text(data_type, value)
+        if SCALAR_TYPES[data_type][1] == 'float':
+            text = "(float)%s" %text
+        return "%s != %s" %(access, text)
+
+    def has_default(self, data_type, value):
+        # defaults of 0 are the memset() of the variables
+        return value != None and self.get_default_value(data_type, value) != 0
+
+    def has_struct_default(self, type_name):
+        # True if a member of the struct or of its structs has a default
+        if type_name not in self.struct_defaults:
+            self.struct_defaults[type_name] = False
+            datadef = self.get_struct(type_name)
+            if datadef != None:
+                self.struct_defaults[type_name] = any(
+                    self.has_struct_default(member[1]) if member[0] == 'struct'
+                    else self.has_default(member[0], member[5]) for member in datadef[3])
+        return self.struct_defaults[type_name]
+
+    def get_default_initializer(self, datadef):
+        # the structs members use the CONF_DEFAULT_<type> macros
+        items = []
+        for member in datadef[3]:
+            if member[0] != 'struct':
+                item = self.get_default_text(member[0], member[5])
+                zero = self.has_default(member[0], member[5]) == False
             else:
-                outf.write("\tread_%s(&%s, \"%s\", buffs, nbuffs);\n"
-                           %(vardef[0], vardef[2], vardef[2]))
-            outf.write("\n\treturn 0;\n")
-            outf.write("}\n\n")
+                item = "CONF_DEFAULT_%s" %member[1]
+                zero = self.has_struct_default(member[1]) == False
+            if zero:
+                item = self.get_zero_initializer(member)
+            elif member[4] != None:
+                item = "{%s}" %", ".join([item] * self.get_array_size(member[4]))
+            items.append(item)
+        return "{%s}" %", ".join(items)
 
-        # export function
-        outf.write("int %s_read(const char* file_name)" %self.header_fname)
-        ctext = '''
-{
-	struct config_region regions[NUM_REGIONS_MAX];
-	int nregions;
-	FILE *file;
-	int i;
+    def get_zero_initializer(self, member):
+        # zero braced as the member: {0} is not enough for -Wmissing-braces
+        # if the first member of a struct is a struct or an array
+        item = "0"
+        if member[0] == 'struct':
+            datadef = self.get_struct(member[1])
+            if datadef != None and len(datadef[3]) > 0:
+                item = "{%s}" %", ".join(self.get_zero_initializer(sub_member)
+                                         for sub_member in datadef[3])
+            else:
+                item = "{0}"
+        if member[4] != None:
+            item = "{%s}" %item
+        return item
 
-	file = fopen(file_name, "r");
-	if (file == NULL) {
-		printf("%s:Unable to open file %s for reading.\\n", __func__, file_name);
-		return -1;
-	}
+    def get_var_defaults(self, vardef):
+        # pointer to the default value of the variable, None for a memset()
+        if vardef[0] == 'struct':
+            if self.has_struct_default(vardef[1]) or self.table == True:
+                return "&%s_default" %vardef[1]
+        elif self.has_default(vardef[0], vardef[3]):
+            return "&%s_default" %vardef[2]
+        return None
 
-	nregions = parse_regions(file, regions, NUM_REGIONS_MAX);
-	for (i = 0; i < nregions; i++) {
-'''
-        outf.write(ctext)
+    def get_var_reset(self, vardef, var):
+        # statement setting the variable to its default value
+        defaults = self.get_var_defaults(vardef)
+        if defaults == None:
+            return "memset(%s, 0, sizeof(%s));" %(var, self.get_var_type(vardef))
+        return "memcpy(%s, %s, sizeof(%s));" %(var, defaults, self.get_var_type(vardef))
 
+    def generate_default_source(self, outf):
+        # default values of the variables, before the global variables
+        for datadef in self.datadef_array:
+            if datadef[0] == 'struct' and self.has_struct_default(datadef[1]):
+                outf.write("#define CONF_DEFAULT_%s %s\n"
+                           %(datadef[1], self.get_default_initializer(datadef)))
+        defaults = set()
         for vardef in self.vardef_array:
-            outf.write("\t\tif (strcmp(regions[i].name, \"CONF_%s\") == 0) {\n"
-                       % vardef[2])
-            outf.write("\t\t\tmemset(&%s, 0, sizeof(%s));\n" %(vardef[2], vardef[2]))
-            outf.write("\t\t\tread_%s(regions[i].buffs, regions[i].nbuffs);\n"
-                       % vardef[2])
-            outf.write("\t\t}\n")
+            pointer = self.get_var_defaults(vardef)
+            if pointer == None or pointer in defaults:
+                continue
+            defaults.add(pointer)
+            if vardef[0] != 'struct':
+                outf.write("static const %s %s_default = %s;\n"
+                           %(vardef[0], vardef[2], self.get_default_text(vardef[0], vardef[3])))
+            elif self.has_struct_default(vardef[1]):
+                outf.write("static const struct %s %s_default = CONF_DEFAULT_%s;\n"
+                           %(vardef[1], vardef[1], vardef[1]))
+            else:
+                outf.write("static const struct %s %s_default;\n" %(vardef[1], vardef[1]))
+        if len(defaults) > 0:
+            outf.write("\n")
 
-        outf.write("\t}\n\n")
-        outf.write("\trelease_regions(regions, nregions);\n")
-        outf.write("\tfclose(file);\n\n")
-        outf.write("\treturn 0;\n")
-        outf.write("}\n")
+    def get_var_type(self, vardef):
+        if vardef[0] == 'struct':
+            return "struct %s" %vardef[1]
+        return vardef[0]
 
-    def get_ctype_print_format(self, data_type):
-        if data_type == 'int':
-            return "%d"
-        elif data_type == 'float':
-            return "%f"
-        elif data_type == 'double':
-            return "%lf"
-        elif data_type == 'char':
-            return "%c"
-        else:
-            return  "unknown"
+    def get_var_access(self, var_access):
+        # access to a member of the variable through its pointer in the
+        # read and write functions e.g. abc.xyz[0].x => var->xyz[0].x
+        return "var->%s" %var_access.split(".", 1)[1]
 
-    def generate_datatype_write_function(self, datatype, name, member_array,
-                                         father_name, array_size, outf):
-        if array_size == None:
-            if father_name == None:
-                new_father = name
-            elif name == None:
-                new_father = father_name
+    def get_array_depth(self, member_array):
+        depth = 0
+        for member in member_array:
+            if member[0] != 'struct':
+                member_depth = 0
+            elif len(member[3]) == 0:
+                continue
             else:
-                new_father = "%s.%s" %(father_name, name)
+                member_depth = self.get_array_depth(member[3][0][3])
+            if member[4] != None:
+                member_depth += 1
+            if member_depth > depth:
+                depth = member_depth
+        return depth
 
-            if datatype == 'struct':
-                for member in member_array:
-                    if member[0] == 'struct':
-                        self.generate_datatype_write_function(member[0], member[2],
-                                     member[3], new_father, member[4], outf)
-                    else:
-                        var_access = "%s.%s" % (new_father, member[2])
-                        outf.write("\tfprintf(file, \"\\t%s = %s;\\n\", %s);\n"
-                              %(var_access, self.get_ctype_print_format(member[0]), var_access))
-        else: #Array case
-            if array_size.isnumeric():
-                size = int(array_size)
+    def generate_loop_declaration(self, member_array, tag, outf):
+        depth = self.get_array_depth(member_array)
+        if depth == 0:
+            return
+        outf.write("\tint %s;\n" %", ".join(["i%d" %i for i in range(depth)]))
+        if tag == True:
+            outf.write("\tchar tag[READ_BUFF_SIZE];\n")
+        outf.write("\n")
+
+    def generate_datatype_loop_function(self, function, member_array,
+                                        key, access, nindex, outf):
+        # key: printf format of the config key e.g. abc.xyz[%d]
+        # access: C access to the members e.g. var->xyz[i0].
+        # nindex: number of the loop indexes i0, i1... in use
+        indent = "\t" * (nindex + 1)
+        for member in member_array:
+            if member[0] == 'struct':
+                if member[4] != None:
+                    outf.write("%sfor (i%d = 0; i%d < %s; i%d++) {\n"
+                               %(indent, nindex, nindex, member[4], nindex))
+                    self.generate_datatype_loop_function(function, member[3][0][3],
+                                "%s.%s[%%d]" %(key, member[2]),
+                                "%s%s[i%d]." %(access, member[2], nindex),
+                                nindex + 1, outf)
+                    outf.write("%s}\n" %indent)
+                else:
+                    self.generate_datatype_loop_function(function, member[3][0][3],
+                                "%s.%s" %(key, member[2]),
+                                "%s%s." %(access, member[2]), nindex, outf)
+                continue
+
+            var_key = "%s.%s" %(key, member[2])
+            var_access = "%s%s" %(access, member[2])
+            member_indent = indent
+            member_nindex = nindex
+            if member[4] != None:
+                # the elements of a scalar array are a loop too
+                outf.write("%sfor (i%d = 0; i%d < %s; i%d++) {\n"
+                           %(indent, nindex, nindex, member[4], nindex))
+                var_key += "[%d]"
+                var_access += "[i%d]" %nindex
+                member_indent += "\t"
+                member_nindex += 1
+            self.generate_loop_value(function, member, var_key, var_access,
+                                     member_nindex, member_indent, outf)
+            if member[4] != None:
+                outf.write("%s}\n" %indent)
+
+    def generate_loop_value(self, function, member, var_key, var_access, nindex, indent, outf):
+        # read, write or binary access of a scalar value, in the loops of nindex indexes
+        indexes = "".join([", i%d" %i for i in range(nindex)])
+        if function == 'read':
+            if nindex == 0:
+                outf.write("%sread_%s(&%s, \"%s\", region);\n"
+                           %(indent, self.get_type_id(member[0]), var_access, var_key))
             else:
-                size = self.get_define_value(array_size)
-            if size <= 0:
-                print("No valid define: %s!!!" %array_size)
-                return
-            for i in range(size):
-                if father_name == None:
-                    new_father = "%s[%d]" %(name, i)
-                elif name == None:
-                    new_father = father_name
+                outf.write("%ssnprintf(tag, sizeof(tag), \"%s\"%s);\n"
+                           %(indent, var_key, indexes))
+                outf.write("%sread_%s(&%s, tag, region);\n"
+                           %(indent, self.get_type_id(member[0]), var_access))
+        elif function == 'write':
+            # the indexes of the key are written between its pieces
+            pieces = ("\t%s = " %var_key).split("%d")
+            outf.write("%sif ((sparse == false) || (%s)) {\n"
+                       %(indent, self.get_default_compare(member[0], member[5], var_access)))
+            for i in range(nindex):
+                outf.write(self.generate_writer_puts(indent + "\t", pieces[i]))
+                outf.write("%s\twriter_put_unsigned(writer, i%d);\n" %(indent, i))
+            outf.write(self.generate_write_value(indent + "\t", member[0], pieces[-1],
+                                                 var_access))
+            outf.write("%s}\n" %indent)
+        else:
+            outf.write("%sp = %s_%s(p, &%s);\n"
+                       %(indent, self.get_bin_accessor(function),
+                         self.get_type_id(member[0]), var_access))
+
+    def get_array_size(self, array_size):
+        if array_size.isnumeric():
+            size = int(array_size)
+        else:
+            size = self.get_define_value(array_size)
+        if size <= 0:
+            print("No valid define: %s!!!" %array_size)
+            return 0
+        return size
+
+    def get_member_names(self, member):
+        # name of the member, or of each element of an array member e.g. arr[0]
+        if member[4] == None:
+            return [member[2]]
+        return ["%s[%d]" %(member[2], i) for i in range(self.get_array_size(member[4]))]
+
+    def expand_keys(self, member_array, key, path):
+        # yield the keys in format: (config key, member path in the variable, basic type)
+        for member in member_array:
+            for name in self.get_member_names(member):
+                if path == None:
+                    new_path = name
                 else:
-                    new_father = "%s.%s[%d]" %(father_name, name, i)
+                    new_path = "%s.%s" %(path, name)
+                if member[0] == 'struct':
+                    yield from self.expand_keys(member[3][0][3], "%s.%s" %(key, name), new_path)
+                else:
+                    yield ("%s.%s" %(key, name), new_path, member[0], member[5])
 
-                if datatype == 'struct':
-                    for member in member_array:
-                        if member[0] == 'struct':
-                            self.generate_datatype_write_function(member[0], member[2],
-                                          member[3], new_father, member[4], outf)
-                        else:
-                            var_access = "%s.%s" % (new_father, member[2])
-                            outf.write("\tfprintf(file, \"\\t%s = %s, %s;\\n\");\n"
-                                %(var_access, self.get_ctype_print_format(member[0]), var_access))
+    def get_keys_size(self, member_array):
+        # number of keys and size of the longest key suffix of expand_keys(),
+        # computed without expanding the arrays
+        nkeys = 0
+        key_size = 0
+        for member in member_array:
+            count = 1
+            name_size = len(member[2]) + 1 # '.'
+            if member[4] != None:
+                count = self.get_array_size(member[4])
+                if count == 0:
+                    continue
+                name_size += len("[%d]" %(count - 1))
+            if member[0] == 'struct':
+                (sub_keys, sub_size) = self.get_keys_size(member[3][0][3])
+                nkeys += count * sub_keys
+                key_size = max(key_size, name_size + sub_size)
+            else:
+                nkeys += count
+                key_size = max(key_size, name_size)
+        return (nkeys, key_size)
 
-    def generate_write_function(self, outf):
+    def get_expanded_keys(self, vardef):
+        if vardef[0] != 'struct':
+            yield (vardef[2], None, vardef[0], vardef[3])
+            return
+        datadef = self.get_struct(vardef[1])
+        if datadef != None:
+            yield from self.expand_keys(datadef[3], vardef[2], None)
+
+    # Same hash functions as key_hash() and hash_mix() of the generated C code
+    def key_hash(self, key, seed):
+        value = 2166136261 ^ seed # FNV-1a
+        for c in key.encode():
+            value ^= c
+            value = (value * 16777619) & 0xffffffff
+        return value
+
+    def hash_mix(self, value):
+        value ^= value >> 16
+        value = (value * 0x85ebca6b) & 0xffffffff
+        value ^= value >> 13
+        value = (value * 0xc2b2ae35) & 0xffffffff
+        value ^= value >> 16
+        return value
+
+    def build_perfect_hash(self, keys):
+        # Minimal perfect hash by hash and displace (CHD):
+        # bucket = hash_mix(h) % nbuckets,
+        # slot = hash_mix(h ^ (displace[bucket] * 0x9e3779b9)) % nkeys
+        # with h = key_hash(key, seed). The buckets of a single key are
+        # placed last on the free slots directly: displace = 0x80000000 | slot.
+        # The keys are returned in slot order.
+        nkeys = len(keys)
+        nbuckets = (nkeys + 1) // 2
+        seed = 0
+        while True:
+            hashes = [self.key_hash(key[0], seed) for key in keys]
+            buckets = [[] for i in range(nbuckets)]
+            for i in range(nkeys):
+                buckets[self.hash_mix(hashes[i]) % nbuckets].append(i)
+            order = sorted(range(nbuckets), key=lambda b: len(buckets[b]), reverse=True)
+            displace = [0] * nbuckets
+            slots = [None] * nkeys
+            found = True
+            for b in order:
+                if len(buckets[b]) <= 1:
+                    break
+                for d in range(1, 1 << 16):
+                    mask = (d * 0x9e3779b9) & 0xffffffff
+                    pos = [self.hash_mix(hashes[i] ^ mask) % nkeys for i in buckets[b]]
+                    if len(set(pos)) == len(pos) and all(slots[j] == None for j in pos):
+                        break
+                else:
+                    found = False
+                    break
+                displace[b] = d
+                for i, j in zip(buckets[b], pos):
+                    slots[j] = keys[i]
+            if found == True:
+                free = [j for j in range(nkeys) if slots[j] == None]
+                for b in order:
+                    if len(buckets[b]) == 1:
+                        j = free.pop()
+                        displace[b] = 0x80000000 | j
+                        slots[j] = keys[buckets[b][0]]
+                return (seed, displace, slots)
+            seed += 1
+
+    def generate_stream_read_function(self, outf):
+        seeds = []
         for vardef in self.vardef_array:
-            outf.write("\nstatic int config_write_%s(FILE *file) \n{\n" % vardef[2])
-            if vardef[0] == 'struct':
-                outf.write("\tfprintf(file, \"CONF_%s = {\\n\");\n" %vardef[2])
-                for datadef in self.datadef_array:
-                    if datadef[0] != 'struct' or datadef[1] != vardef[1]:
-                        continue
-                    self.generate_datatype_write_function(datadef[0], vardef[2],
-                                  datadef[3], None, datadef[4], outf)
-                outf.write("\tfprintf(file, \"};\\n\");\n")
-            else:
-                outf.write("\tfprintf(file, \"CONF_%s = %s\\n\", %s);\n"
-                      %(vardef[2], self.get_ctype_print_format(vardef[0]), vardef[2]))
-            outf.write("\treturn 0;\n")
-            outf.write("}\n")
+            (seed, displace, keys) = self.build_perfect_hash(list(self.get_expanded_keys(vardef)))
+            seeds.append(seed)
+            outf.write("static const unsigned int %s_displace[] = {" %vardef[2])
+            for i in range(len(displace)):
+                if i % 8 == 0:
+                    outf.write("\n\t")
+                else:
+                    outf.write(" ")
+                outf.write("%d," %displace[i])
+            outf.write("\n};\n\n")
+            outf.write("static const struct config_key %s_keys[] = {\n" %vardef[2])
+            for key in keys:
+                if key[1] == None:
+                    offset = "0"
+                else:
+                    offset = "offsetof(struct %s, %s)" %(vardef[1], key[1])
+                outf.write("\t{\"%s\", %s, %s},\n"
+                           %(key[0], offset, self.get_primitive_type(key[2])))
+            outf.write("};\n\n")
 
-        # export function
-        outf.write("\nint %s_write(const char* file_name)" %self.header_fname)
+        outf.write("static const struct config_var config_vars[] = {\n")
+        for vardef, seed in zip(self.vardef_array, seeds):
+            defaults = self.get_var_defaults(vardef)
+            outf.write("\t{\"CONF_%s\", sizeof(%s), %s, %s_keys,\n"
+                       "\t\tsizeof(%s_keys) / sizeof(%s_keys[0]), %du, %s_displace,\n"
+                       "\t\tsizeof(%s_displace) / sizeof(%s_displace[0])},\n"
+                       %(vardef[2], self.get_var_type(vardef),
+                         defaults if defaults != None else "NULL", vardef[2], vardef[2], vardef[2],
+                         seed, vardef[2], vardef[2], vardef[2]))
+        outf.write("};\n\n")
 
+        self.generate_reload_state(outf)
         ctext = '''
+static int load_config(const char* file_name, void *const *vars, struct NAME_ctx *ctx,
+					   bool reload, bool *changed)
 {
-	FILE *file = fopen(file_name, "w");
+	struct region_state states[NUM_CONFIG_VARS];
+	struct conf_reader reader;
+	int nchanged = 0;
+	int ninvalid = 0;
+	FILE *file;
+	int i;
+	STATS_TIMER(timer);
+
+	file = fopen(file_name, "r");
 	if (file == NULL) {
-		printf("%s:Unable to open file\\n", __func__);
+		printf("%s:Unable to open file %s for reading.\\n", __func__, file_name);
 		return -1;
 	}
-'''
-        outf.write(ctext)
 
-        for vardef in self.vardef_array:
-            outf.write("\tconfig_write_%s(file);\n" % vardef[2])
-        outf.write("\tfclose(file);\n\n\treturn 0;\n}")
-
-    def generate_static_source(self, outf):
-        ctext = '''
-#define REGION_NBUFF_MAX 128
-#define READ_BUFF_SIZE 512
-#define NUM_REGIONS_MAX 16
-#define REGION_NAME_SIZE 32
-
-typedef enum {
-	PRIMITIVE_TYPE_INT,
-	PRIMITIVE_TYPE_FLOAT,
-	PRIMITIVE_TYPE_DOUBLE
-} primitive_type_t;
-
-struct config_region {
-	char name[REGION_NAME_SIZE];
-	char *buffs[REGION_NBUFF_MAX];
-	int nbuffs;
-};
+	// first pass: only hash the regions, to find the changed ones
+	for (i = 0; i < NUM_CONFIG_VARS; i++) {
+		states[i].found = false;
+		states[i].load = false;
+		states[i].ninvalid = 0;
+	}
+	STATS_START(timer);
+	if (reload == true) {
+		conf_reader_init(&reader, file);
+		parse_stream(&reader, config_vars, vars, NUM_CONFIG_VARS, states);
+		rewind(file);
+	}
+	for (i = 0; i < NUM_CONFIG_VARS; i++) {
+		states[i].load = (reload == false) || ((states[i].found == true) &&
+			((ctx->region_loaded[i] == false) || (ctx->region_hashes[i] != states[i].hash)));
+		if (states[i].load == true) {
+			nchanged++;
+		}
+		states[i].found = false;
+	}
 
-static int read_primitive_type(void *var, primitive_type_t type,
-		const char *tag, char **buffs, int nbuffs)
-{
-	int i;
+	if (nchanged > 0) {
+		conf_reader_init(&reader, file);
+		parse_stream(&reader, config_vars, vars, NUM_CONFIG_VARS, states);
+	}
+	STATS_STOP(parse_time, timer);
+	fclose(file);
 
-	for (i = 0; i < nbuffs; i++) {
-		if ((buffs[i] == NULL) || (strstr(buffs[i], tag) == NULL)) {continue;}
-		char *endtag;
-		char *value = strstr(buffs[i], "=");
-		if (value == NULL) {
-			printf("%s:Missing value: %s\\n", __func__, buffs[i]);
-			return -1;
-		}
-		value += 1; //skip '='
-		endtag = strstr(value, ";");
-		if (endtag == NULL) {
-			printf("%s:Missing ';': %s\\n", __func__, buffs[i]);
-			return -1;
+	nchanged = 0;
+	for (i = 0; i < NUM_CONFIG_VARS; i++) {
+		if ((states[i].load == false) || (states[i].found == false)) {
+			continue;
 		}
-		*endtag = 0;
-		if (type == PRIMITIVE_TYPE_INT) {
-			*(int *)var = atoi(value);
-		} else if (type == PRIMITIVE_TYPE_FLOAT) {
-			*(float *)var = atof(value);
-		} else if (type == PRIMITIVE_TYPE_DOUBLE) {
-			*(double *)var = atof(value);
-		} else {
-			printf("%s:not support type=%d\\n", __func__, type);
-			return -1;
+		ctx->region_hashes[i] = states[i].hash;
+		ctx->region_loaded[i] = true;
+		if (changed != NULL) {
+			changed[i] = true;
 		}
-		return 0;
+		ninvalid += states[i].ninvalid;
+		nchanged++;
 	}
 
-	return -1;
+	// the valid values are loaded, the invalid ones are reported
+	return (ninvalid > 0) ? -1 : nchanged;
 }
 '''
-        outf.write(ctext)
-        data_types = []
-        for basic_type in self.basic_types_array:
-            if basic_type == 'int':
-                data_types.append(('int', 'PRIMITIVE_TYPE_INT'))
-            elif basic_type == 'float':
-                data_types.append(('float', 'PRIMITIVE_TYPE_FLOAT'))
-            elif basic_type == 'double':
-                data_types.append(('double', 'PRIMITIVE_TYPE_DOUBLE'))
+        outf.write(ctext.replace("NAME", self.header_fname))
+        self.generate_read_var_function(outf)
+        self.generate_export_read_function(outf)
 
-        for data_type in data_types:
-            outf.write("\nstatic int read_%s(%s *var, const char *tag, "
-                       "char **buffs, int nbuffs) \n{\n"
-                       %(data_type[0], data_type[0]))
-            outf.write("\treturn read_primitive_type((void*)var, %s, tag, buffs, nbuffs);\n}\n"
-                       %(data_type[1]))
+    def generate_reload_state(self, outf):
+        outf.write("#define NUM_CONFIG_VARS %d\n\n" %len(self.vardef_array))
+        outf.write("// the functions work on a table of pointers to the variables,\n")
+        outf.write("// the global variables or the members of a struct %s\n" %self.header_fname)
+        outf.write("static void *const config_globals[NUM_CONFIG_VARS] = {\n")
+        for vardef in self.vardef_array:
+            outf.write("\t&%s,\n" %vardef[2])
+        outf.write("};\n\n")
+        outf.write("// region hashes of the last load of the global variables\n")
+        outf.write("static struct %s_ctx config_ctx;\n\n" %self.header_fname)
+        outf.write("static void get_config_vars(const struct %s *config, void **vars)\n{\n"
+                   %self.header_fname)
+        for n, vardef in enumerate(self.vardef_array):
+            outf.write("\tvars[%d] = (void *)&config->%s;\n" %(n, vardef[2]))
+        outf.write("}\n")
 
-        ctext = '''
-static void remove_space(char *str)
+    def generate_read_var_function(self, outf):
+        ctext = """
+static int get_config_var(const char *var_name)
 {
-	int i = 0, j = 0;
+	int i;
 
-	for (i = 0; str[i] != 0; i++) {
-		if ((str[i] != ' ') && (str[i] != '\\t') && (str[i] != '\\n')) {
-			if (j != i) {
-				str[j] = str[i];
-			}
-			j++;
+	for (i = 0; i < NUM_CONFIG_VARS; i++) {
+		if (strcmp(NAMES[i] + 5, var_name) == 0) {
+			return i;
 		}
 	}
-	str[j] = 0;
+
+	return -1;
 }
 
-static int conf_readline(FILE *inf, char *line, int size)
+static bool skip_space(const char *line, int len, int *i)
 {
-	char a;
-	int res;
-	int rp = 0;
-
-	if (feof(inf)) {return 0;}
+	while ((*i < len) && ((line[*i] == ' ') || (line[*i] == '\\t') ||
+						  (line[*i] == '\\r') || (line[*i] == '\\n'))) {
+		(*i)++;
+	}
 
-	while ((res = fread(&a, 1, 1, inf))) {
-		if (res < 0) {
-			if (feof(inf)) {
-				return 0;
-			} else {
-				printf("%s:error to read config file\\n", __func__);
-				return -1;
-			}
-		}
+	return *i < len;
+}
 
-		if (a == '\\n') {break;}
+// line "CONF_<var> = {" starting the region name
+static bool match_region_header(const char *line, int len, const char *name)
+{
+	int name_len = strlen(name);
+	int i = 0;
 
-		line[rp++] = a;
-		if (rp >= size-1) {
-			printf("%s:too long line\\n", __func__);
-			return -1;
-		}
+	if ((skip_space(line, len, &i) == false) || (len - i < name_len) ||
+		(memcmp(line + i, name, name_len) != 0)) {
+		return false;
 	}
+	i += name_len;
+	if ((skip_space(line, len, &i) == false) || (line[i] != '=')) {
+		return false;
+	}
+	i++;
+
+	return skip_space(line, len, &i) && (line[i] == '{');
+}
+
+// line "};" ending a region
+static bool match_region_end(const char *line, int len)
+{
+	int i = 0;
+
+	if ((skip_space(line, len, &i) == false) || (line[i] != '}')) {
+		return false;
+	}
+	i++;
+
+	return skip_space(line, len, &i) && (line[i] == ';');
+}
+"""
+        names = "config_vars[i].name" if self.stream == True else "config_region_names[i]"
+        outf.write(ctext.replace("NAMES[i]", names))
+        if self.mmap == True:
+            ctext = """
+// offset and size of the last region name of the file, the last one wins
+// as in parse_regions(), size is 0 if the region is not found
+static void find_region(struct config_map *map, const char *name, size_t *offset, size_t *size)
+{
+	const char *line;
+	size_t start = 0;
+	size_t pos = 0;
+	bool in_region = false;
+	int len;
+
+	*offset = 0;
+	*size = 0;
+	while (map_readline(map, &pos, &line, &len)) {
+		if (in_region == true) {
+			if (match_region_end(line, len)) {
+				*size = pos - *offset;
+				in_region = false;
+			}
+		} else if (match_region_header(line, len, name)) {
+			*offset = start;
+			in_region = true;
+		}
+		start = pos;
+	}
+	if (in_region == true) {
+		*size = map->size - *offset;
+	}
+	if (*size > map->size - *offset) {
+		*size = map->size - *offset; //no newline at the end of the file
+	}
+}
+"""
+        else:
+            ctext = """
+// offset and size of the last region name of the file, the last one wins
+// as in parse_regions(), size is 0 if the region is not found
+static int find_region(FILE *file, const char *name, long *offset, long *size)
+{
+	struct conf_reader reader;
+	char buff[READ_BUFF_SIZE];
+	long pos = 0;
+	bool in_region = false;
+	int len;
+
+	*offset = 0;
+	*size = 0;
+	conf_reader_init(&reader, file);
+	while ((len = conf_readline(&reader, buff, sizeof(buff))) > 0) {
+		if (in_region == true) {
+			if (match_region_end(buff, len - 1)) {
+				*size = pos + len - *offset;
+				in_region = false;
+			}
+		} else if (match_region_header(buff, len - 1, name)) {
+			*offset = pos;
+			in_region = true;
+		}
+		pos += len;
+	}
+	if (in_region == true) {
+		*size = pos - *offset;
+	}
+
+	return (len < 0) ? -1 : 0;
+}
+"""
+        outf.write(ctext)
+
+        outf.write("\nstatic int load_config_var(const char* file_name, const char *var_name,\n"
+                   "\t\t\t\t\t\t   void *const *vars, struct %s_ctx *ctx)" %self.header_fname)
+        if self.mmap == True:
+            ctext = """
+{
+	struct config_region region;
+	struct config_map map;
+	struct config_map window;
+	size_t offset;
+	size_t size;
+	int n;
+"""
+        elif self.stream == True:
+            ctext = """
+{
+	struct region_state state;
+	struct conf_reader reader;
+	FILE *file;
+	long offset;
+	long size;
+	int n;
+"""
+        else:
+            ctext = """
+{
+	struct config_region region;
+	struct conf_reader reader;
+	FILE *file;
+	long offset;
+	long size;
+	int n;
+"""
+        ctext += """	STATS_TIMER(timer);
+
+	n = get_config_var(var_name);
+	if (n < 0) {
+		printf("%s:unknown variable %s\\n", __func__, var_name);
+		return -1;
+	}
+"""
+        if self.mmap == True:
+            ctext += """	if (config_map_open(&map, file_name) < 0) {
+		printf("%s:Unable to open file %s for reading.\\n", __func__, file_name);
+		return -1;
+	}
+
+	STATS_START(timer);
+	find_region(&map, config_region_names[n], &offset, &size);
+	if (size == 0) {
+		printf("%s:no region %s in %s\\n", __func__, config_region_names[n], file_name);
+		config_map_close(&map);
+		return -1;
+	}
+	// only the lines of the region are parsed
+	window.data = map.data + offset;
+	window.size = size;
+	window.mapped = false;
+	parse_regions(&window, &region, &config_region_names[n],
+				  &config_region_capacities[n], 1);
+	STATS_STOP(parse_time, timer);
+"""
+        else:
+            ctext += """	file = fopen(file_name, "r");
+	if (file == NULL) {
+		printf("%s:Unable to open file %s for reading.\\n", __func__, file_name);
+		return -1;
+	}
+
+	STATS_START(timer);
+	if ((find_region(file, NAME, &offset, &size) < 0) || (size == 0)) {
+		printf("%s:no region %s in %s\\n", __func__, NAME, file_name);
+		fclose(file);
+		return -1;
+	}
+	if (fseek(file, offset, SEEK_SET) < 0) {
+		printf("%s:Unable to seek in %s\\n", __func__, file_name);
+		fclose(file);
+		return -1;
+	}
+	// only the lines of the region are read
+	conf_reader_init(&reader, file);
+	reader.limit = size;
+"""
+            if self.stream == True:
+                ctext = ctext.replace("NAME", "config_vars[n].name")
+                ctext += """	state.found = false;
+	state.load = true;
+	state.ninvalid = 0;
+	parse_stream(&reader, &config_vars[n], &vars[n], 1, &state);
+	STATS_STOP(parse_time, timer);
+	fclose(file);
+	if (state.found == false) {
+		return -1;
+	}
+	ctx->region_hashes[n] = state.hash;
+	ctx->region_loaded[n] = true;
+
+	return (state.ninvalid > 0) ? -1 : 0;
+}
+"""
+            else:
+                ctext = ctext.replace("NAME", "config_region_names[n]")
+                ctext += """	parse_regions(&reader, &region, &config_region_names[n],
+				  &config_region_capacities[n], 1);
+	STATS_STOP(parse_time, timer);
+"""
+        outf.write(ctext)
+
+        if self.stream == False:
+            outf.write("\tSTATS_START(timer);\n")
+            outf.write("\tif (region.name[0] != 0) {\n")
+            outf.write("\t\tswitch (n) {\n")
+            for n, vardef in enumerate(self.vardef_array):
+                outf.write("\t\tcase %d:\n" %n)
+                outf.write("\t\t\t%s\n" %self.get_var_reset(vardef, "vars[%d]" %n))
+                outf.write("\t\t\tread_%s(vars[%d], &region);\n" %(vardef[2], n))
+                outf.write("\t\t\tbreak;\n")
+            outf.write("\t\t}\n")
+            outf.write("\t\tctx->region_hashes[n] = region.hash;\n")
+            outf.write("\t\tctx->region_loaded[n] = true;\n")
+            outf.write("\t}\n")
+            outf.write("\tSTATS_STOP(fields_time, timer);\n")
+            outf.write("\tn = ((region.name[0] != 0) && (region.ninvalid == 0)) ? 0 : -1;\n\n")
+            outf.write("\trelease_regions(&region, 1);\n")
+            if self.mmap == True:
+                outf.write("\tconfig_map_close(&map);\n\n")
+            else:
+                outf.write("\tfclose(file);\n\n")
+            outf.write("\treturn n;\n}\n")
+
+        ctext = """
+int NAME_read_var_r(struct NAME *config, struct NAME_ctx *ctx, const char* file_name,
+					const char *var_name)
+{
+	void *vars[NUM_CONFIG_VARS];
+
+	get_config_vars(config, vars);
+
+	return load_config_var(file_name, var_name, vars, ctx);
+}
+
+int NAME_read_var(const char* file_name, const char *var_name)
+{
+	return load_config_var(file_name, var_name, config_globals, &config_ctx);
+}
+"""
+        outf.write(ctext.replace("NAME", self.header_fname))
+
+    def generate_export_read_function(self, outf):
+        ctext = '''
+void NAME_ctx_init(struct NAME_ctx *ctx)
+{
+	memset(ctx, 0, sizeof(*ctx));
+}
+
+int NAME_read_r(struct NAME *config, struct NAME_ctx *ctx, const char* file_name)
+{
+	void *vars[NUM_CONFIG_VARS];
+
+	get_config_vars(config, vars);
+
+	return (load_config(file_name, vars, ctx, false, NULL) < 0) ? -1 : 0;
+}
+
+int NAME_reload_r(struct NAME *config, struct NAME_ctx *ctx, const char* file_name,
+				  bool *changed)
+{
+	void *vars[NUM_CONFIG_VARS];
+
+	get_config_vars(config, vars);
+	if (changed != NULL) {
+		memset(changed, 0, NUM_CONFIG_VARS * sizeof(bool));
+	}
+
+	return load_config(file_name, vars, ctx, true, changed);
+}
+
+int NAME_read(const char* file_name)
+{
+	return (load_config(file_name, config_globals, &config_ctx, false, NULL) < 0) ? -1 : 0;
+}
+
+int NAME_reload(const char* file_name, bool *changed)
+{
+	if (changed != NULL) {
+		memset(changed, 0, NUM_CONFIG_VARS * sizeof(bool));
+	}
+
+	return load_config(file_name, config_globals, &config_ctx, true, changed);
+}
+'''
+        outf.write(ctext.replace("NAME", self.header_fname))
+
+    def get_define_value(self, name):
+        if name in self.macro_dict:
+            return int(self.macro_dict[name])
+        return -1
+
+    def generate_read_function(self, outf):
+        if self.stream == True:
+            self.generate_stream_read_function(outf)
+            return
+        for vardef in self.vardef_array:
+            outf.write("static int read_%s(%s *var, struct config_region *region) \n{\n"
+                       %(vardef[2], self.get_var_type(vardef)))
+            if vardef[0] == 'struct':
+                datadef = self.get_struct(vardef[1])
+                if datadef == None:
+                    pass
+                elif self.table == True:
+                    outf.write("\tchar tag[READ_BUFF_SIZE] = \"%s\";\n\n" %vardef[2])
+                    outf.write("\tread_fields(%s_fields, %d, (char *)var, tag, %d, region);\n"
+                               %(datadef[1], len(datadef[3]), len(vardef[2])))
+                elif self.loop == True:
+                    self.generate_loop_declaration(datadef[3], True, outf)
+                    self.generate_datatype_loop_function('read', datadef[3],
+                                  vardef[2], "var->", 0, outf)
+                else:
+                    outf.writelines(self.generate_datatype_read_function(datadef[0], vardef[2],
+                                    datadef[3], None, datadef[4]))
+            else:
+                outf.write("\tread_%s(var, \"%s\", region);\n"
+                           %(self.get_type_id(vardef[0]), vardef[2]))
+            outf.write("\n\treturn 0;\n")
+            outf.write("}\n\n")
+
+        self.generate_reload_state(outf)
+        outf.write("\nstatic const char *const config_region_names[NUM_CONFIG_VARS] = {\n")
+        for vardef in self.vardef_array:
+            outf.write("\t\"CONF_%s\",\n" %vardef[2])
+        outf.write("};\n")
+        outf.write("\n// initial lines of each region, grown on demand\n")
+        outf.write("static const int config_region_capacities[NUM_CONFIG_VARS] = {\n")
+        for vardef in self.vardef_array:
+            outf.write("\t%d,\n" %self.get_region_capacity(vardef))
+        outf.write("};\n")
+        outf.write("\nstatic int load_config(const char* file_name, void *const *vars,\n"
+                   "\t\t\t\t\t   struct %s_ctx *ctx, bool reload, bool *changed)" %self.header_fname)
+        if self.mmap == True:
+            ctext = '''
+{
+	struct config_region *regions;
+	struct config_map map;
+	int nchanged = 0;
+	int ninvalid = 0;
+	STATS_TIMER(timer);
+
+	if (config_map_open(&map, file_name) < 0) {
+		printf("%s:Unable to open file %s for reading.\\n", __func__, file_name);
+		return -1;
+	}
+	// on the heap, NUM_CONFIG_VARS has no bound
+	regions = malloc(NUM_CONFIG_VARS * sizeof(regions[0]));
+	STATS_ADD(mallocs, 1);
+	if (regions == NULL) {
+		printf("%s:unable to malloc\\n", __func__);
+		config_map_close(&map);
+		return -1;
+	}
+
+	STATS_START(timer);
+	parse_regions(&map, regions, config_region_names, config_region_capacities,
+				  NUM_CONFIG_VARS);
+	STATS_STOP(parse_time, timer);
+	STATS_START(timer);
+'''
+        else:
+            ctext = '''
+{
+	struct config_region *regions;
+	struct conf_reader reader;
+	int nchanged = 0;
+	int ninvalid = 0;
+	FILE *file;
+	STATS_TIMER(timer);
+
+	file = fopen(file_name, "r");
+	if (file == NULL) {
+		printf("%s:Unable to open file %s for reading.\\n", __func__, file_name);
+		return -1;
+	}
+	// on the heap, NUM_CONFIG_VARS has no bound
+	regions = malloc(NUM_CONFIG_VARS * sizeof(regions[0]));
+	STATS_ADD(mallocs, 1);
+	if (regions == NULL) {
+		printf("%s:unable to malloc\\n", __func__);
+		fclose(file);
+		return -1;
+	}
+
+	conf_reader_init(&reader, file);
+	STATS_START(timer);
+	parse_regions(&reader, regions, config_region_names, config_region_capacities,
+				  NUM_CONFIG_VARS);
+	STATS_STOP(parse_time, timer);
+	STATS_START(timer);
+'''
+        outf.write(ctext)
+
+        for n, vardef in enumerate(self.vardef_array):
+            outf.write("\tif ((regions[%d].name[0] != 0) && ((reload == false) ||\n"
+                       "\t\t(ctx->region_loaded[%d] == false) ||\n"
+                       "\t\t(ctx->region_hashes[%d] != regions[%d].hash))) {\n"
+                       %(n, n, n, n))
+            outf.write("\t\t%s\n" %self.get_var_reset(vardef, "vars[%d]" %n))
+            outf.write("\t\tread_%s(vars[%d], &regions[%d]);\n" %(vardef[2], n, n))
+            outf.write("\t\tninvalid += regions[%d].ninvalid;\n" %n)
+            outf.write("\t\tctx->region_hashes[%d] = regions[%d].hash;\n" %(n, n))
+            outf.write("\t\tctx->region_loaded[%d] = true;\n" %n)
+            outf.write("\t\tif (changed != NULL) {\n\t\t\tchanged[%d] = true;\n\t\t}\n" %n)
+            outf.write("\t\tnchanged++;\n")
+            outf.write("\t}\n")
+        outf.write("\tSTATS_STOP(fields_time, timer);\n")
+
+        outf.write("\n")
+        outf.write("\trelease_regions(regions, NUM_CONFIG_VARS);\n")
+        outf.write("\tfree(regions);\n")
+        if self.mmap == True:
+            outf.write("\tconfig_map_close(&map);\n\n")
+        else:
+            outf.write("\tfclose(file);\n\n")
+        outf.write("\t// the valid values are loaded, the invalid ones are reported\n")
+        outf.write("\treturn (ninvalid > 0) ? -1 : nchanged;\n")
+        outf.write("}\n")
+        self.generate_read_var_function(outf)
+        self.generate_export_read_function(outf)
+
+    def get_ctype_print_format(self, data_type):
+        if data_type in SCALAR_TYPES:
+            return SCALAR_TYPES[data_type][4]
+        else:
+            return  "unknown"
+
+    def generate_datatype_write_function(self, datatype, name, member_array,
+                                         father_name, array_size):
+        if array_size == None:
+            if father_name == None:
+                new_father = name
+            elif name == None:
+                new_father = father_name
+            else:
+                new_father = "%s.%s" %(father_name, name)
+
+            if datatype == 'struct':
+                for member in member_array:
+                    if member[0] == 'struct':
+                        yield from self.generate_datatype_write_function(member[0], member[2],
+                                     member[3], new_father, member[4])
+                    else:
+                        for member_name in self.get_member_names(member):
+                            var_access = "%s.%s" % (new_father, member_name)
+                            yield self.generate_sparse_write_value("\t", member,
+                                        "\t%s = " %var_access, self.get_var_access(var_access))
+        else: #Array case
+            if array_size.isnumeric():
+                size = int(array_size)
+            else:
+                size = self.get_define_value(array_size)
+            if size <= 0:
+                print("No valid define: %s!!!" %array_size)
+                return
+            for i in range(size):
+                if father_name == None:
+                    new_father = "%s[%d]" %(name, i)
+                elif name == None:
+                    new_father = father_name
+                else:
+                    new_father = "%s.%s[%d]" %(father_name, name, i)
+
+                if datatype == 'struct':
+                    for member in member_array:
+                        if member[0] == 'struct':
+                            yield from self.generate_datatype_write_function(member[0], member[2],
+                                          member[3], new_father, member[4])
+                        else:
+                            for member_name in self.get_member_names(member):
+                                var_access = "%s.%s" % (new_father, member_name)
+                                yield self.generate_sparse_write_value("\t", member,
+                                            "\t%s = " %var_access, self.get_var_access(var_access))
+
+    def generate_writer_puts(self, indent, text):
+        return ("%swriter_puts(writer, \"%s\", %d);\n"
+                %(indent, text.replace("\t", "\\t").replace("\n", "\\n"), len(text)))
+
+    def generate_write_value(self, indent, data_type, key, value):
+        # key is the text before the value e.g. "\tabc.a = "
+        return ("%swrite_%s(writer, \"%s\", %d, %s);\n"
+                %(indent, self.get_writer_kind(data_type), key.replace("\t", "\\t"),
+                  len(key), value))
+
+    def generate_sparse_write_value(self, indent, member, key, value):
+        # in a sparse write, only the values different from the default
+        return ("%sif ((sparse == false) || (%s)) {\n%s%s}\n"
+                %(indent, self.get_default_compare(member[0], member[5], value),
+                  self.generate_write_value(indent + "\t", member[0], key, value), indent))
+
+    def get_writer_kind(self, data_type):
+        # writer_put_<kind>() of the values of the type
+        return {'signed': 'signed', 'unsigned': 'unsigned', 'bool': 'unsigned',
+                'float': 'double', 'double': 'double'}[SCALAR_TYPES[data_type][1]]
+
+    def generate_write_function(self, outf):
+        for vardef in self.vardef_array:
+            outf.write("\nstatic int config_write_%s(const %s *var, bool sparse,\n"
+                       "\t\t\t\t\t\t\tstruct conf_writer *writer) \n{\n"
+                       %(vardef[2], self.get_var_type(vardef)))
+            if vardef[0] == 'struct':
+                datadef = self.get_struct(vardef[1])
+                if datadef == None:
+                    pass
+                elif self.table == True:
+                    outf.write("\tchar tag[READ_BUFF_SIZE] = \"%s\";\n\n" %vardef[2])
+                elif self.loop == True:
+                    self.generate_loop_declaration(datadef[3], False, outf)
+                outf.write(self.generate_writer_puts("\t", "CONF_%s = {\n" %vardef[2]))
+                if datadef == None:
+                    pass
+                elif self.table == True:
+                    outf.write("\twrite_fields(%s_fields, %d, (char *)var,\n"
+                               "\t\t\t\t (sparse == true) ? (const char *)%s : NULL, tag, %d, writer);\n"
+                               %(datadef[1], len(datadef[3]), self.get_var_defaults(vardef),
+                                 len(vardef[2])))
+                elif self.loop == True:
+                    self.generate_datatype_loop_function('write', datadef[3],
+                                  vardef[2], "var->", 0, outf)
+                else:
+                    outf.writelines(self.generate_datatype_write_function(datadef[0], vardef[2],
+                                    datadef[3], None, datadef[4]))
+                outf.write(self.generate_writer_puts("\t", "};\n"))
+            else:
+                # same region as in the .conf template, read back by <name>_read()
+                outf.write(self.generate_writer_puts("\t", "CONF_%s = {\n" %vardef[2]))
+                outf.write(self.generate_sparse_write_value("\t", (vardef[0], None, vardef[2],
+                           [], None, vardef[3]), "\t%s = " %vardef[2], "*var"))
+                outf.write(self.generate_writer_puts("\t", "};\n"))
+            outf.write("\treturn 0;\n")
+            outf.write("}\n")
+
+        outf.write("\nstatic int write_config(const char* file_name, void *const *vars, bool sparse)")
+        ctext = '''
+{
+	struct conf_writer writer;
+	int res;
+	STATS_TIMER(timer);
+
+	STATS_START(timer);
+	if (writer_init(&writer, CONF_WRITE_SIZE) == false) {
+		printf("%s:unable to malloc\\n", __func__);
+		return -1;
+	}
+'''
+        outf.write(ctext)
+
+        for n, vardef in enumerate(self.vardef_array):
+            outf.write("\tconfig_write_%s(vars[%d], sparse, &writer);\n" %(vardef[2], n))
+        ctext = '''
+	if (writer.error) {
+		printf("%s:unable to malloc\\n", __func__);
+		res = -1;
+	} else {
+		res = write_file_atomic(file_name, writer.buff, writer.len);
+	}
+	free(writer.buff);
+	STATS_STOP(write_time, timer);
+
+	return res;
+}
+'''
+        outf.write(ctext)
+        # export functions
+        ctext = '''
+int NAME_write_r(const struct NAME *config, const char* file_name)
+{
+	void *vars[NUM_CONFIG_VARS];
+
+	get_config_vars(config, vars);
+
+	return write_config(file_name, vars, false);
+}
+
+int NAME_write_sparse_r(const struct NAME *config, const char* file_name)
+{
+	void *vars[NUM_CONFIG_VARS];
+
+	get_config_vars(config, vars);
+
+	return write_config(file_name, vars, true);
+}
+
+int NAME_write(const char* file_name)
+{
+	return write_config(file_name, config_globals, false);
+}
+
+int NAME_write_sparse(const char* file_name)
+{
+	return write_config(file_name, config_globals, true);
+}
+
+void NAME_set_defaults(struct NAME *config)
+{
+'''
+        outf.write(ctext.replace("NAME", self.header_fname))
+        for vardef in self.vardef_array:
+            outf.write("\t%s\n" %self.get_var_reset(vardef, "&config->%s" %vardef[2]))
+        ctext = '''}'''
+        outf.write(ctext.replace("NAME", self.header_fname))
+
+    def get_value_width(self, data_type):
+        # widest integer, typical float value: the write buffer grows if needed
+        (kind, size) = (SCALAR_TYPES[data_type][1], SCALAR_TYPES[data_type][5])
+        if kind == 'signed':
+            return len(str(-(1 << (8 * size - 1))))
+        elif kind == 'unsigned':
+            return len(str((1 << (8 * size)) - 1))
+        elif kind == 'bool':
+            return 1
+        return 12
+
+    def get_write_keys_size(self, member_array):
+        # number of keys and size of their key suffix and value in the
+        # written .conf file, computed without expanding the arrays
+        nkeys = 0
+        size = 0
+        for member in member_array:
+            count = 1
+            name_size = len(member[2]) + 1 # '.'
+            if member[4] != None:
+                count = self.get_array_size(member[4])
+                if count == 0:
+                    continue
+                name_size += len("[%d]" %(count - 1))
+            if member[0] == 'struct':
+                (sub_keys, sub_size) = self.get_write_keys_size(member[3][0][3])
+                nkeys += count * sub_keys
+                size += count * (sub_keys * name_size + sub_size)
+            else:
+                nkeys += count
+                size += count * (name_size + self.get_value_width(member[0]))
+        return (nkeys, size)
+
+    def get_write_size(self):
+        size = 0
+        for vardef in self.vardef_array:
+            (nkeys, keys_size) = (1, self.get_value_width(vardef[0])
+                                  if vardef[0] != 'struct' else 0)
+            if vardef[0] == 'struct':
+                datadef = self.get_struct(vardef[1])
+                if datadef == None:
+                    (nkeys, keys_size) = (0, 0)
+                else:
+                    (nkeys, keys_size) = self.get_write_keys_size(datadef[3])
+            # CONF_<var> = {, };, then \t<var><suffix> = <value>;
+            size += len(vardef[2]) + 14 + nkeys * (len(vardef[2]) + 6) + keys_size
+        return size
+
+    def generate_region_struct(self, line_type, lines, nlines, outf):
+        outf.write("\nstruct config_region {\n")
+        outf.write("\tchar name[REGION_NAME_SIZE];\n")
+        outf.write("\t%s*%s; //allocated with the first line\n" %(line_type, lines))
+        outf.write("\tint %s;\n" %nlines)
+        outf.write("\tint max_%s;\n" %nlines)
+        outf.write("\tint capacity; //initial lines, grown on demand\n")
+        ctext = '''	unsigned int hash; //FNV-1a of the region lines, for the reload
+	int ninvalid; //invalid values found by read_primitive_type()
+	// open addressing hash table of the keys (text before '='),
+	// each slot holds a line index + 1, 0 means empty
+	int *index;
+'''
+        outf.write(ctext)
+        outf.write("\tint index_size; //power of 2, at least 2 * max_%s\n" %nlines)
+        outf.write("};\n")
+
+    def generate_region_storage(self, line_type, lines, nlines, outf):
+        # the storage of a region is on the heap and sized to its variable, so
+        # the stack use of the readers does not grow with the schema
+        ctext = '''
+static void region_clear(struct config_region *region)
+{
+	region->name[0] = 0;
+	region->NLINES = 0;
+	region->ninvalid = 0;
+	if (region->index_size > 0) {
+		memset(region->index, 0, region->index_size * sizeof(int));
+	}
+}
+
+static void region_init(struct config_region *region, int capacity)
+{
+	region->LINES = NULL;
+	region->max_NLINES = 0;
+	region->capacity = capacity;
+	region->index = NULL;
+	region->index_size = 0;
+	region_clear(region);
+}
+
+static void region_free(struct config_region *region)
+{
+	free(region->LINES);
+	free(region->index);
+	region_init(region, region->capacity);
+}
+'''
+        ctext += '''
+// make room for one more line, the index is rebuilt when the region grows
+static bool region_reserve(struct config_region *region)
+{
+	LINE_TYPE*LINES;
+	int max_NLINES;
+	int index_size;
+	int i;
+
+	if (region->NLINES < region->max_NLINES) {
+		return true;
+	}
+	// more lines than keys, like obsolete or duplicated keys, are kept
+	max_NLINES = (region->max_NLINES == 0) ? region->capacity : 2 * region->max_NLINES;
+'''
+        ctext += '''	index_size = 2;
+	while (index_size < 2 * max_NLINES) {
+		index_size *= 2;
+	}
+	LINES = realloc(region->LINES, max_NLINES * sizeof(region->LINES[0]));
+	STATS_ADD(mallocs, 1);
+	if (LINES == NULL) {
+		printf("%s:unable to malloc\\n", __func__);
+		return false;
+	}
+	region->LINES = LINES;
+	free(region->index);
+	region->index = calloc(index_size, sizeof(int));
+	STATS_ADD(mallocs, 1);
+	if (region->index == NULL) {
+		printf("%s:unable to malloc\\n", __func__);
+		region->index_size = 0;
+		region->max_NLINES = 0;
+		region->NLINES = 0;
+		return false;
+	}
+	region->index_size = index_size;
+	region->max_NLINES = max_NLINES;
+	for (i = 0; i < region->NLINES; i++) {
+		region_index_add(region, i);
+	}
+
+	return true;
+}
+'''
+        ctext = ctext.replace("NLINES", nlines).replace("LINES", lines)
+        outf.write(ctext.replace("LINE_TYPE", line_type))
+
+    def generate_region_source(self, outf):
+        self.generate_region_struct("char *", "buffs", "nbuffs", outf)
+        ctext = '''
+static unsigned int hash_update(unsigned int hash, const char *data, int len)
+{
+	int i;
+
+	for (i = 0; i < len; i++) {
+		hash ^= (unsigned char)data[i];
+		hash *= 16777619u;
+	}
+
+	return hash;
+}
+
+static unsigned int key_hash(const char *key, int len)
+{
+	return hash_update(2166136261u, key, len); //FNV-1a
+}
+
+static int region_index_slot(struct config_region *region, const char *key, int len)
+{
+	unsigned int slot = key_hash(key, len) & (region->index_size - 1);
+	char *line;
+
+	while (region->index[slot] != 0) {
+		line = region->buffs[region->index[slot] - 1];
+		STATS_ADD(key_compares, 1);
+		if ((strncmp(line, key, len) == 0) &&
+			((line[len] == '=') || (line[len] == 0))) {
+			break;
+		}
+		slot = (slot + 1) & (region->index_size - 1);
+	}
+
+	return slot;
+}
+
+static void region_index_add(struct config_region *region, int n)
+{
+	char *line = region->buffs[n];
+	char *value = strchr(line, '=');
+	int len = (value == NULL) ? (int)strlen(line) : value - line;
+	int slot = region_index_slot(region, line, len);
+
+	// the first line wins on duplicated keys
+	if (region->index[slot] == 0) {
+		region->index[slot] = n + 1;
+	}
+}
+
+static char *region_lookup(struct config_region *region, const char *tag)
+{
+	int slot;
+
+	if (region->index_size == 0) {
+		STATS_ADD(key_misses, 1);
+		return NULL; //empty region
+	}
+	slot = region_index_slot(region, tag, strlen(tag));
+	if (region->index[slot] == 0) {
+		STATS_ADD(key_misses, 1);
+		return NULL;
+	}
+
+	return region->buffs[region->index[slot] - 1];
+}
+
+static int read_primitive_type(void *var, primitive_type_t type,
+		const char *tag, struct config_region *region)
+{
+	char *line;
+	char *endtag;
+	char *value;
+
+	line = region_lookup(region, tag);
+	if (line == NULL) {
+		return -1;
+	}
+	value = strstr(line, "=");
+	if (value == NULL) {
+		printf("%s:Missing value: %s\\n", __func__, line);
+		region->ninvalid++;
+		return -1;
+	}
+	value += 1; //skip '='
+	endtag = strstr(value, ";");
+	if (endtag == NULL) {
+		printf("%s:Missing ';': %s\\n", __func__, line);
+		region->ninvalid++;
+		return -1;
+	}
+	*endtag = 0;
+	if (parse_value(var, type, value, endtag) == false) {
+		printf("%s:Invalid value: %s\\n", __func__, line);
+		region->ninvalid++;
+		return -1;
+	}
+
+	return 0;
+}
+'''
+        outf.write(ctext)
+        self.generate_region_storage("char *", "buffs", "nbuffs", outf)
+
+    def generate_reader_source(self, outf):
+        ctext = '''
+struct conf_reader {
+	FILE *file;
+	char buff[CONF_READER_SIZE];
+	int pos;
+	int len;
+	size_t limit; //bytes left to read from the file
+};
+
+static void remove_space(char *str)
+{
+	int i = 0, j = 0;
+
+	for (i = 0; str[i] != 0; i++) {
+		if ((str[i] != ' ') && (str[i] != '\\t') && (str[i] != '\\n')) {
+			if (j != i) {
+				str[j] = str[i];
+			}
+			j++;
+		}
+	}
+	str[j] = 0;
+}
+
+static void conf_reader_init(struct conf_reader *reader, FILE *file)
+{
+	reader->file = file;
+	reader->pos = 0;
+	reader->len = 0;
+	reader->limit = SIZE_MAX;
+}
+
+static int conf_readline(struct conf_reader *reader, char *line, int size)
+{
+	char *start;
+	char *eol;
+	int rp = 0;
+	int n;
+
+	while (true) {
+		if (reader->pos == reader->len) {
+			reader->pos = 0;
+			reader->len = fread(reader->buff, 1, (reader->limit < CONF_READER_SIZE) ?
+								reader->limit : CONF_READER_SIZE, reader->file);
+			reader->limit -= reader->len;
+			STATS_ADD(bytes, reader->len);
+			if (reader->len == 0) {
+				if (ferror(reader->file)) {
+					printf("%s:error to read config file\\n", __func__);
+					return -1;
+				}
+				if (rp == 0) {return 0;} //end of file
+				break;
+			}
+		}
+
+		start = reader->buff + reader->pos;
+		eol = memchr(start, '\\n', reader->len - reader->pos);
+		n = (eol == NULL) ? (reader->len - reader->pos) : (eol - start);
+		if (rp + n >= size-1) {
+			printf("%s:too long line\\n", __func__);
+			return -1;
+		}
+		memcpy(line + rp, start, n);
+		rp += n;
+		reader->pos += n;
+
+		if (eol != NULL) {
+			reader->pos++; //skip '\\n'
+			break;
+		}
+	}
+
+	line[rp++] = 0;
+	STATS_ADD(lines, 1);
+
+	return rp;
+}
+'''
+        outf.write(ctext)
+
+    def generate_loader_source(self, outf):
+        ctext = '''
+static int load_region(struct config_region *region, char *name, int name_size,
+					   struct conf_reader *reader, char *bufread, int bufsize)
+{
+	int result = 0;
+	bool end_region = false;
+	int size;
+
+	if (name_size >= REGION_NAME_SIZE) {
+		printf("%s:name region too long: %s\\n", __func__, name);
+		return -1;
+	}
+	memset(region->name, 0, REGION_NAME_SIZE);
+	memcpy(region->name, name, name_size);
+	region->hash = 2166136261u;
+
+	while (conf_readline(reader, bufread, bufsize) > 0) {
+		remove_space(bufread);
+		if ((bufread[0] == '#') || (bufread[0] == 0)) {
+			continue;
+		}
+		if (strstr(bufread, "};") == bufread) {
+			end_region = true;
+			break;
+		}
+		size = strlen(bufread) + 1;
+		region->hash = hash_update(region->hash, bufread, size);
+		if (region_reserve(region) == false) {
+			return -1;
+		}
+		region->buffs[region->nbuffs] = malloc(size);
+		STATS_ADD(mallocs, 1);
+		if (region->buffs[region->nbuffs] == NULL) {
+			printf("%s:unable to malloc\\n", __func__);
+			break;
+		}
+		memset(region->buffs[region->nbuffs], 0, size);
+		memcpy(region->buffs[region->nbuffs], bufread, size);
+		region_index_add(region, region->nbuffs);
+		region->nbuffs++;
+	}
+
+	if (end_region == false) {
+		printf("%s:Missing '};' region: %s\\n", __func__, region->name);
+		result = -1;
+	}
+
+	return result;
+}
+
+static void release_region(struct config_region *region)
+{
+	int i;
+
+	for (i = 0; i < region->nbuffs; i++) {
+		free(region->buffs[i]);
+	}
+	region_clear(region);
+}
+
+// regions[n] is the region of names[n] with capacities[n] lines, its name is empty
+// if it is not in the file
+static void parse_regions(struct conf_reader *reader, struct config_region *regions,
+						  const char *const *names, const int *capacities, int nnames)
+{
+	char region_name[REGION_NAME_SIZE];
+	char buff[READ_BUFF_SIZE];
+	char *temp;
+	int n;
+	STATS_TIMER(timer);
+
+	for (n = 0; n < nnames; n++) {
+		region_init(&regions[n], capacities[n]);
+	}
+
+	while (conf_readline(reader, buff, sizeof(buff)) > 0) {
+		remove_space(buff);
+		if (buff[0] == '#') {
+			continue;
+		}
+		if (strstr(buff, "CONF_") != buff) {
+			continue;
+		}
+		temp = strstr(buff, "={");
+		if (temp == NULL) {
+			continue;
+		}
+
+		*temp = 0; //Set NULL terminate
+		for (n = 0; n < nnames; n++) {
+			if (strcmp(names[n], buff) == 0) {
+				break;
+			}
+		}
+		if (n == nnames) {
+			continue; //not a config variable
+		}
+		strncpy(region_name, buff, REGION_NAME_SIZE-1);
+
+		// the last region wins on duplicated names
+		release_region(&regions[n]);
+		STATS_START(timer);
+		if (load_region(&regions[n], buff, temp - buff,
+						reader, buff, sizeof(buff)) < 0) {
+			printf("%s:Unable to load region: %s\\n", __func__, region_name);
+			release_region(&regions[n]);
+		}
+		STATS_STOP(load_time, timer);
+	}
+}
+
+static void release_regions(struct config_region *regions, int nregions)
+{
+	int i;
+
+	for (i = 0; i < nregions; i++) {
+		release_region(&regions[i]);
+		region_free(&regions[i]);
+	}
+}
+
+'''
+        outf.write(ctext)
+
+    def generate_mmap_region_source(self, outf):
+        ctext = '''
+struct config_map {
+	const char *data;
+	size_t size;
+	bool mapped; //false: data is a single malloc arena
+};
+
+struct config_line {
+	const char *key; //slice of the file, not null terminated
+	int key_len;
+	const char *value; //text after '=', NULL if missing
+	int value_len;
+};
+
+'''
+        outf.write(ctext)
+        self.generate_region_struct("struct config_line ", "lines", "nlines", outf)
+        ctext = '''
+static unsigned int hash_update(unsigned int hash, const char *data, int len)
+{
+	int i;
+
+	for (i = 0; i < len; i++) {
+		hash ^= (unsigned char)data[i];
+		hash *= 16777619u;
+	}
+
+	return hash;
+}
+
+static unsigned int key_hash(const char *key, int len)
+{
+	return hash_update(2166136261u, key, len); //FNV-1a
+}
+
+static int region_index_slot(struct config_region *region, const char *key, int len)
+{
+	unsigned int slot = key_hash(key, len) & (region->index_size - 1);
+	struct config_line *line;
+
+	while (region->index[slot] != 0) {
+		line = &region->lines[region->index[slot] - 1];
+		STATS_ADD(key_compares, 1);
+		if ((line->key_len == len) && (memcmp(line->key, key, len) == 0)) {
+			break;
+		}
+		slot = (slot + 1) & (region->index_size - 1);
+	}
+
+	return slot;
+}
+
+static void region_index_add(struct config_region *region, int n)
+{
+	struct config_line *line = &region->lines[n];
+	int slot = region_index_slot(region, line->key, line->key_len);
+
+	// the first line wins on duplicated keys
+	if (region->index[slot] == 0) {
+		region->index[slot] = n + 1;
+	}
+}
+
+static struct config_line *region_lookup(struct config_region *region, const char *tag)
+{
+	int slot;
+
+	if (region->index_size == 0) {
+		STATS_ADD(key_misses, 1);
+		return NULL; //empty region
+	}
+	slot = region_index_slot(region, tag, strlen(tag));
+	if (region->index[slot] == 0) {
+		STATS_ADD(key_misses, 1);
+		return NULL;
+	}
+
+	return &region->lines[region->index[slot] - 1];
+}
+
+static int read_primitive_type(void *var, primitive_type_t type,
+		const char *tag, struct config_region *region)
+{
+	struct config_line *line;
+	const char *semicolon;
+	const char *value;
+	const char *end;
+
+	line = region_lookup(region, tag);
+	if (line == NULL) {
+		return -1;
+	}
+	if (line->value == NULL) {
+		printf("%s:Missing value: %.*s\\n", __func__, line->key_len, line->key);
+		region->ninvalid++;
+		return -1;
+	}
+	semicolon = memchr(line->value, ';', line->value_len);
+	if (semicolon == NULL) {
+		printf("%s:Missing ';': %.*s\\n", __func__, line->key_len, line->key);
+		region->ninvalid++;
+		return -1;
+	}
+	// the value is parsed in place up to ';', the file is not modified
+	value = line->value;
+	end = semicolon;
+	while ((value < end) && ((*value == ' ') || (*value == '\\t'))) {
+		value++;
+	}
+	while ((end > value) && ((end[-1] == ' ') || (end[-1] == '\\t'))) {
+		end--;
+	}
+	if (parse_value(var, type, value, end) == false) {
+		printf("%s:Invalid value: %.*s\\n", __func__, (int)(semicolon - line->key), line->key);
+		region->ninvalid++;
+		return -1;
+	}
+
+	return 0;
+}
+'''
+        outf.write(ctext)
+        self.generate_region_storage("struct config_line ", "lines", "nlines", outf)
+
+    def generate_mmap_loader_source(self, outf):
+        ctext = '''
+#ifdef CONF_USE_MMAP
+static int config_map_mmap(struct config_map *map, const char *file_name)
+{
+	struct stat st;
+	void *data;
+	int fd;
+
+	fd = open(file_name, O_RDONLY);
+	if (fd < 0) {
+		return -1;
+	}
+	if ((fstat(fd, &st) < 0) || (st.st_size == 0)) {
+		close(fd);
+		return -1;
+	}
+	data = mmap(NULL, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+	close(fd);
+	if (data == MAP_FAILED) {
+		return -1;
+	}
+	map->data = data;
+	map->size = st.st_size;
+	map->mapped = true;
+	STATS_ADD(bytes, map->size);
+
+	return 0;
+}
+#endif
+
+static int config_map_open(struct config_map *map, const char *file_name)
+{
+	FILE *file;
+	char *data;
+	long size;
+
+	map->data = NULL;
+	map->size = 0;
+	map->mapped = false;
+
+#ifdef CONF_USE_MMAP
+	if (config_map_mmap(map, file_name) == 0) {
+		return 0;
+	}
+#endif
+	// no mmap: load the whole file into a single arena
+	file = fopen(file_name, "rb");
+	if (file == NULL) {
+		return -1;
+	}
+	if ((fseek(file, 0, SEEK_END) < 0) || ((size = ftell(file)) < 0)) {
+		fclose(file);
+		return -1;
+	}
+	rewind(file);
+	data = malloc(size + 1);
+	STATS_ADD(mallocs, 1);
+	if (data == NULL) {
+		printf("%s:unable to malloc\\n", __func__);
+		fclose(file);
+		return -1;
+	}
+	map->size = fread(data, 1, size, file);
+	STATS_ADD(bytes, map->size);
+	map->data = data;
+	fclose(file);
+
+	return 0;
+}
+
+static void config_map_close(struct config_map *map)
+{
+#ifdef CONF_USE_MMAP
+	if (map->mapped == true) {
+		munmap((void *)map->data, map->size);
+		return;
+	}
+#endif
+	free((void *)map->data);
+}
+
+static bool is_space(char c)
+{
+	return (c == ' ') || (c == '\\t') || (c == '\\r') || (c == '\\n');
+}
+
+static void trim_slice(const char **str, int *len)
+{
+	while ((*len > 0) && is_space((*str)[0])) {
+		(*str)++;
+		(*len)--;
+	}
+	while ((*len > 0) && is_space((*str)[*len - 1])) {
+		(*len)--;
+	}
+}
+
+// next trimmed line of the file at *pos, return false at the end of file
+static bool map_readline(struct config_map *map, size_t *pos,
+						 const char **line, int *len)
+{
+	const char *start;
+	const char *eol;
+
+	if (*pos >= map->size) {
+		return false;
+	}
+	start = map->data + *pos;
+	eol = memchr(start, '\\n', map->size - *pos);
+	*len = (eol == NULL) ? (int)(map->size - *pos) : (int)(eol - start);
+	*pos += *len + 1;
+	*line = start;
+	trim_slice(line, len);
+	STATS_ADD(lines, 1);
+
+	return true;
+}
+
+static bool is_region_end(const char *line, int len)
+{
+	if ((len == 0) || (line[0] != '}')) {
+		return false;
+	}
+	line++;
+	len--;
+	trim_slice(&line, &len);
+
+	return (len > 0) && (line[0] == ';');
+}
+
+static int load_region(struct config_region *region, const char *name, int name_size,
+					   struct config_map *map, size_t *pos)
+{
+	struct config_line *cline;
+	const char *line;
+	const char *value;
+	bool end_region = false;
+	int len;
+	int i;
+
+	if (name_size >= REGION_NAME_SIZE) {
+		printf("%s:name region too long: %.*s\\n", __func__, name_size, name);
+		return -1;
+	}
+	memset(region->name, 0, REGION_NAME_SIZE);
+	memcpy(region->name, name, name_size);
+	region->hash = 2166136261u;
+
+	while (map_readline(map, pos, &line, &len)) {
+		if ((len == 0) || (line[0] == '#')) {
+			continue;
+		}
+		if (is_region_end(line, len)) {
+			end_region = true;
+			break;
+		}
+		// the spaces are not part of the content, as in remove_space()
+		for (i = 0; i < len; i++) {
+			if (is_space(line[i]) == false) {
+				region->hash = hash_update(region->hash, &line[i], 1);
+			}
+		}
+		region->hash = hash_update(region->hash, "", 1);
+		if (region_reserve(region) == false) {
+			return -1;
+		}
+		cline = &region->lines[region->nlines];
+		value = memchr(line, '=', len);
+		cline->key = line;
+		if (value == NULL) {
+			cline->key_len = len;
+			cline->value = NULL;
+			cline->value_len = 0;
+		} else {
+			cline->key_len = value - line;
+			cline->value = value + 1;
+			cline->value_len = len - (value + 1 - line);
+		}
+		trim_slice(&cline->key, &cline->key_len);
+		region_index_add(region, region->nlines);
+		region->nlines++;
+	}
+
+	if (end_region == false) {
+		printf("%s:Missing '};' region: %s\\n", __func__, region->name);
+		return -1;
+	}
+
+	return 0;
+}
+
+// regions[n] is the region of names[n] with capacities[n] lines, its name is empty
+// if it is not in the file
+static void parse_regions(struct config_map *map, struct config_region *regions,
+						  const char *const *names, const int *capacities, int nnames)
+{
+	const char *line;
+	const char *temp;
+	size_t pos = 0;
+	int name_len;
+	int len;
+	int n;
+	STATS_TIMER(timer);
+
+	for (n = 0; n < nnames; n++) {
+		region_init(&regions[n], capacities[n]);
+	}
+
+	while (map_readline(map, &pos, &line, &len)) {
+		if ((len < 5) || (memcmp(line, "CONF_", 5) != 0)) {
+			continue;
+		}
+		temp = memchr(line, '=', len);
+		if (temp == NULL) {
+			continue;
+		}
+		name_len = temp - line;
+		len -= name_len + 1;
+		temp++;
+		trim_slice(&temp, &len);
+		if ((len == 0) || (temp[0] != '{')) {
+			continue;
+		}
+		trim_slice(&line, &name_len);
+		for (n = 0; n < nnames; n++) {
+			if ((strncmp(names[n], line, name_len) == 0) && (names[n][name_len] == 0)) {
+				break;
+			}
+		}
+		if (n == nnames) {
+			continue; //not a config variable
+		}
+
+		// the last region wins on duplicated names
+		region_clear(&regions[n]);
+		STATS_START(timer);
+		if (load_region(&regions[n], line, name_len, map, &pos) < 0) {
+			printf("%s:Unable to load region: %.*s\\n", __func__, name_len, line);
+			region_clear(&regions[n]);
+		}
+		STATS_STOP(load_time, timer);
+	}
+}
+
+static void release_regions(struct config_region *regions, int nregions)
+{
+	int i;
+
+	for (i = 0; i < nregions; i++) {
+		region_free(&regions[i]);
+	}
+}
+
+'''
+        outf.write(ctext)
+
+    def generate_stream_source(self, outf):
+        ctext = '''
+struct config_key {
+	const char *key;
+	size_t offset; //offset of the field in the variable
+	primitive_type_t type;
+};
+
+// keys is a minimal perfect hash table generated by config_tool.py:
+// bucket = hash_mix(h) % nbuckets
+// slot = hash_mix(h ^ (displace[bucket] * 0x9e3779b9)) % nkeys
+// with h = key_hash(key, seed), or slot = displace[bucket] & 0x7fffffff
+// if the high bit is set
+struct config_var {
+	const char *name; //region name
+	size_t size;
+	const void *defaults; //value of a reset, NULL for 0
+	const struct config_key *keys;
+	int nkeys;
+	unsigned int seed;
+	const unsigned int *displace;
+	int nbuckets;
+};
+
+struct region_state {
+	unsigned int hash; //FNV-1a of the region lines
+	int ninvalid; //invalid values of the region
+	bool found;
+	bool load; //false: only hash the region, keep the variable
+};
+
+static unsigned int key_hash(const char *key, unsigned int seed)
+{
+	unsigned int hash = 2166136261u ^ seed; //FNV-1a
+
+	while (*key != 0) {
+		hash ^= (unsigned char)*key++;
+		hash *= 16777619u;
+	}
+
+	return hash;
+}
+
+static unsigned int hash_update(unsigned int hash, const char *data, int len)
+{
+	int i;
+
+	for (i = 0; i < len; i++) {
+		hash ^= (unsigned char)data[i];
+		hash *= 16777619u;
+	}
+
+	return hash;
+}
+
+static unsigned int hash_mix(unsigned int hash)
+{
+	hash ^= hash >> 16;
+	hash *= 0x85ebca6bu;
+	hash ^= hash >> 13;
+	hash *= 0xc2b2ae35u;
+	hash ^= hash >> 16;
+
+	return hash;
+}
+
+static const struct config_key *lookup_key(const struct config_var *var, const char *key)
+{
+	unsigned int displace;
+	unsigned int hash;
+	unsigned int slot;
+
+	if (var->nkeys == 0) {
+		STATS_ADD(key_misses, 1);
+		return NULL;
+	}
+	hash = key_hash(key, var->seed);
+	displace = var->displace[hash_mix(hash) % var->nbuckets];
+	if (displace & 0x80000000u) {
+		slot = displace & 0x7fffffffu; //bucket of a single key
+	} else {
+		slot = hash_mix(hash ^ (displace * 0x9e3779b9u)) % var->nkeys;
+	}
+	STATS_ADD(key_compares, 1);
+	if (strcmp(var->keys[slot].key, key) != 0) {
+		STATS_ADD(key_misses, 1);
+		return NULL;
+	}
+
+	return &var->keys[slot];
+}
+
+// bases: the variables of the regions, in the vars order.
+// A region is read in a scratch copy of its variable, copied to the variable
+// and marked as found only at its '};': a region left open is dropped.
+static void parse_stream(struct conf_reader *reader, const struct config_var *vars,
+						 void *const *bases, int nvars, struct region_state *states)
+{
+	char buff[READ_BUFF_SIZE];
+	const struct config_var *var = NULL;
+	char *scratch = NULL;
+	size_t scratch_size = 0;
+	char *base = NULL;
+	const struct config_key *key;
+	struct region_state *state = NULL;
+	unsigned int hash = 0;
+	int ninvalid = 0;
+	bool in_region = false;
+	char *value;
+	char *endtag;
+	int i;
+
+	for (i = 0; i < nvars; i++) {
+		if ((states[i].load == true) && (vars[i].size > scratch_size)) {
+			scratch_size = vars[i].size;
+		}
+	}
+	if (scratch_size > 0) {
+		scratch = malloc(scratch_size);
+		STATS_ADD(mallocs, 1);
+		if (scratch == NULL) {
+			printf("%s:unable to malloc\\n", __func__);
+			return;
+		}
+	}
+
+	while (conf_readline(reader, buff, sizeof(buff)) > 0) {
+		remove_space(buff);
+		if ((buff[0] == '#') || (buff[0] == 0)) {
+			continue;
+		}
+
+		if (in_region == false) {
+			if (strstr(buff, "CONF_") != buff) {
+				continue;
+			}
+			value = strstr(buff, "={");
+			if (value == NULL) {
+				continue;
+			}
+			*value = 0; //Set NULL terminate
+			in_region = true;
+			var = NULL; //NULL: unknown region, skipped
+			state = NULL;
+			for (i = 0; i < nvars; i++) {
+				if (strcmp(vars[i].name, buff) == 0) {
+					state = &states[i];
+					hash = 2166136261u;
+					ninvalid = 0;
+					if (state->load == true) {
+						var = &vars[i];
+						base = bases[i];
+						if (var->defaults != NULL) {
+							memcpy(scratch, var->defaults, var->size);
+						} else {
+							memset(scratch, 0, var->size);
+						}
+					}
+					break;
+				}
+			}
+			continue;
+		}
+
+		if (strstr(buff, "};") == buff) {
+			in_region = false;
+			if (state != NULL) {
+				state->found = true;
+				state->hash = hash;
+				state->ninvalid = ninvalid;
+			}
+			if (var != NULL) {
+				memcpy(base, scratch, var->size);
+			}
+			continue;
+		}
+		if (state != NULL) {
+			hash = hash_update(hash, buff, strlen(buff) + 1);
+		}
+		if (var == NULL) {
+			continue;
+		}
+		// the key is the text before '=', or the whole line without '='
+		value = strstr(buff, "=");
+		if (value != NULL) {
+			*value = 0;
+		}
+		key = lookup_key(var, buff);
+		if (key == NULL) {
+			continue;
+		}
+		if (value == NULL) {
+			printf("%s:Missing value: %s\\n", __func__, buff);
+			ninvalid++;
+			continue;
+		}
+		value += 1; //skip '='
+		endtag = strstr(value, ";");
+		if (endtag == NULL) {
+			printf("%s:Missing ';': %s\\n", __func__, buff);
+			ninvalid++;
+			continue;
+		}
+		*endtag = 0;
+		if (parse_value(scratch + key->offset, key->type, value, endtag) == false) {
+			printf("%s:Invalid value: %s = %s\\n", __func__, buff, value);
+			ninvalid++;
+		}
+	}
+
+	if (in_region == true) {
+		printf("%s:Missing '};' region: %s\\n", __func__,
+			   (state != NULL) ? vars[state - states].name : "unknown");
+	}
+	free(scratch);
+}
+
+'''
+        outf.write(ctext)
+
+    def get_region_capacity(self, vardef):
+        # lines of the region of a variable, one per key
+        if vardef[0] != 'struct':
+            return 1
+        datadef = self.get_struct(vardef[1])
+        if datadef == None:
+            return 1
+        nkeys = max(1, self.get_keys_size(datadef[3])[0])
+        if self.dynamic == True:
+            # grown on demand from a few lines, for the sparse .conf files
+            return min(nkeys, 8)
+        return nkeys
+
+    def get_capacities(self):
+        # longest key and longest region name
+        key_size = 0
+        name_size = 0
+        for vardef in self.vardef_array:
+            datadef = self.get_struct(vardef[1])
+            if vardef[0] != 'struct':
+                size = 0
+            elif datadef != None:
+                size = self.get_keys_size(datadef[3])[1]
+            else:
+                size = 0
+            key_size = max(key_size, len(vardef[2]) + size)
+            name_size = max(name_size, len("CONF_%s" %vardef[2]) + 1)
+        # room for the value and the spaces after the longest key
+        read_size = max(512, key_size + 128)
+        return (read_size, max(32, name_size))
+
+    def generate_static_source(self, outf):
+        (read_size, name_size) = self.get_capacities()
+        outf.write("\n#define READ_BUFF_SIZE %d\n" %read_size)
+        outf.write("#define REGION_NAME_SIZE %d\n" %name_size)
+        outf.write("#define CONF_WRITE_SIZE %d //estimated size of the written .conf file\n"
+                   %self.get_write_size())
+        outf.write("#define CONF_READER_SIZE 4096\n\n")
+        outf.write("typedef enum {\n")
+        outf.write(",\n".join(["\t%s" %self.get_primitive_type(data_type)
+                               for data_type in self.get_used_scalar_types()]))
+        outf.write("\n} primitive_type_t;\n")
+        self.generate_stats_source(outf)
+        self.generate_value_parser_source(outf)
+        self.generate_writer_source(outf)
+        if self.stream == True:
+            self.generate_reader_source(outf)
+            self.generate_stream_source(outf)
+            if self.table == True:
+                self.generate_table_source(outf)
+            if self.binary == True:
+                self.generate_bin_source(outf)
+            return
+        if self.mmap == True:
+            self.generate_mmap_region_source(outf)
+        else:
+            self.generate_region_source(outf)
+        for data_type in self.get_used_scalar_types():
+            if self.table == True and self.is_global_basic_type(data_type) == False:
+                # only the global variables of basic type use read_<type>()
+                continue
+            outf.write("\nstatic int read_%s(%s *var, const char *tag, "
+                       "struct config_region *region) \n{\n"
+                       %(self.get_type_id(data_type), data_type))
+            outf.write("\treturn read_primitive_type((void*)var, %s, tag, region);\n}\n"
+                       %self.get_primitive_type(data_type))
+
+        if self.mmap == True:
+            self.generate_mmap_loader_source(outf)
+        else:
+            self.generate_reader_source(outf)
+            self.generate_loader_source(outf)
+        if self.table == True:
+            self.generate_table_source(outf)
+        if self.binary == True:
+            self.generate_bin_source(outf)
+
+    def generate_stats_source(self, outf):
+        ctext = '''
+// -DCONF_STATS: count the work of the reader and writer, see NAME_stats().
+// The counters are per thread, so the _r functions stay reentrant
+#ifdef CONF_STATS
+#if defined(__STDC_VERSION__) && (__STDC_VERSION__ >= 201112L)
+#define CONF_STATS_LOCAL _Thread_local
+#elif defined(__GNUC__)
+#define CONF_STATS_LOCAL __thread
+#elif defined(_MSC_VER)
+#define CONF_STATS_LOCAL __declspec(thread)
+#else
+#define CONF_STATS_LOCAL //no thread local storage: shared by the threads
+#endif
+static CONF_STATS_LOCAL struct NAME_stats config_stats;
+
+// <time.h> declares clock_gettime() only with the POSIX feature macros, which
+// -std=c99 does not set: then the C11 timespec_get() or the processor time
+#if defined(CLOCK_MONOTONIC)
+#define CONF_STATS_TIMESPEC
+#define stats_now(now) clock_gettime(CLOCK_MONOTONIC, (now))
+#elif defined(TIME_UTC)
+#define CONF_STATS_TIMESPEC
+#define stats_now(now) timespec_get((now), TIME_UTC)
+#endif
+
+#ifdef CONF_STATS_TIMESPEC
+typedef struct timespec stats_time;
+#else
+typedef clock_t stats_time;
+#define stats_now(now) (*(now) = clock())
+#endif
+
+static double stats_elapsed(const stats_time *start)
+{
+	stats_time now;
+
+	stats_now(&now);
+#ifdef CONF_STATS_TIMESPEC
+	return (double)(now.tv_sec - start->tv_sec) +
+		   (double)(now.tv_nsec - start->tv_nsec) / 1e9;
+#else
+	return (double)(now - *start) / CLOCKS_PER_SEC;
+#endif
+}
+
+#define STATS_ADD(counter, n) (config_stats.counter += (n))
+#define STATS_TIMER(timer) stats_time timer
+#define STATS_START(timer) stats_now(&(timer))
+#define STATS_STOP(phase, timer) (config_stats.phase += stats_elapsed(&(timer)))
+#else
+#define STATS_ADD(counter, n)
+#define STATS_TIMER(timer)
+#define STATS_START(timer)
+#define STATS_STOP(phase, timer)
+#endif
+'''
+        outf.write(ctext.replace("NAME", self.header_fname))
+
+    def generate_stats_function(self, outf):
+        ctext = '''
+#ifdef CONF_STATS
+const struct NAME_stats *NAME_stats(void)
+{
+	return &config_stats;
+}
+
+void NAME_stats_reset(void)
+{
+	memset(&config_stats, 0, sizeof(config_stats));
+}
+#endif
+'''
+        outf.write(ctext.replace("NAME", self.header_fname))
+
+    def generate_value_parser_source(self, outf):
+        data_types = self.get_used_scalar_types()
+        kinds = set(SCALAR_TYPES[data_type][1] for data_type in data_types)
+        ctext = '''
+// The values are parsed by hand, independently of the locale: the whole text
+// between str and end must be the value, a syntax error or a value out of
+// the range of the type is rejected and the variable is left unchanged.
+'''
+        outf.write(ctext)
+        if 'signed' in kinds or 'unsigned' in kinds:
+            ctext = '''
+// decimal or 0x hexadecimal digits of a value up to max
+static bool parse_digits(const char *str, const char *end, unsigned long long max,
+						 unsigned long long *value)
+{
+	unsigned long long result = 0;
+	unsigned int base = 10;
+	unsigned int digit;
+
+	if ((end - str > 2) && (str[0] == '0') && ((str[1] == 'x') || (str[1] == 'X'))) {
+		base = 16;
+		str += 2;
+	}
+	if (str == end) {
+		return false;
+	}
+	for (; str < end; str++) {
+		if ((*str >= '0') && (*str <= '9')) {
+			digit = *str - '0';
+		} else if ((base == 16) && ((*str | 0x20) >= 'a') && ((*str | 0x20) <= 'f')) {
+			digit = (*str | 0x20) - 'a' + 10;
+		} else {
+			return false;
+		}
+		if ((digit > max) || (result > (max - digit) / base)) {
+			return false; //overflow
+		}
+		result = result * base + digit;
+	}
+	*value = result;
+
+	return true;
+}
+'''
+            outf.write(ctext)
+        if 'signed' in kinds:
+            ctext = '''
+static bool parse_signed(const char *str, const char *end, long long min, long long max,
+						 long long *value)
+{
+	unsigned long long magnitude;
+
+	if ((str < end) && (*str == '-')) {
+		// -(min + 1) + 1: the magnitude of min does not fit in a long long
+		if (parse_digits(str + 1, end, (min < 0) ?
+						 (unsigned long long)-(min + 1) + 1 : 0, &magnitude) == false) {
+			return false;
+		}
+		*value = (magnitude == 0) ? 0 : -(long long)(magnitude - 1) - 1;
+		return true;
+	}
+	if ((str < end) && (*str == '+')) {
+		str++;
+	}
+	if (parse_digits(str, end, (unsigned long long)max, &magnitude) == false) {
+		return false;
+	}
+	*value = (long long)magnitude;
+
+	return true;
+}
+'''
+            outf.write(ctext)
+        if 'unsigned' in kinds:
+            ctext = '''
+static bool parse_unsigned(const char *str, const char *end, unsigned long long max,
+						   unsigned long long *value)
+{
+	if ((str < end) && (*str == '+')) {
+		str++;
+	}
+
+	return parse_digits(str, end, max, value);
+}
+'''
+            outf.write(ctext)
+        if 'bool' in kinds or 'float' in kinds or 'double' in kinds:
+            ctext = '''
+// case insensitive comparison of the text with a lower case word
+static bool match_word(const char *str, const char *end, const char *word)
+{
+	while ((str < end) && (*word != 0) && ((*str | 0x20) == *word)) {
+		str++;
+		word++;
+	}
+
+	return (str == end) && (*word == 0);
+}
+'''
+            outf.write(ctext)
+        if 'bool' in kinds:
+            ctext = '''
+static bool parse_bool(const char *str, const char *end, bool *value)
+{
+	if (match_word(str, end, "1") || match_word(str, end, "true")) {
+		*value = true;
+	} else if (match_word(str, end, "0") || match_word(str, end, "false")) {
+		*value = false;
+	} else {
+		return false;
+	}
+
+	return true;
+}
+'''
+            outf.write(ctext)
+        if 'float' in kinds or 'double' in kinds:
+            ctext = '''
+// the powers of ten exactly represented by a double
+static const double pow10_table[] = {
+	1e0, 1e1, 1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10, 1e11,
+	1e12, 1e13, 1e14, 1e15, 1e16, 1e17, 1e18, 1e19, 1e20, 1e21, 1e22
+};
+
+// decimal value with an optional fraction and exponent, inf or nan.
+// Up to 2^53 with a power of ten up to 22, the value is exact with a single
+// multiplication or division, the other values go through strtod().
+static bool parse_double(const char *str, const char *end, double *value)
+{
+	char buff[READ_BUFF_SIZE];
+	const char *start = str;
+	const char *point;
+	size_t point_len;
+	size_t len;
+	unsigned long long mantissa = 0;
+	bool negative = false;
+	bool exact = true;
+	int ndigits = 0;
+	int exponent = 0;
+	int exp_value = 0;
+	bool exp_negative = false;
+	char *stop;
+	double result;
+
+	if ((str < end) && ((*str == '-') || (*str == '+'))) {
+		negative = (*str == '-');
+		str++;
+	}
+	if (match_word(str, end, "inf") || match_word(str, end, "infinity")) {
+		*value = negative ? -HUGE_VAL : HUGE_VAL;
+		return true;
+	}
+	if (match_word(str, end, "nan")) {
+		*value = NAN;
+		return true;
+	}
+	for (; (str < end) && (*str >= '0') && (*str <= '9'); str++, ndigits++) {
+		if (mantissa < 1000000000000000000ull) {
+			mantissa = mantissa * 10 + (*str - '0');
+		} else {
+			exponent++; //digit beyond the mantissa
+			exact = exact && (*str == '0');
+		}
+	}
+	if ((str < end) && (*str == '.')) {
+		for (str++; (str < end) && (*str >= '0') && (*str <= '9'); str++, ndigits++) {
+			if (mantissa < 1000000000000000000ull) {
+				mantissa = mantissa * 10 + (*str - '0');
+				exponent--;
+			} else {
+				exact = exact && (*str == '0');
+			}
+		}
+	}
+	if (ndigits == 0) {
+		return false;
+	}
+	if ((str < end) && ((*str == 'e') || (*str == 'E'))) {
+		str++;
+		if ((str < end) && ((*str == '-') || (*str == '+'))) {
+			exp_negative = (*str == '-');
+			str++;
+		}
+		if ((str == end) || (*str < '0') || (*str > '9')) {
+			return false;
+		}
+		for (; (str < end) && (*str >= '0') && (*str <= '9'); str++) {
+			if (exp_value < 100000) {
+				exp_value = exp_value * 10 + (*str - '0');
+			}
+		}
+		exponent += exp_negative ? -exp_value : exp_value;
+	}
+	if (str != end) {
+		return false; //trailing garbage
+	}
+
+	if (mantissa == 0) {
+		*value = negative ? -0.0 : 0.0;
+		return true;
+	}
+	if (exact && (mantissa <= (1ull << 53)) && (exponent >= -22) && (exponent <= 22)) {
+		result = (double)mantissa;
+		if (exponent < 0) {
+			result /= pow10_table[-exponent];
+		} else {
+			result *= pow10_table[exponent];
+		}
+		*value = negative ? -result : result;
+		return true;
+	}
+
+	// the syntax is checked already, strtod() rounds the long values.
+	// strtod() reads the decimal point of the locale, put it in place of the '.'
+	point = localeconv()->decimal_point;
+	point_len = strlen(point);
+	if ((size_t)(end - start) + point_len >= sizeof(buff)) {
+		return false;
+	}
+	for (len = 0; start < end; start++) {
+		if (*start == '.') {
+			memcpy(&buff[len], point, point_len);
+			len += point_len;
+		} else {
+			buff[len++] = *start;
+		}
+	}
+	buff[len] = 0;
+	errno = 0;
+	result = strtod(buff, &stop);
+	if ((*stop != 0) || ((errno == ERANGE) && ((result == HUGE_VAL) || (result == -HUGE_VAL)))) {
+		return false;
+	}
+	*value = result;
+
+	return true;
+}
+'''
+            outf.write(ctext)
+        if 'float' in kinds:
+            ctext = '''
+static bool parse_float(const char *str, const char *end, float *value)
+{
+	double result;
+
+	if (parse_double(str, end, &result) == false) {
+		return false;
+	}
+	if (((result > FLT_MAX) || (result < -FLT_MAX)) &&
+		(result != HUGE_VAL) && (result != -HUGE_VAL)) {
+		return false; //overflow
+	}
+	*value = (float)result;
+
+	return true;
+}
+'''
+            outf.write(ctext)
+
+        outf.write("\nstatic bool parse_value(void *var, primitive_type_t type, "
+                   "const char *str, const char *end)\n{\n")
+        if 'signed' in kinds:
+            outf.write("\tlong long svalue;\n")
+        if 'unsigned' in kinds:
+            outf.write("\tunsigned long long uvalue;\n")
+        if 'signed' in kinds or 'unsigned' in kinds:
+            outf.write("\n")
+        outf.write("\tswitch (type) {\n")
+        for data_type in data_types:
+            (type_id, kind, minimum, maximum) = SCALAR_TYPES[data_type][:4]
+            outf.write("\tcase %s:\n" %self.get_primitive_type(data_type))
+            if kind == 'signed':
+                outf.write("\t\tif (parse_signed(str, end, %s, %s, &svalue) == false) {\n"
+                           "\t\t\treturn false;\n\t\t}\n"
+                           "\t\t*(%s *)var = (%s)svalue;\n"
+                           %(minimum, maximum, data_type, data_type))
+            elif kind == 'unsigned':
+                outf.write("\t\tif (parse_unsigned(str, end, %s, &uvalue) == false) {\n"
+                           "\t\t\treturn false;\n\t\t}\n"
+                           "\t\t*(%s *)var = (%s)uvalue;\n"
+                           %(maximum, data_type, data_type))
+            else:
+                outf.write("\t\treturn parse_%s(str, end, (%s *)var);\n" %(kind, data_type))
+                continue
+            outf.write("\t\treturn true;\n")
+        outf.write("\tdefault:\n")
+        outf.write("\t\tprintf(\"%s:not support type=%d\\n\", __func__, type);\n")
+        outf.write("\t\treturn false;\n\t}\n}\n")
+
+    def generate_writer_source(self, outf):
+        ctext = '''
+// The .conf file is formatted in a single buffer, sized from the schema and
+// grown if the values are longer, then written at once by write_file_atomic().
+struct conf_writer {
+	char *buff;
+	size_t len;
+	size_t size;
+	bool error; //allocation failure, the file is not written
+};
+
+// longest "%f" of a double: sign, 309 digits, point and 6 decimals
+#define WRITE_VALUE_SIZE 320
+
+static bool writer_init(struct conf_writer *writer, size_t size)
+{
+	writer->buff = malloc(size);
+	STATS_ADD(mallocs, 1);
+	writer->len = 0;
+	writer->size = size;
+	writer->error = (writer->buff == NULL);
+
+	return writer->buff != NULL;
+}
+
+static bool writer_reserve(struct conf_writer *writer, size_t len)
+{
+	size_t size;
+	char *buff;
+
+	if (writer->len + len <= writer->size) {
+		return true;
+	}
+	size = writer->size * 2;
+	if (size < writer->len + len) {
+		size = writer->len + len;
+	}
+	buff = realloc(writer->buff, size);
+	STATS_ADD(mallocs, 1);
+	if (buff == NULL) {
+		writer->error = true;
+		return false;
+	}
+	writer->buff = buff;
+	writer->size = size;
+
+	return true;
+}
+
+static void writer_puts(struct conf_writer *writer, const char *str, size_t len)
+{
+	if (writer_reserve(writer, len)) {
+		memcpy(writer->buff + writer->len, str, len);
+		writer->len += len;
+	}
+}
+'''
+        outf.write(ctext)
+
+        # writer_put_<kind>() of the values and write_<kind>() of the keys
+        # in use, an unused static function is a warning
+        data_types = self.get_used_scalar_types()
+        write_kinds = set(self.get_writer_kind(data_type) for data_type in data_types
+                          if self.table == False or self.is_global_basic_type(data_type))
+        put_kinds = set(write_kinds)
+        if self.table == True:
+            put_kinds.update(self.get_writer_kind(data_type) for data_type in data_types)
+        if self.loop == True:
+            put_kinds.add('unsigned') # indexes of the keys
+        if 'signed' in put_kinds or 'double' in put_kinds:
+            put_kinds.add('unsigned')
+
+        if 'unsigned' in put_kinds:
+            ctext = '''
+static void writer_put_unsigned(struct conf_writer *writer, unsigned long long value)
+{
+	char digits[20];
+	int n = 0;
+
+	do {
+		digits[n++] = '0' + value % 10;
+		value /= 10;
+	} while (value != 0);
+	if (writer_reserve(writer, n)) {
+		while (n > 0) {
+			writer->buff[writer->len++] = digits[--n];
+		}
+	}
+}
+'''
+            outf.write(ctext)
+        if 'signed' in put_kinds:
+            ctext = '''
+static void writer_put_signed(struct conf_writer *writer, long long value)
+{
+	if (value < 0) {
+		writer_puts(writer, "-", 1);
+		writer_put_unsigned(writer, -(unsigned long long)value);
+	} else {
+		writer_put_unsigned(writer, (unsigned long long)value);
+	}
+}
+'''
+            outf.write(ctext)
+        if 'double' in put_kinds:
+            ctext = '''
+// same text as printf("%f"): the exact binary value rounded to 6 decimals,
+// half to even. Below 1e9 the value * 1e6 is an integer and a fraction
+// rounded by at most 2^-52 of it, so it is rounded the same unless the
+// fraction is that close to 0.5: these values and the others go to snprintf().
+// The decimal point is always a '.', whatever the locale.
+static void writer_put_double(struct conf_writer *writer, double value)
+{
+	unsigned long long scaled;
+	double product;
+	double fraction;
+	double margin;
+	const char *point;
+	size_t point_len;
+	char *text;
+	int len;
+	int i;
+
+	product = (value < 0) ? -value * 1e6 : value * 1e6;
+	if (product < 1e15) { //false for nan
+		scaled = (unsigned long long)product;
+		fraction = product - (double)scaled;
+		margin = product * 2.3e-16;
+		if (((fraction < 0.5 - margin) || (fraction > 0.5 + margin)) &&
+			writer_reserve(writer, 28)) {
+			if (fraction > 0.5) {
+				scaled++;
+			}
+			if (signbit(value)) {
+				writer->buff[writer->len++] = '-';
+			}
+			writer_put_unsigned(writer, scaled / 1000000);
+			writer->buff[writer->len++] = '.';
+			scaled %= 1000000;
+			for (i = 5; i >= 0; i--) {
+				writer->buff[writer->len + i] = '0' + scaled % 10;
+				scaled /= 10;
+			}
+			writer->len += 6;
+			return;
+		}
+	}
+	if (writer_reserve(writer, WRITE_VALUE_SIZE)) {
+		text = writer->buff + writer->len;
+		len = snprintf(text, WRITE_VALUE_SIZE, "%f", value);
+		// snprintf() writes the decimal point of the locale, put a '.' in its place
+		point = localeconv()->decimal_point;
+		point_len = strlen(point);
+		for (i = 0; (point_len > 0) && (i + (int)point_len <= len); i++) {
+			if (memcmp(&text[i], point, point_len) == 0) {
+				text[i] = '.';
+				memmove(&text[i + 1], &text[i + point_len], len - i - point_len);
+				len -= point_len - 1;
+				break;
+			}
+		}
+		writer->len += len;
+	}
+}
+'''
+            outf.write(ctext)
+        for kind in ('signed', 'unsigned', 'double'):
+            if kind not in write_kinds:
+                continue
+            value_type = {'signed': 'long long', 'unsigned': 'unsigned long long',
+                          'double': 'double'}[kind]
+            ctext = '''
+static void write_KIND(struct conf_writer *writer, const char *key, size_t len, TYPE value)
+{
+	writer_puts(writer, key, len);
+	writer_put_KIND(writer, value);
+	writer_puts(writer, ";\\n", 2);
+}
+'''
+            outf.write(ctext.replace("KIND", kind).replace("TYPE", value_type))
+
+        ctext = '''
+#ifdef CONF_USE_POSIX_IO
+// tmp_name is <file_name>.<pid>.<n>.tmp, created exclusively: the concurrent
+// writes of a file, from threads or processes, never share their temporary file
+static int write_tmp_file(char *tmp_name, size_t tmp_size, const char *file_name,
+						  const char *data, size_t size)
+{
+	struct stat st;
+	mode_t mode = 0644;
+	ssize_t n;
+	int fd = -1;
+	int i;
+
+	// keep the permissions of the replaced file
+	if (stat(file_name, &st) == 0) {
+		mode = st.st_mode & 0777;
+	}
+	for (i = 0; i < 1000; i++) {
+		snprintf(tmp_name, tmp_size, "%s.%ld.%d.tmp", file_name, (long)getpid(), i);
+		fd = open(tmp_name, O_WRONLY | O_CREAT | O_EXCL, mode);
+		if ((fd >= 0) || (errno != EEXIST)) {
+			break;
+		}
+	}
+	if (fd < 0) {
+		tmp_name[0] = 0; //not created, nothing to remove
+		return -1;
+	}
+	while (size > 0) {
+		n = write(fd, data, size);
+		if ((n < 0) && (errno == EINTR)) {
+			continue;
+		}
+		if (n < 0) {
+			close(fd);
+			return -1;
+		}
+		data += n;
+		size -= n;
+	}
+	if (fsync(fd) < 0) {
+		close(fd);
+		return -1;
+	}
+
+	return close(fd);
+}
+
+// sync the directory entry of the renamed file
+static void sync_dir(const char *file_name)
+{
+	const char *slash = strrchr(file_name, '/');
+	char *dir_name;
+	int fd;
+
+	if (slash == NULL) {
+		fd = open(".", O_RDONLY);
+	} else {
+		dir_name = malloc(slash - file_name + 2);
+		STATS_ADD(mallocs, 1);
+		if (dir_name == NULL) {
+			return;
+		}
+		memcpy(dir_name, file_name, slash - file_name + 1);
+		dir_name[slash - file_name + 1] = 0;
+		fd = open(dir_name, O_RDONLY);
+		free(dir_name);
+	}
+	if (fd >= 0) {
+		fsync(fd);
+		close(fd);
+	}
+}
+#else
+// tmp_name is <file_name>.tmp, shared by the concurrent writes of the file
+static int write_tmp_file(char *tmp_name, size_t tmp_size, const char *file_name,
+						  const char *data, size_t size)
+{
+	FILE *file;
+	size_t n;
+
+	snprintf(tmp_name, tmp_size, "%s.tmp", file_name);
+	file = fopen(tmp_name, "wb");
+	if (file == NULL) {
+		return -1;
+	}
+	n = fwrite(data, 1, size, file);
+	// ISO C only flushes the stdio buffer, the OS cache is synced where possible
+	if ((n != size) || (fflush(file) != 0)) {
+		fclose(file);
+		return -1;
+	}
+#ifdef _WIN32
+	if (_commit(_fileno(file)) != 0) {
+		fclose(file);
+		return -1;
+	}
+#endif
+
+	return (fclose(file) == 0) ? 0 : -1;
+}
+#endif
+
+// The data is written in a temporary file next to file_name, synced and renamed
+// over the file. With the POSIX I/O a crash leaves the old or the new file, never
+// a truncated one. Without it, the file is removed first if the rename cannot
+// replace it.
+static int write_file_atomic(const char *file_name, const char *data, size_t size)
+{
+	size_t tmp_size = strlen(file_name) + 48; //room for the pid and the counter
+	char *tmp_name;
+	int res;
+
+	tmp_name = malloc(tmp_size);
+	STATS_ADD(mallocs, 1);
+	if (tmp_name == NULL) {
+		printf("%s:unable to malloc\\n", __func__);
+		return -1;
+	}
+	res = write_tmp_file(tmp_name, tmp_size, file_name, data, size);
+	if (res == 0) {
+		res = rename(tmp_name, file_name);
+#ifndef CONF_USE_POSIX_IO
+		// ISO C leaves a rename over an existing file to the implementation
+		if (res != 0) {
+			remove(file_name);
+			res = rename(tmp_name, file_name);
+		}
+#endif
+	}
+	if (res != 0) {
+		printf("%s:Unable to write file %s\\n", __func__, file_name);
+		if (tmp_name[0] != 0) {
+			remove(tmp_name);
+		}
+	}
+#ifdef CONF_USE_POSIX_IO
+	else {
+		sync_dir(file_name);
+	}
+#endif
+	free(tmp_name);
+
+	return (res == 0) ? 0 : -1;
+}
+'''
+        outf.write(ctext)
+
+    def get_type_id(self, data_type):
+        # C identifier of the type e.g. unsigned int => uint
+        return SCALAR_TYPES[data_type][0].lower()
+
+    def get_primitive_type(self, data_type):
+        if data_type in SCALAR_TYPES:
+            return 'PRIMITIVE_TYPE_%s' %SCALAR_TYPES[data_type][0]
+        else:
+            return None
+
+    def get_used_scalar_types(self):
+        # in the SCALAR_TYPES order, int if the schema has no value at all
+        used_types = set(self.get_used_basic_types())
+        data_types = [data_type for data_type in SCALAR_TYPES if data_type in used_types]
+        if len(data_types) == 0:
+            data_types.append('int')
+        return data_types
+
+    def is_global_basic_type(self, basic_type):
+        return basic_type in self.global_types_set
+
+    def generate_field_table(self, datadef, outf):
+        outf.write("static const struct config_field %s_fields[] = {\n" %datadef[1])
+        for member in datadef[3]:
+            if member[4] != None:
+                count = member[4]
+            else:
+                count = "0"
+            if member[0] == 'struct':
+                outf.write("\t{\"%s\", offsetof(struct %s, %s), 0, %s,\n"
+                           "\t\tsizeof(struct %s), %s_fields, %d},\n"
+                           %(member[2], datadef[1], member[2], count,
+                             member[1], member[1], len(member[3][0][3])))
+            else:
+                outf.write("\t{\"%s\", offsetof(struct %s, %s), %s, %s,\n"
+                           "\t\tsizeof(%s), NULL, 0},\n"
+                           %(member[2], datadef[1], member[2],
+                             self.get_primitive_type(member[0]), count, member[0]))
+        outf.write("};\n\n")
+
+    def generate_table_source(self, outf):
+        ctext = '''
+struct config_field {
+	const char *name;
+	size_t offset;
+	primitive_type_t type;
+	int count; //array size, 0 if not an array
+	size_t size; //array stride
+	const struct config_field *fields; //struct members, NULL for a primitive type
+	int nfields;
+};
+
+static int field_tag(char *tag, int len, const struct config_field *field, int i)
+{
+	if (field->count == 0) {
+		return len + snprintf(tag + len, READ_BUFF_SIZE - len, ".%s", field->name);
+	}
+
+	return len + snprintf(tag + len, READ_BUFF_SIZE - len, ".%s[%d]", field->name, i);
+}
+
+'''
+        outf.write(ctext)
+        if self.stream == False:
+            ctext = '''
+static void read_fields(const struct config_field *fields, int nfields,
+		char *base, char *tag, int len, struct config_region *region)
+{
+	int i, j, n;
+	int tag_len;
+	char *var;
+
+	for (i = 0; i < nfields; i++) {
+		n = (fields[i].count == 0) ? 1 : fields[i].count;
+		for (j = 0; j < n; j++) {
+			tag_len = field_tag(tag, len, &fields[i], j);
+			if (tag_len >= READ_BUFF_SIZE) {
+				printf("%s:too long tag: %s\\n", __func__, tag);
+				continue;
+			}
+			var = base + fields[i].offset + j * fields[i].size;
+			if (fields[i].fields != NULL) {
+				read_fields(fields[i].fields, fields[i].nfields, var, tag, tag_len, region);
+			} else {
+				read_primitive_type(var, fields[i].type, tag, region);
+			}
+		}
+	}
+}
+'''
+            outf.write(ctext)
+        outf.write("\nstatic void write_primitive_type(void *var, primitive_type_t type,\n"
+                   "\t\tconst char *tag, int len, struct conf_writer *writer)\n{\n")
+        outf.write("\twriter_puts(writer, \"\\t\", 1);\n")
+        outf.write("\twriter_puts(writer, tag, len);\n")
+        outf.write("\twriter_puts(writer, \" = \", 3);\n")
+        outf.write("\tswitch (type) {\n")
+        for data_type in self.get_used_scalar_types():
+            outf.write("\tcase %s:\n" %self.get_primitive_type(data_type))
+            outf.write("\t\twriter_put_%s(writer, *(%s *)var);\n"
+                       %(self.get_writer_kind(data_type), data_type))
+            outf.write("\t\tbreak;\n")
+        outf.write("\tdefault:\n")
+        outf.write("\t\tprintf(\"%s:not support type=%d\\n\", __func__, type);\n")
+        outf.write("\t\tbreak;\n\t}\n")
+        outf.write("\twriter_puts(writer, \";\\n\", 2);\n}\n")
+        ctext = '''
+// defaults: default value of base in a sparse write, NULL to write all the fields
+static void write_fields(const struct config_field *fields, int nfields, char *base,
+		const char *defaults, char *tag, int len, struct conf_writer *writer)
+{
+	int i, j, n;
+	int tag_len;
+	size_t offset;
+	char *var;
+
+	for (i = 0; i < nfields; i++) {
+		n = (fields[i].count == 0) ? 1 : fields[i].count;
+		for (j = 0; j < n; j++) {
+			tag_len = field_tag(tag, len, &fields[i], j);
+			if (tag_len >= READ_BUFF_SIZE) {
+				printf("%s:too long tag: %s\\n", __func__, tag);
+				continue;
+			}
+			offset = fields[i].offset + j * fields[i].size;
+			var = base + offset;
+			if (fields[i].fields != NULL) {
+				write_fields(fields[i].fields, fields[i].nfields, var,
+							 (defaults != NULL) ? defaults + offset : NULL, tag, tag_len, writer);
+			} else if ((defaults == NULL) ||
+					   (memcmp(var, defaults + offset, fields[i].size) != 0)) {
+				write_primitive_type(var, fields[i].type, tag, tag_len, writer);
+			}
+		}
+	}
+}
+
+'''
+        outf.write(ctext)
+        for datadef in self.datadef_array:
+            if datadef[0] == 'struct':
+                self.generate_field_table(datadef, outf)
+
+    def generate_include_header(self, outf):
+        if self.shm == True:
+            # shm_open() is hidden by a strict -std=c99, before the first include
+            ctext = '''#ifndef _POSIX_C_SOURCE
+#define _POSIX_C_SOURCE 200112L
+#endif
+'''
+            outf.write(ctext)
+        if self.table == True or self.stream == True:
+            outf.write("#include <stddef.h>\n")
+        outf.write("#include <stdint.h>\n")
+        outf.write("#include <stdbool.h>\n")
+        outf.write("#include <string.h>\n")
+        outf.write("#include <stdio.h>\n")
+        outf.write("#include <stdlib.h>\n")
+        outf.write("#include <errno.h>\n")
+        outf.write("#include <limits.h>\n")
+        outf.write("#include <float.h>\n")
+        outf.write("#include <math.h>\n")
+        outf.write("#include <inttypes.h>\n")
+        outf.write("#include <locale.h>\n")
+        outf.write("#ifdef CONF_STATS\n#include <time.h>\n#endif\n")
+        ctext = '''#if defined(__unix__) || defined(__APPLE__)
+#include <unistd.h>
+#endif
+#if defined(_POSIX_VERSION)
+#define CONF_USE_POSIX_IO
+#include <fcntl.h>
+#include <sys/stat.h>
+#elif defined(_WIN32)
+#include <io.h>
+#endif
+'''
+        outf.write(ctext)
+        if self.shm == True:
+            ctext = '''#if defined(_POSIX_SHARED_MEMORY_OBJECTS) && (_POSIX_SHARED_MEMORY_OBJECTS > 0) && \\
+	defined(_POSIX_C_SOURCE) && (_POSIX_C_SOURCE >= 200112L)
+#define CONF_USE_SHM
+#include <sched.h>
+#include <sys/mman.h>
+#endif
+'''
+            outf.write(ctext)
+        if self.mmap == True:
+            ctext = '''#if defined(_POSIX_MAPPED_FILES) && (_POSIX_MAPPED_FILES > 0)
+#define CONF_USE_MMAP
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#endif
+'''
+            outf.write(ctext)
+        outf.write("#include \"%s.h\"\n\n" %self.header_fname)
+
+    def get_basic_type_size(self, data_type):
+        # size in the binary snapshot
+        return SCALAR_TYPES[data_type][5]
+
+    def get_bin_accessor(self, function):
+        if function == 'write_bin':
+            return "bin_put"
+        return "bin_get"
+
+    def get_used_basic_types(self):
+        basic_types = list(self.basic_types_array)
+        for vardef in self.vardef_array:
+            if vardef[0] != 'struct' and vardef[0] not in self.basic_types_set \
+               and vardef[0] not in basic_types:
+                basic_types.append(vardef[0])
+        return basic_types
+
+    def get_payload_size(self):
+        size = 0
+        for vardef in self.vardef_array:
+            for key in self.get_expanded_keys(vardef):
+                size += self.get_basic_type_size(key[2])
+        return size
+
+    def get_struct_signature(self, type_name):
+        datadef = self.get_struct(type_name)
+        if datadef == None:
+            return "struct %s{}" %type_name
+        signature = "struct %s{" %type_name
+        for member in datadef[3]:
+            if member[0] == 'struct':
+                signature += self.get_struct_signature(member[1])
+            else:
+                signature += member[0]
+            signature += " %s" %member[2]
+            if member[4] != None:
+                signature += "[%d]" %self.get_array_size(member[4])
+            signature += ";"
+        return signature + "}"
+
+    def get_schema_hash(self):
+        # a binary snapshot is rejected when the schema changes
+        signature = ""
+        for vardef in self.vardef_array:
+            if vardef[0] == 'struct':
+                signature += self.get_struct_signature(vardef[1])
+            else:
+                signature += vardef[0]
+            signature += " %s;" %vardef[2]
+        return self.key_hash(signature, 0)
+
+    def generate_bin_source(self, outf):
+        outf.write("\n#define CONF_BIN_MAGIC 0x46434245u //\"EBCF\"\n")
+        outf.write("#define CONF_BIN_VERSION 1u\n")
+        outf.write("#define CONF_BIN_SCHEMA_HASH 0x%08xu\n" %self.get_schema_hash())
+        outf.write("#define CONF_BIN_HEADER_SIZE 20\n")
+        outf.write("#define CONF_BIN_PAYLOAD_SIZE %d\n" %self.get_payload_size())
+        ctext = '''
+// The binary snapshot is a header of 5 little endian uint32: magic, version,
+// schema hash, payload size and FNV-1a checksum of the payload. The payload
+// holds all the config keys in the .conf file order, little endian, the
+// integers on the size of their type, long on 8 bytes, bool on 1 byte,
+// float and double in the IEEE 754 format.
+
+static uint32_t bin_checksum(const unsigned char *data, size_t size)
+{
+	uint32_t hash = 2166136261u; //FNV-1a
+	size_t i;
+
+	for (i = 0; i < size; i++) {
+		hash ^= data[i];
+		hash *= 16777619u;
+	}
+
+	return hash;
+}
+
+static unsigned char *bin_put_u32(unsigned char *p, uint32_t value)
+{
+	p[0] = value & 0xff;
+	p[1] = (value >> 8) & 0xff;
+	p[2] = (value >> 16) & 0xff;
+	p[3] = (value >> 24) & 0xff;
+
+	return p + 4;
+}
+
+static const unsigned char *bin_get_u32(const unsigned char *p, uint32_t *value)
+{
+	*value = (uint32_t)p[0] | ((uint32_t)p[1] << 8) |
+		((uint32_t)p[2] << 16) | ((uint32_t)p[3] << 24);
+
+	return p + 4;
+}
+'''
+        outf.write(ctext)
+
+        data_types = self.get_used_scalar_types()
+        kinds = set(SCALAR_TYPES[data_type][1] for data_type in data_types)
+        if 'signed' in kinds or 'unsigned' in kinds or 'bool' in kinds:
+            ctext = '''
+static unsigned char *bin_put_le(unsigned char *p, uint64_t value, int size)
+{
+	int i;
+
+	for (i = 0; i < size; i++) {
+		p[i] = (value >> (8 * i)) & 0xff;
+	}
+
+	return p + size;
+}
+
+// is_signed: the sign bit of the size bytes is extended to the 64 bits
+static const unsigned char *bin_get_le(const unsigned char *p, uint64_t *value,
+									   int size, bool is_signed)
+{
+	int i;
+
+	*value = 0;
+	for (i = 0; i < size; i++) {
+		*value |= (uint64_t)p[i] << (8 * i);
+	}
+	if (is_signed && (size < 8) && (p[size - 1] & 0x80)) {
+		*value |= ~(uint64_t)0 << (8 * size);
+	}
+
+	return p + size;
+}
+'''
+            outf.write(ctext)
+        for data_type in data_types:
+            (type_id, kind) = SCALAR_TYPES[data_type][:2]
+            size = self.get_basic_type_size(data_type)
+            if kind == 'float':
+                ctext = '''
+static unsigned char *bin_put_float(unsigned char *p, const float *var)
+{
+	uint32_t value;
+
+	memcpy(&value, var, sizeof(value));
+
+	return bin_put_u32(p, value);
+}
+
+static const unsigned char *bin_get_float(const unsigned char *p, float *var)
+{
+	uint32_t value;
+
+	p = bin_get_u32(p, &value);
+	memcpy(var, &value, sizeof(value));
+
+	return p;
+}
+'''
+            elif kind == 'double':
+                ctext = '''
+static unsigned char *bin_put_double(unsigned char *p, const double *var)
+{
+	uint64_t value;
+
+	memcpy(&value, var, sizeof(value));
+	p = bin_put_u32(p, (uint32_t)value);
+
+	return bin_put_u32(p, (uint32_t)(value >> 32));
+}
+
+static const unsigned char *bin_get_double(const unsigned char *p, double *var)
+{
+	uint32_t low, high;
+	uint64_t value;
+
+	p = bin_get_u32(p, &low);
+	p = bin_get_u32(p, &high);
+	value = ((uint64_t)high << 32) | low;
+	memcpy(var, &value, sizeof(value));
+
+	return p;
+}
+'''
+            else:
+                if kind == 'bool':
+                    (put_value, get_value) = ("*var ? 1 : 0", "value != 0")
+                elif kind == 'signed':
+                    (put_value, get_value) = ("(uint64_t)*var", "(TYPE)(int64_t)value")
+                else:
+                    (put_value, get_value) = ("(uint64_t)*var", "(TYPE)value")
+                ctext = '''
+static unsigned char *bin_put_ID(unsigned char *p, const TYPE *var)
+{
+	return bin_put_le(p, PUT_VALUE, SIZE);
+}
+
+static const unsigned char *bin_get_ID(const unsigned char *p, TYPE *var)
+{
+	uint64_t value;
+
+	p = bin_get_le(p, &value, SIZE, SIGNED);
+	*var = GET_VALUE;
+
+	return p;
+}
+'''.replace("PUT_VALUE", put_value).replace("GET_VALUE", get_value)
+                ctext = ctext.replace("SIZE", str(size)).replace("ID", type_id.lower())
+                ctext = ctext.replace("SIGNED", "true" if kind == 'signed' else "false")
+            outf.write(ctext.replace("TYPE", data_type))
+        if self.table == True:
+            for (function, accessor, pointer) in (('put', 'bin_put', 'unsigned char *'),
+                                                  ('get', 'bin_get', 'const unsigned char *')):
+                outf.write("\nstatic %sbin_%s_value(%sp, void *var, primitive_type_t type)\n{\n"
+                           %(pointer, function, pointer))
+                outf.write("\tswitch (type) {\n")
+                for data_type in data_types:
+                    outf.write("\tcase %s:\n" %self.get_primitive_type(data_type))
+                    outf.write("\t\treturn %s_%s(p, (%s *)var);\n"
+                               %(accessor, self.get_type_id(data_type), data_type))
+                outf.write("\tdefault:\n\t\treturn p;\n\t}\n}\n")
+        if self.table == True:
+            ctext = '''
+static unsigned char *write_bin_fields(const struct config_field *fields, int nfields,
+		char *base, unsigned char *p)
+{
+	int i, j, n;
+	char *var;
+
+	for (i = 0; i < nfields; i++) {
+		n = (fields[i].count == 0) ? 1 : fields[i].count;
+		for (j = 0; j < n; j++) {
+			var = base + fields[i].offset + j * fields[i].size;
+			if (fields[i].fields != NULL) {
+				p = write_bin_fields(fields[i].fields, fields[i].nfields, var, p);
+			} else {
+				p = bin_put_value(p, var, fields[i].type);
+			}
+		}
+	}
+
+	return p;
+}
+
+static const unsigned char *read_bin_fields(const struct config_field *fields, int nfields,
+		char *base, const unsigned char *p)
+{
+	int i, j, n;
+	char *var;
+
+	for (i = 0; i < nfields; i++) {
+		n = (fields[i].count == 0) ? 1 : fields[i].count;
+		for (j = 0; j < n; j++) {
+			var = base + fields[i].offset + j * fields[i].size;
+			if (fields[i].fields != NULL) {
+				p = read_bin_fields(fields[i].fields, fields[i].nfields, var, p);
+			} else {
+				p = bin_get_value(p, var, fields[i].type);
+			}
+		}
+	}
+
+	return p;
+}
+'''
+            outf.write(ctext)
+
+    def generate_bin_var_function(self, function, vardef, outf):
+        # function: 'write_bin' or 'read_bin'
+        if function == 'write_bin':
+            outf.write("\nstatic unsigned char *write_bin_%s(const %s *var, unsigned char *p)\n{\n"
+                       %(vardef[2], self.get_var_type(vardef)))
+        else:
+            outf.write("\nstatic const unsigned char *read_bin_%s(%s *var, const unsigned char *p)"
+                       "\n{\n" %(vardef[2], self.get_var_type(vardef)))
+        accessor = self.get_bin_accessor(function)
+
+        if vardef[0] != 'struct':
+            outf.write("\treturn %s_%s(p, var);\n}\n" %(accessor, self.get_type_id(vardef[0])))
+            return
+
+        datadef = self.get_struct(vardef[1])
+        if datadef == None:
+            pass
+        elif self.table == True:
+            outf.write("\treturn %s_fields(%s_fields, %d, (char *)var, p);\n}\n"
+                       %(function, datadef[1], len(datadef[3])))
+            return
+        elif self.loop == True:
+            self.generate_loop_declaration(datadef[3], False, outf)
+            self.generate_datatype_loop_function(function, datadef[3],
+                          vardef[2], "var->", 0, outf)
+        else:
+            for key in self.get_expanded_keys(vardef):
+                outf.write("\tp = %s_%s(p, &var->%s);\n"
+                           %(accessor, self.get_type_id(key[2]), key[1]))
+        outf.write("\n\treturn p;\n}\n")
+
+    def generate_bin_function(self, outf):
+        for vardef in self.vardef_array:
+            self.generate_bin_var_function('write_bin', vardef, outf)
+        for vardef in self.vardef_array:
+            self.generate_bin_var_function('read_bin', vardef, outf)
+
+        outf.write("\nstatic int write_bin_config(const char* file_name, void *const *vars)")
+        ctext = '''
+{
+	unsigned char *data;
+	unsigned char *payload;
+	unsigned char *p;
+	int res;
+
+	data = malloc(CONF_BIN_HEADER_SIZE + CONF_BIN_PAYLOAD_SIZE);
+	STATS_ADD(mallocs, 1);
+	if (data == NULL) {
+		printf("%s:unable to malloc\\n", __func__);
+		return -1;
+	}
+
+	payload = data + CONF_BIN_HEADER_SIZE;
+	p = payload;
+'''
+        outf.write(ctext)
+        for n, vardef in enumerate(self.vardef_array):
+            outf.write("\tp = write_bin_%s(vars[%d], p);\n" %(vardef[2], n))
+        ctext = '''
+	p = bin_put_u32(data, CONF_BIN_MAGIC);
+	p = bin_put_u32(p, CONF_BIN_VERSION);
+	p = bin_put_u32(p, CONF_BIN_SCHEMA_HASH);
+	p = bin_put_u32(p, CONF_BIN_PAYLOAD_SIZE);
+	bin_put_u32(p, bin_checksum(payload, CONF_BIN_PAYLOAD_SIZE));
+
+	res = write_file_atomic(file_name, (const char *)data,
+							CONF_BIN_HEADER_SIZE + CONF_BIN_PAYLOAD_SIZE);
+	free(data);
+
+	return res;
+}
+'''
+        outf.write(ctext)
+
+        outf.write("\nstatic int read_bin_config(const char* file_name, void *const *vars)")
+        ctext = '''
+{
+	unsigned char header[CONF_BIN_HEADER_SIZE];
+	uint32_t magic, version, schema_hash, size, checksum;
+	unsigned char *payload;
+	const unsigned char *p;
+	FILE *file;
+
+	file = fopen(file_name, "rb");
+	if (file == NULL) {
+		printf("%s:Unable to open file %s for reading.\\n", __func__, file_name);
+		return -1;
+	}
+
+	if (fread(header, 1, CONF_BIN_HEADER_SIZE, file) != CONF_BIN_HEADER_SIZE) {
+		printf("%s:Missing header: %s\\n", __func__, file_name);
+		fclose(file);
+		return -1;
+	}
+	p = bin_get_u32(header, &magic);
+	p = bin_get_u32(p, &version);
+	p = bin_get_u32(p, &schema_hash);
+	p = bin_get_u32(p, &size);
+	bin_get_u32(p, &checksum);
+	if ((magic != CONF_BIN_MAGIC) || (version != CONF_BIN_VERSION) ||
+		(schema_hash != CONF_BIN_SCHEMA_HASH) || (size != CONF_BIN_PAYLOAD_SIZE)) {
+		printf("%s:Not a binary config of this schema: %s\\n", __func__, file_name);
+		fclose(file);
+		return -1;
+	}
+
+	payload = malloc(CONF_BIN_PAYLOAD_SIZE);
+	STATS_ADD(mallocs, 1);
+	if (payload == NULL) {
+		printf("%s:unable to malloc\\n", __func__);
+		fclose(file);
+		return -1;
+	}
+	if (fread(payload, 1, CONF_BIN_PAYLOAD_SIZE, file) != CONF_BIN_PAYLOAD_SIZE) {
+		printf("%s:Truncated payload: %s\\n", __func__, file_name);
+		free(payload);
+		fclose(file);
+		return -1;
+	}
+	fclose(file);
+	STATS_ADD(bytes, CONF_BIN_HEADER_SIZE + CONF_BIN_PAYLOAD_SIZE);
+	if (bin_checksum(payload, CONF_BIN_PAYLOAD_SIZE) != checksum) {
+		printf("%s:Invalid checksum: %s\\n", __func__, file_name);
+		free(payload);
+		return -1;
+	}
+
+	p = payload;
+'''
+        outf.write(ctext)
+        for n, vardef in enumerate(self.vardef_array):
+            outf.write("\tp = read_bin_%s(vars[%d], p);\n" %(vardef[2], n))
+        outf.write("\tfree(payload);\n\n\treturn 0;\n}\n")
+
+        # export functions
+        ctext = '''
+int NAME_write_bin_r(const struct NAME *config, const char* file_name)
+{
+	void *vars[NUM_CONFIG_VARS];
+
+	get_config_vars(config, vars);
+
+	return write_bin_config(file_name, vars);
+}
+
+int NAME_read_bin_r(struct NAME *config, const char* file_name)
+{
+	void *vars[NUM_CONFIG_VARS];
+
+	get_config_vars(config, vars);
+
+	return read_bin_config(file_name, vars);
+}
 
-	line[rp++] = 0;
+int NAME_write_bin(const char* file_name)
+{
+	return write_bin_config(file_name, config_globals);
+}
 
-	return rp;
+int NAME_read_bin(const char* file_name)
+{
+	return read_bin_config(file_name, config_globals);
 }
+'''
+        outf.write(ctext.replace("NAME", self.header_fname))
 
-static int load_region(struct config_region *region, char *name, int name_size,
-					   FILE *file, char *bufread, int bufsize)
+    def read_conf_values(self, conf_name):
+        # Same rules as the generated <name>_read(): the spaces are removed,
+        # the '#' lines are ignored and the first value of a key is used
+        region_recomp = re.compile(r"^CONF_(\S+?)={")
+        key_recomp = re.compile(r"^([^=]+)=([^;]*);")
+        values = {}
+        region = None
+        conf_object = open(conf_name, encoding = 'utf-8')
+        for line in conf_object:
+            line = re.sub(r"\s", "", line)
+            if line.startswith("#"):
+                continue
+            if region == None:
+                r_region = region_recomp.match(line)
+                if r_region:
+                    region = {}
+                    values[r_region.group(1)] = region
+                continue
+            if line.startswith("};"):
+                region = None
+                continue
+            r_key = key_recomp.match(line)
+            if r_key and r_key.group(1) not in region:
+                region[r_key.group(1)] = r_key.group(2)
+        conf_object.close()
+        return values
+
+    def pack_bin_value(self, data_type, number):
+        (kind, size) = (SCALAR_TYPES[data_type][1], SCALAR_TYPES[data_type][5])
+        if kind == 'float':
+            return struct.pack("<f", number)
+        if kind == 'double':
+            return struct.pack("<d", number)
+        formats = {1: "b", 2: "h", 4: "i", 8: "q"}
+        if kind == 'signed':
+            return struct.pack("<" + formats[size], number)
+        return struct.pack("<" + formats[size].upper(), number)
+
+    def convert_conf_to_bin(self, conf_name, bin_name):
+        values = self.read_conf_values(conf_name)
+        payload = bytearray()
+        for vardef in self.vardef_array:
+            region = values.get(vardef[2], {})
+            for key in self.get_expanded_keys(vardef):
+                value = region.get(key[0], "")
+                number = parse_scalar_value(key[2], value)
+                if number == None:
+                    # left to the default, as by the generated reader
+                    if value != "":
+                        print("Invalid value: %s = %s" %(key[0], value))
+                    number = self.get_default_value(key[2], key[3])
+                payload += self.pack_bin_value(key[2], number)
+
+        checksum = 2166136261 # FNV-1a
+        for c in payload:
+            checksum ^= c
+            checksum = (checksum * 16777619) & 0xffffffff
+
+        bin_out = open(bin_name, "wb")
+        bin_out.write(struct.pack("<5I", 0x46434245, 1, self.get_schema_hash(),
+                                  len(payload), checksum))
+        bin_out.write(payload)
+        bin_out.close()
+
+    def generate_shm_function(self, outf):
+        outf.write("\n#define CONF_SHM_MAGIC 0x46534345u //\"ECSF\"\n")
+        outf.write("#define CONF_SHM_SCHEMA_HASH 0x%08xu\n" %self.get_schema_hash())
+        outf.write("#define CONF_SHM_RETRIES 100000 //reads of a config being published\n")
+        ctext = '''
+// Shared memory object: a header and the variables laid out as a struct NAME.
+// A single publisher copies the variables under a sequence lock: seq is odd
+// while they are written. The readers copy them without any lock and retry
+// if seq was odd or changed during the copy.
+struct NAME_shm {
+	uint32_t magic; //set by the first publication, cleared when replaced
+	uint32_t schema_hash;
+	uint32_t size;
+	unsigned int seq;
+	struct NAME config;
+};
+
+#ifdef CONF_USE_SHM
+'''
+        outf.write(ctext.replace("NAME", self.header_fname))
+        outf.write("static const size_t config_sizes[NUM_CONFIG_VARS] = {\n")
+        for vardef in self.vardef_array:
+            outf.write("\tsizeof(%s),\n" %self.get_var_type(vardef))
+        outf.write("};\n")
+        ctext = '''
+static struct NAME_shm *map_shm(int fd, int prot)
 {
-	int result = 0;
-	bool end_region = false;
-	int size;
+	void *addr;
 
-	if (name_size >= REGION_NAME_SIZE) {
-		printf("%s:name region too long: %s\\n", __func__, name);
-		return -1;
+	addr = mmap(NULL, sizeof(struct NAME_shm), prot, MAP_SHARED, fd, 0);
+	if (addr == MAP_FAILED) {
+		return NULL;
 	}
-	memset(region->name, 0, REGION_NAME_SIZE);
-	memcpy(region->name, name, name_size);
-	region->nbuffs = 0;
 
-	while (conf_readline(file, bufread, bufsize) > 0) {
-		remove_space(bufread);
-		if (bufread[0] == '#') {
-			continue;
-		}
-		if (strstr(bufread, "};") == bufread) {
-			end_region = true;
-			break;
+	return addr;
+}
+
+static void invalidate_shm(int fd, off_t size)
+{
+	uint32_t *magic;
+
+	// the readers of a shared memory object with another schema
+	// see it replaced and have to attach to the new one
+	if (size < (off_t)sizeof(uint32_t)) {
+		return;
+	}
+	magic = mmap(NULL, sizeof(uint32_t), PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+	if (magic == MAP_FAILED) {
+		return;
+	}
+	__atomic_store_n(magic, 0, __ATOMIC_RELEASE);
+	munmap(magic, sizeof(uint32_t));
+}
+
+static struct NAME_shm *open_shm(const char* shm_name)
+{
+	struct NAME_shm *shm;
+	struct stat st;
+	int fd;
+
+	fd = shm_open(shm_name, O_RDWR | O_CREAT, 0644);
+	if (fd < 0) {
+		printf("%s:unable to open %s\\n", __func__, shm_name);
+		return NULL;
+	}
+	if (fstat(fd, &st) != 0) {
+		printf("%s:unable to stat %s\\n", __func__, shm_name);
+		close(fd);
+		return NULL;
+	}
+	shm = NULL;
+	if (st.st_size == (off_t)sizeof(struct NAME_shm)) {
+		shm = map_shm(fd, PROT_READ | PROT_WRITE);
+		if ((shm != NULL) && (shm->magic == CONF_SHM_MAGIC) &&
+			((shm->schema_hash != CONF_SHM_SCHEMA_HASH) || (shm->size != sizeof(struct NAME)))) {
+			munmap(shm, sizeof(struct NAME_shm));
+			shm = NULL;
 		}
-		size = strlen(bufread) + 1;
-		region->buffs[region->nbuffs] = malloc(size);
-		if (region->buffs[region->nbuffs] == NULL) {
-			printf("%s:unable to malloc\\n", __func__);
-			break;
+	}
+	if ((shm == NULL) && (st.st_size != 0)) {
+		// left by another schema: replaced by a new object
+		invalidate_shm(fd, st.st_size);
+		close(fd);
+		shm_unlink(shm_name);
+		fd = shm_open(shm_name, O_RDWR | O_CREAT | O_EXCL, 0644);
+		if (fd < 0) {
+			printf("%s:unable to create %s\\n", __func__, shm_name);
+			return NULL;
 		}
-		memset(region->buffs[region->nbuffs], 0, size);
-		memcpy(region->buffs[region->nbuffs], bufread, size);
-		region->nbuffs++;
+	}
+	if ((shm == NULL) && (ftruncate(fd, sizeof(struct NAME_shm)) == 0)) {
+		shm = map_shm(fd, PROT_READ | PROT_WRITE);
+	}
+	close(fd);
+	if (shm == NULL) {
+		printf("%s:unable to map %s\\n", __func__, shm_name);
 	}
 
-	if (end_region == false) {
-		int i;
+	return shm;
+}
 
-		printf("%s:Missing '};' region: %s\\n", __func__, region->name);
-		for (i = 0; i < region->nbuffs; i++) {
-			free(region->buffs[i]);
-		}
-		region->nbuffs = 0;
-		result = -1;
+static int publish_shm(const char* shm_name, void *const *vars)
+{
+	struct NAME_shm *shm;
+	void *shm_vars[NUM_CONFIG_VARS];
+	unsigned int seq;
+	int i;
+
+	shm = open_shm(shm_name);
+	if (shm == NULL) {
+		return -1;
 	}
+	get_config_vars(&shm->config, shm_vars);
 
-	return result;
+	// odd, even if a previous publisher stopped in the middle of a copy
+	seq = (__atomic_load_n(&shm->seq, __ATOMIC_RELAXED) + 1) | 1;
+	__atomic_store_n(&shm->seq, seq, __ATOMIC_RELAXED);
+	__atomic_thread_fence(__ATOMIC_RELEASE);
+	for (i = 0; i < NUM_CONFIG_VARS; i++) {
+		memcpy(shm_vars[i], vars[i], config_sizes[i]);
+	}
+	__atomic_store_n(&shm->seq, seq + 1, __ATOMIC_RELEASE);
+
+	if (shm->magic != CONF_SHM_MAGIC) {
+		shm->schema_hash = CONF_SHM_SCHEMA_HASH;
+		shm->size = sizeof(struct NAME);
+		__atomic_store_n(&shm->magic, CONF_SHM_MAGIC, __ATOMIC_RELEASE);
+	}
+	munmap(shm, sizeof(struct NAME_shm));
+
+	return 0;
 }
 
-static int parse_regions(FILE *file, struct config_region *regions, int max_regions)
+static int read_shm(const struct NAME_shm *shm, void *const *vars, unsigned int *version)
 {
-	char region_name[REGION_NAME_SIZE];
-	char buff[READ_BUFF_SIZE];
-	int nregions = 0;
-	char *temp;
+	void *shm_vars[NUM_CONFIG_VARS];
+	unsigned int seq;
+	int retries;
+	int i;
 
-	while (conf_readline(file, buff, sizeof(buff)) > 0) {
-		remove_space(buff);
-		if (buff[0] == '#') {
-			continue;
+	get_config_vars(&shm->config, shm_vars);
+	for (retries = 0; retries < CONF_SHM_RETRIES; retries++) {
+		if (__atomic_load_n(&shm->magic, __ATOMIC_ACQUIRE) != CONF_SHM_MAGIC) {
+			printf("%s:the shared memory was replaced\\n", __func__);
+			return -1;
 		}
-		if (strstr(buff, "CONF_") != buff) {
+		seq = __atomic_load_n(&shm->seq, __ATOMIC_ACQUIRE);
+		if ((seq & 1) != 0) {
+			sched_yield();
 			continue;
 		}
-		temp = strstr(buff, "={");
-		if (temp == NULL) {
-			continue;
+		for (i = 0; i < NUM_CONFIG_VARS; i++) {
+			memcpy(vars[i], shm_vars[i], config_sizes[i]);
+		}
+		__atomic_thread_fence(__ATOMIC_ACQUIRE);
+		if (__atomic_load_n(&shm->seq, __ATOMIC_RELAXED) == seq) {
+			if (version != NULL) {
+				*version = seq / 2;
+			}
+			return 0;
 		}
+	}
+	printf("%s:the config is being published\\n", __func__);
 
-		*temp = 0; //Set NULL terminate
-		strncpy(region_name, buff, REGION_NAME_SIZE-1);
+	return -1;
+}
 
-		if (load_region(&regions[nregions], buff, temp - buff,
-						file, buff, sizeof(buff)) == 0) {
-			nregions++;
-		} else {
-			printf("%s:Unable to load region: %s\\n", __func__, region_name);
-		}
+struct NAME_shm *NAME_attach_shm(const char* shm_name)
+{
+	struct NAME_shm *shm;
+	struct stat st;
+	int fd;
 
-		if (nregions == max_regions) {
-			break;
-		}
+	fd = shm_open(shm_name, O_RDONLY, 0);
+	if (fd < 0) {
+		printf("%s:unable to open %s\\n", __func__, shm_name);
+		return NULL;
+	}
+	if ((fstat(fd, &st) != 0) || (st.st_size != (off_t)sizeof(struct NAME_shm))) {
+		printf("%s:%s is not published\\n", __func__, shm_name);
+		close(fd);
+		return NULL;
+	}
+	shm = map_shm(fd, PROT_READ);
+	close(fd);
+	if (shm == NULL) {
+		printf("%s:unable to map %s\\n", __func__, shm_name);
+		return NULL;
+	}
+	if ((__atomic_load_n(&shm->magic, __ATOMIC_ACQUIRE) != CONF_SHM_MAGIC) ||
+		(shm->schema_hash != CONF_SHM_SCHEMA_HASH) || (shm->size != sizeof(struct NAME))) {
+		printf("%s:%s is not published or has another schema\\n", __func__, shm_name);
+		munmap(shm, sizeof(struct NAME_shm));
+		return NULL;
 	}
 
-	return nregions;
+	return shm;
 }
 
-static void release_regions(struct config_region *regions, int nregions)
+void NAME_detach_shm(struct NAME_shm *shm)
 {
-	int i, j;
+	munmap(shm, sizeof(struct NAME_shm));
+}
 
-	for (i = 0; i < nregions; i++) {
-		for (j = 0; j < regions[i].nbuffs; j++) {
-			if (regions[i].buffs[j] != NULL) {
-				free(regions[i].buffs[j]);
-				regions[i].buffs[j] = NULL;
-			}
-		}
-	}
+unsigned int NAME_shm_version(const struct NAME_shm *shm)
+{
+	return __atomic_load_n(&shm->seq, __ATOMIC_ACQUIRE) / 2;
 }
+#else
+static int publish_shm(const char* shm_name, void *const *vars)
+{
+	(void)shm_name;
+	(void)vars;
+	printf("%s:no POSIX shared memory\\n", __func__);
 
-'''
-        outf.write(ctext)
+	return -1;
+}
 
-    def generate_include_header(self, outf):
-        outf.write("#include <stdint.h>\n")
-        outf.write("#include <stdbool.h>\n")
-        outf.write("#include <string.h>\n")
-        outf.write("#include <stdio.h>\n")
-        outf.write("#include <stdlib.h>\n")
-        outf.write("#include \"%s.h\"\n\n" %self.header_fname)
+static int read_shm(const struct NAME_shm *shm, void *const *vars, unsigned int *version)
+{
+	(void)shm;
+	(void)vars;
+	(void)version;
+
+	return -1;
+}
+
+struct NAME_shm *NAME_attach_shm(const char* shm_name)
+{
+	(void)shm_name;
+	printf("%s:no POSIX shared memory\\n", __func__);
+
+	return NULL;
+}
+
+void NAME_detach_shm(struct NAME_shm *shm)
+{
+	(void)shm;
+}
+
+unsigned int NAME_shm_version(const struct NAME_shm *shm)
+{
+	(void)shm;
+
+	return 0;
+}
+#endif
+
+int NAME_publish_shm_r(const struct NAME *config, const char* shm_name)
+{
+	void *vars[NUM_CONFIG_VARS];
+
+	get_config_vars(config, vars);
+
+	return publish_shm(shm_name, vars);
+}
+
+int NAME_read_shm_r(const struct NAME_shm *shm, struct NAME *config, unsigned int *version)
+{
+	void *vars[NUM_CONFIG_VARS];
+
+	get_config_vars(config, vars);
+
+	return read_shm(shm, vars, version);
+}
+
+int NAME_publish_shm(const char* shm_name)
+{
+	return publish_shm(shm_name, config_globals);
+}
+
+int NAME_read_shm(const struct NAME_shm *shm, unsigned int *version)
+{
+	return read_shm(shm, config_globals, version);
+}
+'''
+        outf.write(ctext.replace("NAME", self.header_fname))
 
     def generate_source_file(self, outf):
         self.generate_include_header(outf)
+        self.generate_default_source(outf)
         self.generate_global_variable(outf)
         self.generate_static_source(outf)
         self.generate_read_function(outf)
         self.generate_write_function(outf)
+        if self.binary == True:
+            self.generate_bin_function(outf)
+        if self.shm == True:
+            self.generate_shm_function(outf)
+        self.generate_stats_function(outf)
+
+    def get_numpy_type(self, data_type):
+        # little endian NumPy type of a scalar, as in the binary snapshot
+        (kind, size) = (SCALAR_TYPES[data_type][1], SCALAR_TYPES[data_type][5])
+        return {'signed': "<i%d" %size, 'unsigned': "<u%d" %size, 'bool': "?",
+                'float': "<f4", 'double': "<f8"}[kind]
+
+    def get_numpy_field(self, member):
+        # field of a member in a NumPy dtype, None if its array size is invalid
+        if member[0] == 'struct':
+            field = "(%s, STRUCTS[%s]" %(repr(member[2]), repr(member[1]))
+        else:
+            field = "(%s, %s" %(repr(member[2]), repr(self.get_numpy_type(member[0])))
+        if member[4] != None:
+            size = self.get_array_size(member[4])
+            if size == 0:
+                return None
+            field += ", (%d,)" %size
+        return field + ")"
+
+    def generate_python_struct(self, datadef, done, outf):
+        # the structs of the members first
+        if datadef[1] in done:
+            return
+        done.add(datadef[1])
+        for member in datadef[3]:
+            if member[0] == 'struct' and self.get_struct(member[1]) != None:
+                self.generate_python_struct(self.get_struct(member[1]), done, outf)
+        fields = [self.get_numpy_field(member) for member in datadef[3]]
+        outf.write("STRUCTS[%s] = np.dtype([%s])\n"
+                   %(repr(datadef[1]), ", ".join(field for field in fields if field != None)))
+
+    def get_python_default(self, data_type, value):
+        number = self.get_default_value(data_type, value)
+        if SCALAR_TYPES[data_type][1] not in ('float', 'double'):
+            return str(number)
+        if number != number or abs(number) == float("inf"):
+            return "float('%s')" %number
+        return repr(float(number))
+
+    def generate_python_defaults(self, member_array, access, outf):
+        # assignments of the defaults, broadcast over the arrays of structs
+        for member in member_array:
+            member_access = "%s[%s]" %(access, repr(member[2]))
+            if member[0] == 'struct':
+                datadef = self.get_struct(member[1])
+                if datadef != None and self.has_struct_default(member[1]):
+                    self.generate_python_defaults(datadef[3], member_access, outf)
+            elif self.has_default(member[0], member[5]):
+                outf.write("DEFAULTS%s = %s\n"
+                           %(member_access, self.get_python_default(member[0], member[5])))
+
+    def generate_python_file(self, outf):
+        ptext = '''"""Reader and writer of the NAME .conf files, generated by config_tool.py.
+
+The configs are NumPy structured records of the CONFIG dtype, with one field
+per config variable. The arrays of the schema are NumPy arrays: a member under
+arrays of structs has one dimension per array e.g. the values of the keys
+abc.xyz[*].mnp[*].m of n files are configs['abc']['xyz']['mnp']['m'], of shape
+(n, xyz size, mnp size).
+The records have the layout of the values of the binary snapshot.
+"""
+
+import os
+import re
+import numpy as np
+
+# dtypes of the structs of the schema
+STRUCTS = {}
+'''
+        outf.write(ptext.replace("NAME", self.header_fname))
+        done = set()
+        for datadef in self.datadef_array:
+            if datadef[0] == 'struct':
+                self.generate_python_struct(datadef, done, outf)
+        fields = []
+        for vardef in self.vardef_array:
+            if vardef[0] != 'struct' or self.get_struct(vardef[1]) != None:
+                fields.append(self.get_numpy_field((vardef[0], vardef[1], vardef[2],
+                                                    [], None, None)))
+        outf.write("\n# one field per config variable\n")
+        outf.write("CONFIG = np.dtype([%s])\n" %", ".join(fields))
+        outf.write("\n# values of the variables without .conf file or key\n")
+        outf.write("DEFAULTS = np.zeros((), CONFIG)\n")
+        for vardef in self.vardef_array:
+            if vardef[0] != 'struct':
+                if self.has_default(vardef[0], vardef[3]):
+                    outf.write("DEFAULTS[%s] = %s\n" %(repr(vardef[2]),
+                               self.get_python_default(vardef[0], vardef[3])))
+            elif self.get_struct(vardef[1]) != None and self.has_struct_default(vardef[1]):
+                self.generate_python_defaults(self.get_struct(vardef[1])[3],
+                                              "[%s]" %repr(vardef[2]), outf)
+        ptext = '''
+def get_fields(dtype, key, offset):
+    # (key, offset in a record, scalar dtype) of the values of a field,
+    # in the order of the C writer
+    if dtype.subdtype != None:
+        (base, shape) = dtype.subdtype
+        for i in range(shape[0]):
+            yield from get_fields(base, "%s[%d]" %(key, i), offset + i * base.itemsize)
+    elif dtype.names != None:
+        for name in dtype.names:
+            (field, field_offset) = dtype.fields[name][:2]
+            yield from get_fields(field, "%s.%s" %(key, name), offset + field_offset)
+    else:
+        yield (key, offset, dtype)
+
+# the config keys of all the variables in the .conf order, with the variable
+# index, the offset of the value in a record and the index of its type
+_FIELDS = [(var, key, offset, dtype) for (var, name) in enumerate(CONFIG.names)
+           for (key, offset, dtype) in get_fields(CONFIG.fields[name][0], name,
+                                                  CONFIG.fields[name][1])]
+_TYPES = sorted(set(field[3] for field in _FIELDS), key = str)
+_VARS = np.array([field[0] for field in _FIELDS], np.int64)
+_KEYS = np.array([field[1].encode() for field in _FIELDS], np.bytes_)
+_OFFSETS = np.array([field[2] for field in _FIELDS], np.int64)
+_FIELD_TYPES = np.array([_TYPES.index(field[3]) for field in _FIELDS], np.int64)
+_VAR_STARTS = np.searchsorted(_VARS, np.arange(len(CONFIG.names) + 1))
+# the keys are found by a binary search in the sorted keys
+_ORDER = np.argsort(_KEYS, kind = 'stable')
+_SORTED_KEYS = _KEYS[_ORDER]
+_VAR_INDEX = {name.encode(): var for (var, name) in enumerate(CONFIG.names)}
+
+# Same rules as the generated C reader: the spaces are removed, the '#' lines are
+# ignored, the last region of a variable and the first value of a key are used
+_SPACES = b" \\t\\r\\f\\v"
+_REGION_RE = re.compile(rb"^CONF_([^\\n]+?)={", re.M)
+_KEY_RE = re.compile(rb"^([^#=\\n][^=\\n]*)=([^;\\n]*);", re.M)
+
+# characters of the values converted by NumPy, the others by parse_value()
+def _get_char_table(chars):
+    table = np.zeros(256, bool)
+    table[list(chars)] = True
+    table[0] = True # padding of the short values
+    return table
+
+_NUMPY_CHARS = {'i': _get_char_table(b"0123456789+-"), 'u': _get_char_table(b"0123456789+"),
+                'f': _get_char_table(b"0123456789+-.eE")}
+_NUMPY_TYPES = {'i': np.int64, 'u': np.uint64, 'f': np.float64}
+_FORMATS = {'i': "%d", 'u': "%d", 'b': "%d", 'f': "%f"}
+
+def parse_value(dtype, value):
+    # number of a value of the scalar dtype, None if invalid
+    if dtype.kind == 'b':
+        return {'1': 1, 'true': 1, '0': 0, 'false': 0}.get(value.lower())
+    if dtype.kind == 'f':
+        if re.fullmatch(r"[+-]?(inf|infinity|nan)", value, re.I):
+            return float(value)
+        if re.fullmatch(r"[+-]?(\\d+\\.?\\d*|\\.\\d+)([eE][+-]?\\d+)?", value) == None:
+            return None
+        number = float(value)
+        # overflow of the type
+        if abs(number) > np.finfo(dtype).max:
+            return None
+        return number
+    r_value = re.fullmatch(r"([+-]?)(0[xX][0-9a-fA-F]+|\\d+)", value)
+    if r_value == None or (dtype.kind == 'u' and r_value.group(1) == '-'):
+        return None
+    if r_value.group(2)[:2].lower() == "0x":
+        number = int(r_value.group(2), 16)
+    else:
+        number = int(r_value.group(2))
+    if r_value.group(1) == '-':
+        number = -number
+    if number < np.iinfo(dtype).min or number > np.iinfo(dtype).max:
+        return None
+    return number
+
+def parse_values(values, dtype):
+    # numbers of an array of values of the scalar dtype and their validity
+    numbers = np.zeros(len(values), dtype)
+    valid = np.zeros(len(values), bool)
+    # plain numbers: converted and range checked by NumPy
+    plain = np.zeros(len(values), bool)
+    if dtype.kind in _NUMPY_CHARS:
+        chars = values.view(np.uint8).reshape(len(values), values.itemsize)
+        plain = _NUMPY_CHARS[dtype.kind][chars].all(axis = 1) & (values != b"")
+        try:
+            wide = values[plain].astype(_NUMPY_TYPES[dtype.kind])
+        except (ValueError, OverflowError):
+            plain[:] = False
+        else:
+            if dtype.kind == 'f':
+                in_range = np.abs(wide) <= np.finfo(dtype).max
+            else:
+                in_range = (wide >= np.iinfo(dtype).min) & (wide <= np.iinfo(dtype).max)
+            index = np.flatnonzero(plain)[in_range]
+            numbers[index] = wide[in_range].astype(dtype)
+            valid[index] = True
+    # the others e.g. hex, bool or invalid values: each distinct value is parsed once
+    others = np.flatnonzero(plain == False)
+    if len(others) > 0:
+        (texts, inverse) = np.unique(values[others], return_inverse = True)
+        text_numbers = np.zeros(len(texts), dtype)
+        text_valid = np.zeros(len(texts), bool)
+        for (i, text) in enumerate(texts):
+            number = parse_value(dtype, text.decode('utf-8', 'replace'))
+            if number != None:
+                text_numbers[i] = number
+                text_valid[i] = True
+        numbers[others] = text_numbers[inverse]
+        valid[others] = text_valid[inverse]
+    return (numbers, valid)
+
+def find_regions(text):
+    # var index => (start, end) of the lines of its last region
+    regions = {}
+    start = 0
+    while True:
+        r_region = _REGION_RE.search(text, start)
+        if r_region == None:
+            return regions
+        var = _VAR_INDEX.get(r_region.group(1))
+        if var == None:
+            # not a config variable, its lines are skipped one by one
+            start = r_region.end()
+            continue
+        end = text.find(b"\\n};", r_region.end())
+        if end < 0:
+            # missing '};': the region and the previous ones of the variable are dropped
+            regions.pop(var, None)
+            return regions
+        regions[var] = (r_region.end(), end)
+        start = end + 1
+
+def read_many(file_names, errors = None):
+    """Read .conf files into an array of CONFIG records, one per file.
+
+    The missing keys and the invalid values are left to their DEFAULTS.
+    If errors is a list, (file name, key, value) of each invalid value is appended.
+    """
+    file_names = list(file_names)
+    configs = np.empty(len(file_names), CONFIG)
+    configs[...] = DEFAULTS
+    # the key = value pairs of all the files
+    pairs = []
+    lines = []
+    for (n, file_name) in enumerate(file_names):
+        with open(file_name, "rb") as file_object:
+            text = file_object.read().translate(None, _SPACES)
+        for (var, (start, end)) in find_regions(text).items():
+            region = _KEY_RE.findall(text, start, end)
+            pairs += region
+            lines.append((n, var, len(region)))
+    if len(pairs) == 0 or len(_KEYS) == 0:
+        return configs
+    pairs = np.array(pairs, np.bytes_)
+    (keys, values) = (pairs[:, 0], pairs[:, 1])
+    lines = np.array(lines, np.int64)
+    files = np.repeat(lines[:, 0], lines[:, 2])
+    variables = np.repeat(lines[:, 1], lines[:, 2])
+
+    index = np.searchsorted(_SORTED_KEYS, keys)
+    index[index == len(_KEYS)] = 0
+    fields = _ORDER[index]
+    # the keys of another variable are ignored
+    rows = np.flatnonzero((_SORTED_KEYS[index] == keys) & (_VARS[fields] == variables))
+    # first value of each key of each file
+    rows = rows[np.unique(files[rows] * len(_KEYS) + fields[rows], return_index = True)[1]]
+
+    # the values are stored by type, as bytes of the records
+    records = configs.view(np.uint8).reshape(len(configs), CONFIG.itemsize)
+    field_types = _FIELD_TYPES[fields[rows]]
+    for (n, dtype) in enumerate(_TYPES):
+        type_rows = rows[field_types == n]
+        if len(type_rows) == 0:
+            continue
+        (numbers, valid) = parse_values(values[type_rows], dtype)
+        if errors != None:
+            for row in type_rows[valid == False]:
+                errors.append((file_names[files[row]], keys[row].decode('utf-8', 'replace'),
+                               values[row].decode('utf-8', 'replace')))
+        type_rows = type_rows[valid]
+        columns = _OFFSETS[fields[type_rows]][:, None] + np.arange(dtype.itemsize)
+        records[files[type_rows][:, None], columns] = (
+            numbers[valid].view(np.uint8).reshape(len(type_rows), dtype.itemsize))
+    return configs
+
+def read(file_name, errors = None):
+    """Read a .conf file into a CONFIG record, see read_many()."""
+    return read_many([file_name], errors)[0]
+
+def format_config(config, sparse = False):
+    """Text of a CONFIG record in the .conf format of the C writer.
+
+    With sparse = True, only the values different from DEFAULTS are written.
+    """
+    record = np.array(config, CONFIG).reshape(1).view(np.uint8)
+    defaults = DEFAULTS.reshape(1).view(np.uint8)
+    texts = np.empty(len(_KEYS), object)
+    changed = np.ones(len(_KEYS), bool)
+    for (n, dtype) in enumerate(_TYPES):
+        fields = np.flatnonzero(_FIELD_TYPES == n)
+        columns = _OFFSETS[fields][:, None] + np.arange(dtype.itemsize)
+        numbers = record[columns].view(dtype).ravel()
+        if sparse:
+            changed[fields] = numbers != defaults[columns].view(dtype).ravel()
+        texts[fields] = np.char.mod(_FORMATS[dtype.kind], numbers)
+    lines = []
+    for (var, name) in enumerate(CONFIG.names):
+        lines.append("CONF_%s = {\\n" %name)
+        for field in range(_VAR_STARTS[var], _VAR_STARTS[var + 1]):
+            if changed[field]:
+                lines.append("\\t%s = %s;\\n" %(_FIELDS[field][1], texts[field]))
+        lines.append("};\\n")
+    return "".join(lines)
+
+def write(file_name, config, sparse = False):
+    """Write a CONFIG record in a .conf file, see format_config().
+
+    As by the C writer, the file is replaced atomically, here by a <file_name>.tmp file.
+    """
+    tmp_name = file_name + ".tmp"
+    with open(tmp_name, "w", encoding = 'utf-8') as file_object:
+        file_object.write(format_config(config, sparse))
+        file_object.flush()
+        os.fsync(file_object.fileno())
+    os.replace(tmp_name, file_name)
+'''
+        outf.write(ptext)
+
 
 def print_usage():
     pname=sys.argv[0][sys.argv[0].rfind('/')+1:]
-    print("%s [options]" % pname)
+    print("%s [options] [.schema files]" % pname)
     print("    -h|--help: this help")
-    print("    -i|--input: input .schema file name")
+    print("    -i|--input: input .schema file name, can be repeated, wildcards are expanded")
+    print("    --manifest: file with a list of input .schema files, one per line")
+    print("    -j|--jobs: number of processes for several input files (default: number of CPUs)")
     print("    -c|--cfile: output .c source file")
     print("    -f|--hfile: output .h header file")
     print("    -g|--conf: output .conf file")
+    print("    -l|--loop: generate loops for the arrays instead of unrolled code")
+    print("    -t|--table: generate field descriptor tables and a generic reader/writer")
+    print("    -m|--mmap: map the config file and parse it in place (zero-copy)")
+    print("    -s|--stream: single pass reader storing each line directly into its field")
+    print("    -b|--bin: also generate the binary snapshot <name>_read_bin()/<name>_write_bin()")
+    print("    -p|--parallel: write the .c, .h, .conf and .py files concurrently")
+    print("    -d|--dynamic: grow the region storage on demand instead of sizing it from the schema")
+    print("    --shm: also generate <name>_publish_shm()/<name>_attach_shm() to share the config in shared memory")
+    print("    --python: also generate a <name>.py NumPy reader/writer of the .conf files")
+    print("    --force: generate the files even if the schema, the options and the tool are unchanged")
+    print("    --watch: regenerate the files on each change of the .schema files, until Ctrl-C")
+    print("    --conf2bin: convert a .conf file to its binary snapshot .bin file, no code generation")
 
 def set_options():
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hi:c:f:g:",
-                                   ["help", "input=", "cfile=", "hfile=", "conf="])
+        opts, args = getopt.gnu_getopt(sys.argv[1:], "hi:c:f:g:ltmsbdpj:",
+                                   ["help", "input=", "cfile=", "hfile=", "conf=", "loop",
+                                    "table", "mmap", "stream", "bin", "dynamic", "parallel",
+                                    "force", "conf2bin=", "manifest=", "jobs=", "watch", "shm",
+                                    "python"])
     except getopt.GetoptError as err:
         # print help information and exit:
         print(str(err))  # will print something like "option -a not recognized"
         print_usage()
         sys.exit(1)
 
-    if len(args) > 0:
-        print("Invalid args:")
-        print(args)
-        print_usage()
-        sys.exit(1)
-
-    res = {'input':'example.schema', 'hfile':None, 'cfile':None, 'conf':None}
+    res = {'inputs':[], 'hfile':None, 'cfile':None, 'conf':None,
+           'loop':False, 'table':False, 'mmap':False, 'stream':False,
+           'bin':False, 'dynamic':False, 'parallel':False, 'force':False,
+           'conf2bin':None, 'jobs':None, 'watch':False, 'shm':False, 'python':False}
+    inputs = list(args)
 
     for o, a in opts:
         if o in ("-h", "--help"):
             print_usage()
             sys.exit(0)
         elif o in ("-i", "--input"):
-            res['input'] = a
+            inputs.append(a)
+        elif o == "--manifest":
+            try:
+                with open(a, encoding = 'utf-8') as manifest_object:
+                    for line in manifest_object:
+                        if line.strip() != "" and not line.strip().startswith("#"):
+                            inputs.append(line.strip())
+            except OSError as err:
+                print("Unable to read the manifest: %s" %err)
+                sys.exit(1)
+        elif o in ("-j", "--jobs"):
+            if not a.isnumeric() or int(a) == 0:
+                print("The jobs option should be a positive number")
+                sys.exit(1)
+            res['jobs'] = int(a)
         elif o in ("-f", "--hfile"):
             res['hfile'] = a
         elif o in ("-c", "--cfile"):
             res['cfile'] = a
         elif o in ("-g", "--conf"):
             res['conf'] = a
+        elif o in ("-l", "--loop"):
+            res['loop'] = True
+        elif o in ("-t", "--table"):
+            res['table'] = True
+        elif o in ("-m", "--mmap"):
+            res['mmap'] = True
+        elif o in ("-s", "--stream"):
+            res['stream'] = True
+        elif o in ("-b", "--bin"):
+            res['bin'] = True
+        elif o in ("-d", "--dynamic"):
+            res['dynamic'] = True
+        elif o in ("-p", "--parallel"):
+            res['parallel'] = True
+        elif o == "--force":
+            res['force'] = True
+        elif o == "--watch":
+            res['watch'] = True
+        elif o == "--shm":
+            res['shm'] = True
+        elif o == "--python":
+            res['python'] = True
+        elif o == "--conf2bin":
+            res['conf2bin'] = a
         else:
             assert False, "unhandled option"
 
-    input_recomp = re.compile(r"(\S+).schema")
-    r_input = input_recomp.match(res['input'])
-    if r_input == None:
-        print("Input should be a .schema file")
+    if res['loop'] and res['table']:
+        print("The loop and table options can not be used together")
+        sys.exit(1)
+
+    if res['mmap'] and res['stream']:
+        print("The mmap and stream options can not be used together")
+        sys.exit(1)
+
+    if res['watch'] and res['conf2bin'] != None:
+        print("The watch and conf2bin options can not be used together")
+        sys.exit(1)
+
+    for input_name in inputs:
+        if glob.escape(input_name) != input_name:
+            res['inputs'] += sorted(glob.glob(input_name))
+        else:
+            res['inputs'].append(input_name)
+    if len(inputs) == 0:
+        res['inputs'].append('example.schema')
+    if len(res['inputs']) == 0:
+        print("No input .schema file")
         sys.exit(1)
 
+    if len(res['inputs']) > 1 and (res['hfile'] != None or res['cfile'] != None or
+                                   res['conf'] != None or res['conf2bin'] != None):
+        print("The hfile, cfile, conf and conf2bin options need a single input")
+        sys.exit(1)
+
+    return res
+
+def get_schema_options(options, input_name):
+    # options of a single .schema file, the output files are named after it by default
+    input_recomp = re.compile(r"(\S+)\.schema$")
+    r_input = input_recomp.match(input_name)
+    if r_input == None:
+        return None
+    res = dict(options)
+    del res['inputs']
+    res['input'] = input_name
     if res['hfile'] == None:
         res['hfile'] = r_input.group(1) + ".h"
     if res['cfile'] == None:
         res['cfile'] = r_input.group(1) + ".c"
     if res['conf'] == None:
         res['conf'] = r_input.group(1) + ".conf"
-
+    res['pyfile'] = r_input.group(1) + ".py"
+    res['stamp'] = r_input.group(1) + ".stamp"
     return res
 
 copyright = """
@@ -804,33 +5154,249 @@ copyright = """
 */
 """
 
-if __name__ == "__main__":
+# the generators write many small strings, they are batched in a big buffer
+OUTPUT_BUFFER_SIZE = 1 << 20
 
-    options = set_options()
+def generate_header(parser, guard, outf):
+    outf.write("%s\n" %copyright)
+    outf.write("#ifndef %s_H\n" %guard)
+    outf.write("#define %s_H\n\n" %guard)
+    parser.generate_header_file(outf)
+    outf.write("#endif //%s_H\n" %guard)
+
+def generate_source(parser, outf):
+    outf.write("%s\n" %copyright)
+    parser.generate_source_file(outf)
+
+def write_header_file(parser, file_name, guard):
+    hfile_out = open(file_name, "w", buffering = OUTPUT_BUFFER_SIZE)
+    generate_header(parser, guard, hfile_out)
+    hfile_out.close()
+
+def write_source_file(parser, file_name):
+    cfile_out = open(file_name, "w", buffering = OUTPUT_BUFFER_SIZE)
+    generate_source(parser, cfile_out)
+    cfile_out.close()
+
+def write_config_file(parser, file_name):
+    conf_out = open(file_name, "w", buffering = OUTPUT_BUFFER_SIZE)
+    parser.generate_config_file(conf_out)
+    conf_out.close()
+
+def write_python_file(parser, file_name):
+    py_out = open(file_name, "w", buffering = OUTPUT_BUFFER_SIZE)
+    parser.generate_python_file(py_out)
+    py_out.close()
+
+def write_stamp_file(file_name, stamp):
+    stamp_out = open(file_name, "w")
+    stamp_out.write("%s\n" %stamp)
+    stamp_out.close()
+
+def get_generation_stamp(options):
+    # hash of the tool, the schema and the options changing the generated files
+    digest = hashlib.sha256()
+    for file_name in (os.path.abspath(__file__), options['input']):
+        with open(file_name, "rb") as file_object:
+            digest.update(file_object.read())
+    for key in sorted(options):
+        if key not in ('parallel', 'force', 'stamp', 'jobs', 'watch'):
+            digest.update(("%s=%s\n" %(key, options[key])).encode())
+    return digest.hexdigest()
+
+def is_up_to_date(options, stamp):
+    # the generated files are kept untouched, with their mtime,
+    # if they exist and were generated with the same stamp
+    file_names = [options['hfile'], options['cfile'], options['conf']]
+    if options['python'] == True:
+        file_names.append(options['pyfile'])
+    for file_name in file_names:
+        if not os.path.exists(file_name):
+            return False
+    try:
+        with open(options['stamp']) as stamp_object:
+            return stamp_object.read().strip() == stamp
+    except OSError:
+        return False
+
+def generate_schema(options):
+    # generate the files of a single .schema file, return the exit code
+    if options['conf2bin'] == None:
+        stamp = get_generation_stamp(options)
+        if options['force'] == False and is_up_to_date(options, stamp):
+            print("%s: up to date" %options['input'])
+            return 0
 
     hfile_basename = os.path.basename(options['hfile'])
-    parser = ConfigParser(options['input'], hfile_basename)
+    try:
+        parser = ConfigParser(options['input'], hfile_basename, options['loop'],
+                              options['table'], options['mmap'], options['stream'],
+                              options['bin'], options['dynamic'], options['shm'])
+    except SchemaError as err:
+        print(err)
+        return 1
+
+    if options['conf2bin'] != None:
+        conf_recomp = re.compile(r"(\S+).conf")
+        r_conf = conf_recomp.match(options['conf2bin'])
+        if r_conf == None:
+            print("Input should be a .conf file")
+            return 1
+        parser.convert_conf_to_bin(options['conf2bin'], r_conf.group(1) + ".bin")
+        return 0
 
     hfile_recomp = re.compile(r"(\S+).h")
     r_hfile = hfile_recomp.match(hfile_basename)
     if r_hfile == None:
         print("Header file should be a .h file")
-        sys.exit(1)
-    hfile_out = open(options['hfile'], "w")
-    hfile_out.write("%s\n" %copyright)
-    hfile_out.write("#ifndef %s_H\n" %r_hfile.group(1).upper())
-    hfile_out.write("#define %s_H\n\n" %r_hfile.group(1).upper())
-    parser.generate_header_file(hfile_out)
-    hfile_out.write("#endif //%s_H\n" %r_hfile.group(1).upper())
-    hfile_out.close()
+        return 1
 
-    cfile_out = open(options['cfile'], "w")
-    cfile_out.write("%s\n" %copyright)
-    parser.generate_source_file(cfile_out)
-    cfile_out.close()
+    if options['parallel'] == True:
+        # the parser is copied to one process per output file
+        with concurrent.futures.ProcessPoolExecutor(max_workers = 4) as executor:
+            jobs = [executor.submit(write_header_file, parser, options['hfile'],
+                                    r_hfile.group(1).upper()),
+                    executor.submit(write_source_file, parser, options['cfile']),
+                    executor.submit(write_config_file, parser, options['conf'])]
+            if options['python'] == True:
+                jobs.append(executor.submit(write_python_file, parser, options['pyfile']))
+            for job in jobs:
+                job.result()
+    else:
+        write_header_file(parser, options['hfile'], r_hfile.group(1).upper())
+        write_source_file(parser, options['cfile'])
+        write_config_file(parser, options['conf'])
+        if options['python'] == True:
+            write_python_file(parser, options['pyfile'])
 
-    conf_out = open(options['conf'], "w")
-    parser.generate_config_file(conf_out)
-    conf_out.close()
+    write_stamp_file(options['stamp'], stamp)
+
+    return 0
+
+def generate_batch_schema(options, input_name):
+    # process pool job: the errors are reported with the file name
+    schema_options = get_schema_options(options, input_name)
+    if schema_options == None:
+        print("%s: input should be a .schema file" %input_name)
+        return 1
+    # the schema files are already generated in parallel
+    schema_options['parallel'] = False
+    try:
+        return generate_schema(schema_options)
+    except Exception as err:
+        print("%s: %s" %(input_name, err))
+        return 1
+
+# polling period of the watch mode, in seconds
+WATCH_INTERVAL = 0.2
+
+def write_if_changed(file_name, text):
+    # the file and its mtime are kept if the content is the same
+    try:
+        with open(file_name, encoding = 'utf-8') as file_object:
+            if file_object.read() == text:
+                return False
+    except OSError:
+        pass
+    with open(file_name, "w", encoding = 'utf-8') as file_object:
+        file_object.write(text)
+    return True
+
+def regenerate_schema(parser, options, guard):
+    # generate the files in memory, write only the changed ones
+    changed = []
+    outputs = [(options['hfile'], lambda outf: generate_header(parser, guard, outf)),
+               (options['cfile'], lambda outf: generate_source(parser, outf)),
+               (options['conf'], parser.generate_config_file)]
+    if options['python'] == True:
+        outputs.append((options['pyfile'], parser.generate_python_file))
+    for file_name, generate in outputs:
+        text = io.StringIO()
+        generate(text)
+        if write_if_changed(file_name, text.getvalue()):
+            changed.append(file_name)
+    write_stamp_file(options['stamp'], get_generation_stamp(options))
+    return changed
 
-    sys.exit(0)
+def watch_schemas(options):
+    # keep the parsers in memory and regenerate on each change of a schema
+    schemas = []
+    for input_name in options['inputs']:
+        schema_options = get_schema_options(options, input_name)
+        if schema_options == None:
+            print("%s: input should be a .schema file" %input_name)
+            return 1
+        r_hfile = re.match(r"(\S+).h", os.path.basename(schema_options['hfile']))
+        if r_hfile == None:
+            print("Header file should be a .h file")
+            return 1
+        schemas.append([schema_options, r_hfile.group(1).upper(), None, None])
+
+    print("Watching %d .schema files, Ctrl-C to stop" %len(schemas))
+    try:
+        while True:
+            for schema in schemas:
+                (schema_options, guard, parser, mtime) = schema
+                try:
+                    new_mtime = os.stat(schema_options['input']).st_mtime_ns
+                except OSError:
+                    continue
+                if new_mtime == mtime:
+                    continue
+                schema[3] = new_mtime
+                start = time.time()
+                try:
+                    if parser == None:
+                        parser = ConfigParser(schema_options['input'],
+                                              os.path.basename(schema_options['hfile']),
+                                              schema_options['loop'], schema_options['table'],
+                                              schema_options['mmap'], schema_options['stream'],
+                                              schema_options['bin'], schema_options['dynamic'],
+                                              schema_options['shm'])
+                        schema[2] = parser
+                    else:
+                        parser.load_schema(schema_options['input'])
+                    changed = regenerate_schema(parser, schema_options, guard)
+                except SchemaError as err:
+                    print(err)
+                    continue
+                except Exception as err:
+                    print("%s: %s" %(schema_options['input'], err))
+                    continue
+                print("%s: %s (%.0f ms)" %(schema_options['input'],
+                      " ".join(changed) if len(changed) > 0 else "no change",
+                      (time.time() - start) * 1000))
+            time.sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        return 0
+
+def main():
+    options = set_options()
+
+    if options['watch'] == True:
+        return watch_schemas(options)
+
+    if len(options['inputs']) == 1:
+        schema_options = get_schema_options(options, options['inputs'][0])
+        if schema_options == None:
+            print("Input should be a .schema file")
+            return 1
+        return generate_schema(schema_options)
+
+    # batch mode: one job per .schema file, the exit code is 1 if any failed
+    failed = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers = options['jobs']) as executor:
+        jobs = [executor.submit(generate_batch_schema, options, input_name)
+                for input_name in options['inputs']]
+        for input_name, job in zip(options['inputs'], jobs):
+            if job.result() != 0:
+                failed.append(input_name)
+    if len(failed) > 0:
+        print("%d of %d .schema files failed: %s"
+              %(len(failed), len(options['inputs']), " ".join(failed)))
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())